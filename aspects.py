@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Поиск аспектов между двумя наборами точек без обращения к Planet на каждую пару:
+долготы и табличные орбисы всех пар берутся один раз (плоский массив), дальше один проход по парам, где
+кандидаты-аспекты пары ищутся бинарным поиском по углам аспектов в полосе орбиса.
+Результат - те же кортежи (p1, p2, aspect, arc, actual_orbis, orbis) и в том же порядке, что и у попарного цикла.
+
+Для больших наборов точек (астероиды, средние точки, много дат транзитов) - sweepAspects: вместо всех пар
+только кандидаты из окна долгот вокруг каждого аспекта, O(n log n + число кандидатов).
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+
+from const import *
+import dense
+
+# аспекты в порядке ASPECT_VALUES, для минорных орбис ограничен MINOR_ASPECT_ORBIS
+_ASPECT_MINOR = tuple((aspect, aspect in ASPECT._MINORS) for aspect in ASPECT_VALUES)
+
+
+def longitudes(planets):
+    return array('d', [absGradus(p.znak, p.gradus) for p in planets])
+
+
+def pairOrbis(rules, p1, p2, orbis_override=None):
+    """Табличный орбис пары (dense.NO_ORBIS, если для пары аспекты не ищем)."""
+    if orbis_override:
+        return orbis_override
+    i, j = dense.planetIndex(p1.planet), dense.planetIndex(p2.planet)
+    if i >= 0 and j >= 0:
+        return rules.ORBIS_MATRIX[i * dense.PLANET_COUNT + j]
+    table_orbis = dense.tableOrbis(rules.MAJOR_ORBS, p1.get_non_retro(), p2.get_non_retro())
+    return dense.NO_ORBIS if table_orbis is None else table_orbis
+
+
+def pairOrbisMatrix(rules, planets1, planets2, orbis_override=None):
+    """Табличные орбисы всех пар (как в findAspects), dense.NO_ORBIS - для пары аспекты не ищем."""
+    n2 = len(planets2)
+    if orbis_override:
+        return array('d', [orbis_override]) * (len(planets1) * n2)
+    idx2 = [dense.planetIndex(p.planet) for p in planets2]
+    orbises = array('d')
+    for p1 in planets1:
+        i = dense.planetIndex(p1.planet)
+        row = [rules.ORBIS_MATRIX[i * dense.PLANET_COUNT + j] if (i >= 0 and j >= 0) else None for j in idx2]
+        for k, table_orbis in enumerate(row):
+            if table_orbis is None:  # точки нет в плотных таблицах - считаем по MAJOR_ORBS
+                table_orbis = dense.tableOrbis(rules.MAJOR_ORBS, p1.get_non_retro(), planets2[k].get_non_retro())
+                row[k] = dense.NO_ORBIS if table_orbis is None else table_orbis
+        orbises.extend(row)
+    return orbises
+
+
+# аспекты по возрастанию угла: (угол, номер в _ASPECT_MINOR) - поиск кандидатов пары бинарным поиском
+_ASPECT_SORTED = sorted((aspect, a) for a, (aspect, is_minor) in enumerate(_ASPECT_MINOR))
+_ASPECT_ANGLES = [aspect for aspect, a in _ASPECT_SORTED]
+
+
+def matrixAspects(rules, planets1, planets2, orbis_override=None):
+    """Все аспекты planets1 x planets2 (ASPECT_METHOD.MATRIX)."""
+    planets1, planets2 = list(planets1), list(planets2)
+    n2 = len(planets2)
+    if not planets1 or not n2:
+        return []
+    lons2 = longitudes(planets2)
+    orbises = pairOrbisMatrix(rules, planets1, planets2, orbis_override)
+    angles, by_angle, minors = _ASPECT_ANGLES, _ASPECT_SORTED, _ASPECT_MINOR
+
+    # один проход по парам: аспект возможен только с углом в полосе (arc - orbis, arc + orbis), орбис минорных
+    # аспектов не больше табличного; пары без орбиса (NO_ORBIS < 0) и пары вне всех полос пропускаются сразу
+    aspects = []
+    k = 0
+    for p1 in planets1:
+        l1 = absGradus(p1.znak, p1.gradus)
+        for j in range(n2):
+            orbis = orbises[k]
+            k += 1
+            if orbis <= 0:
+                continue
+            arc = abs(l1 - lons2[j])
+            if arc > HALF_ARC:
+                arc = FULL_ARC - arc
+            lo = bisect_right(angles, arc - orbis)
+            hi = bisect_left(angles, arc + orbis, lo)
+            if lo >= hi:
+                continue
+            found = []
+            for aspect, a in by_angle[lo:hi]:
+                limit = min(orbis, MINOR_ASPECT_ORBIS) if minors[a][1] else orbis
+                if abs(arc - aspect) < limit:
+                    found.append((a, aspect, limit))
+            if len(found) > 1:
+                found.sort()  # порядок попарного цикла: аспект по ASPECT_VALUES
+            for a, aspect, limit in found:
+                aspects.append((p1, planets2[j], aspect, arc, abs(arc - aspect), limit))
+    return aspects
+
+
+_SWEEP_EPSILON = 1e-9  # окно поиска чуть шире орбиса, точная проверка - как в попарном цикле
+
+
+def _window(sorted_lons, lo, hi):
+    """Индексы в sorted_lons для дуги [lo, hi] с переходом через 0° (lo > hi)."""
+    if lo <= hi:
+        return range(bisect_left(sorted_lons, lo), bisect_right(sorted_lons, hi))
+    return list(range(bisect_left(sorted_lons, lo), len(sorted_lons))) + list(range(0, bisect_right(sorted_lons, hi)))
+
+
+def sweepAspects(rules, planets1, planets2, orbis_override=None):
+    """Все аспекты planets1 x planets2 (ASPECT_METHOD.SWEEP), результат тот же, что у matrixAspects."""
+    planets1, planets2 = list(planets1), list(planets2)
+    n2 = len(planets2)
+    if not planets1 or not n2:
+        return []
+    lons1, lons2 = longitudes(planets1), longitudes(planets2)
+    order = sorted(range(n2), key=lons2.__getitem__)
+    sorted_lons = [lons2[j] for j in order]
+
+    if orbis_override:
+        max_orbis = orbis_override
+    else:
+        max_orbis = max(max(rules.ORBIS_MATRIX), LESSER_KUSPID_ORBIS)
+        if any(dense.planetIndex(p.planet) < 0 for p in planets1 + planets2):
+            max_orbis = max(max_orbis, max(o for orbs in rules.MAJOR_ORBS.values() for o in orbs.values()))
+    width = max_orbis + _SWEEP_EPSILON
+
+    hits = []
+    for i, l1 in enumerate(lons1):
+        p1 = planets1[i]
+        for a, (aspect, is_minor) in enumerate(_ASPECT_MINOR):
+            candidates = set()
+            if width >= HALF_ARC:
+                candidates.update(range(n2))
+            else:
+                for center in {(l1 + aspect) % FULL_ARC, (l1 - aspect) % FULL_ARC}:
+                    lo, hi = (center - width) % FULL_ARC, (center + width) % FULL_ARC
+                    candidates.update(order[k] for k in _window(sorted_lons, lo, hi))
+            for j in candidates:
+                d = abs(l1 - lons2[j])
+                arc = FULL_ARC - d if d > HALF_ARC else d
+                orbis = pairOrbis(rules, p1, planets2[j], orbis_override)
+                if is_minor:
+                    orbis = min(orbis, MINOR_ASPECT_ORBIS)
+                if abs(arc - aspect) < orbis:
+                    hits.append((i * n2 + j, a, arc, orbis))
+    hits.sort()  # порядок попарного цикла: p1, p2, аспект по ASPECT_VALUES
+
+    aspects = []
+    for k, a, arc, orbis in hits:
+        aspect = _ASPECT_MINOR[a][0]
+        aspects.append((planets1[k // n2], planets2[k % n2], aspect, arc, abs(arc - aspect), orbis))
+    return aspects
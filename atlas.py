@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Атлас позиционных бонусов: для каждой планеты и каждой угловой минуты эклиптики - готовый набор бонусов,
+которые зависят только от id планеты и ее долготы (не от ASC/домов): градусы, термы, свой градус, ретро,
+дуги кардинальных/фиксированных/мутабельных знаков, BONUS_GRADUS, стихия/пол, градус экзальтации, роли в знаке.
+
+Строится один раз на RuleSet (RuleSet.ATLAS, RuleSet.ATLAS_VECTORS), дальше бонусы планеты = одно чтение по индексу.
+Минуты, внутри которых проходит граница какого-либо диапазона, помечены SLOW и считаются напрямую
+(positionBonuses), так что результат совпадает с прямым расчетом при любой точности долготы.
+"""
+from array import array
+
+from const import *
+import dense
+from planet import Planet
+
+MINUTES = 60  # ячеек атласа на градус
+ATLAS_SIZE = int(FULL_ARC) * MINUTES  # 21600 ячеек на круг
+SLOW = -1  # ячейка содержит границу диапазона (или планеты нет в атласе) - считаем напрямую
+
+
+def positionBonuses(rules, planet):
+    """
+    Прямой расчет ASC-независимых бонусов планеты (как в Horoscope.calcHouses).
+    Возвращает (pre, post): кортежи (BONUS.*, баллы) в порядке начисления - pre до OWN_HOUSE, post после него.
+    """
+    pre, post = [], []
+
+    # баллы за знак/градус
+    planet_gradus_points = rules.PLANET_GRADUS_BONUSES.get(planet.planet, {}).get(planet.znak)
+    if planet_gradus_points is not None:
+        pre.append((BONUS.PLANET_GRADUS, planet_gradus_points[int(planet.gradus)]))
+
+    # доп.баллы за термы
+    pnr = planet.get_non_retro()
+    planet_termy_points = rules.BONUS_TERMY.get(pnr)
+    if planet_termy_points is not None:
+        gradus1, gradus2, bonus_points = planet_termy_points[planet.znak]
+        if gradus1 <= planet.abs_gradus < gradus2:
+            pre.append((BONUS.TERMY, bonus_points))
+
+    # в своем градусе (из таблицы управителей градусов по Вронскому)
+    if planet.is_own_gradus_dominant(rules):
+        post.append((BONUS.OWN_GRADUS, rules.BONUS_POINTS['OWN_GRADUS']))
+
+    # в ретрограде
+    if planet.planet & PLANET._RETRO:
+        post.append((BONUS.RETRO, rules.BONUS_POINTS['RETRO']))
+
+    # в каком типе знака (кардинальный, фиксированный, мутабельный) - там свои бонусы по отдельным дугам
+    if planet.has_znak_bonus(rules):
+        post.append((Planet.get_znak_bonus_type(planet.znak), rules.BONUS_POINTS['CARD_ZNAK_BONUS']))
+
+    # особые диапазоны градусов (в Тельце, Льве, Деве, комбуста..)
+    for bonus_key, (gradus1, gradus2) in rules.BONUS_GRADUS.items():
+        if gradus1 <= planet.abs_gradus <= gradus2:
+            post.append((getattr(BONUS, bonus_key), rules.BONUS_POINTS[bonus_key]))
+
+    planet_attrs = rules.PLANET_ATTRS.get(pnr)
+    if planet_attrs:
+        if (planet_attrs.stihia >= 0) and (planet_attrs.stihia == ZNAK._stihia(planet.znak)):
+            # в знаке своей стихии (огонь, вода и т.п.)
+            post.append((BONUS.STIHIA, rules.BONUS_POINTS['OWN_STIHIA']))
+
+        if (planet_attrs.gender >= 0):
+            if (planet_attrs.gender == ZNAK._gender(planet.znak)):
+                # в знаке своего пола
+                post.append((BONUS.GENDER, rules.BONUS_POINTS['OWN_GENDER']))
+            else:
+                # в знаке противоположного пола
+                post.append((BONUS.GENDER, rules.BONUS_POINTS['WRONG_GENDER']))
+
+        # в своем градусе экзальтации ("королевском градусе")
+        if planet_attrs.exalt_gradus != BAD_GRADUS:
+            eg = planet_attrs.exalt_gradus
+            if eg <= planet.abs_gradus < eg+1:
+                post.append((BONUS.EXALT_GRADUS, rules.BONUS_POINTS['EXALT_GRADUS']))
+
+    # в своем домициле/экзальте/эксиле/фалле
+    role = rules.ZNAK_ROLES[planet.znak].get(planet.planet)
+    if role is not None:
+        role_key = ROLE_KEYS[role]  # 'DOMICILE'
+        bonus_points = rules.BONUS_POINTS.get(role_key)
+        if bonus_points:
+            post.append((getattr(BONUS, role_key), bonus_points))
+
+    return tuple(pre), tuple(post)
+
+
+def breakpoints(rules, pid):
+    """Абсолютные градусы, на которых у планеты может поменяться набор позиционных бонусов."""
+    points = set(range(int(FULL_ARC) + 1))  # знаки, int(gradus) для PLANET_GRADUS_BONUSES и OWN_GRADUS
+    pnr = dense.nonRetro(pid)
+    for gradus1, gradus2, bonus_points in rules.BONUS_TERMY.get(pnr, {}).values():
+        points.update((gradus1, gradus2))
+    for ranges in rules.ZNAK_BONUS_RANGES.values():
+        for start, end in ranges:
+            points.update((start, end))
+    for gradus1, gradus2 in rules.BONUS_GRADUS.values():
+        points.update((gradus1, gradus2))
+    planet_attrs = rules.PLANET_ATTRS.get(pnr)
+    if planet_attrs and planet_attrs.exalt_gradus != BAD_GRADUS:
+        points.update((planet_attrs.exalt_gradus, planet_attrs.exalt_gradus + 1))
+    return points
+
+
+def buildAtlas(rules):
+    """
+    (ATLAS, ATLAS_VECTORS): ATLAS[i * ATLAS_SIZE + minute] - номер набора бонусов в ATLAS_VECTORS
+    (или SLOW), i = dense.PLANET_INDEX[pid], minute = int(abs_gradus * MINUTES).
+    """
+    atlas = array('i', [SLOW]) * (dense.PLANET_COUNT * ATLAS_SIZE)
+    vectors = []
+    vector_ids = {}
+    for i, pid in enumerate(dense.PLANET_IDS):
+        if pid in PLANET._KUSPIDS:
+            continue  # куспиды в calcHouses не считаются
+        slow = bytearray(ATLAS_SIZE)
+        for point in breakpoints(rules, pid):
+            cell = int(point * MINUTES)
+            for c in (cell - 1, cell, cell + 1):  # с запасом на погрешность float у границы
+                slow[c % ATLAS_SIZE] = 1
+
+        base = i * ATLAS_SIZE
+        cell = 0
+        while cell < ATLAS_SIZE:
+            if slow[cell]:
+                cell += 1
+                continue
+            end = cell
+            while end < ATLAS_SIZE and not slow[end]:
+                end += 1
+            # внутри [cell, end) границ нет - набор бонусов один, считаем его в середине отрезка
+            abs_gradus = (cell + end) / 2.0 / MINUTES
+            znak = int(abs_gradus // ZNAK_ARC)
+            vector = positionBonuses(rules, Planet(pid, znak, abs_gradus - znak * ZNAK_ARC))
+            vid = vector_ids.get(vector)
+            if vid is None:
+                vid = vector_ids[vector] = len(vectors)
+                vectors.append(vector)
+            atlas[base + cell:base + end] = array('i', [vid]) * (end - cell)
+            cell = end
+    return atlas, vectors
+
+
+def atlasBonuses(rules, planet):
+    """То же, что positionBonuses(rules, planet), но чтением из атласа (прямой расчет только у границ)."""
+    i = dense.planetIndex(planet.planet)
+    if i >= 0 and 0 <= planet.gradus < ZNAK_ARC and rules.ATLAS is not None:
+        vid = rules.ATLAS[i * ATLAS_SIZE + int(planet.abs_gradus * MINUTES) % ATLAS_SIZE]
+        if vid != SLOW:
+            return rules.ATLAS_VECTORS[vid]
+    return positionBonuses(rules, planet)
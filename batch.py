@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Пакетный расчет карт (по одной JSON-строке на карту):
+
+    python batch.py data/ "charts/**/*.txt" -j 8 -o results.jsonl
+    python batch.py --raw "import/*.txt" -o -
+    python batch.py data/ --cache vronsky_cache.sqlite   # неизмененные карты берутся из кэша (см. cache.py)
+    python batch.py data/ --columns results/   # + таблицы points/aspects.tsv (см. export.py)
+
+Конфиг (aliases.yaml + vronsky_tables.yaml) грузится один раз на рабочий процесс,
+порядок результатов совпадает с отсортированным списком входных файлов.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from multiprocessing import Pool, util
+
+import config
+from config import Config
+import vronsky
+import export as columnar
+from cache import ChartCache
+
+CHART_EXT = '.txt'
+EXPORT_EXT = '.EXP.txt'
+
+DEFAULT_TOP_COUNT = 30
+DEFAULT_CHUNKSIZE = 4
+ROWS_KEY = '_rows'  # строки таблиц export.py, в JSON не попадают
+
+
+def collectCharts(paths):
+    """Разворачивает каталоги (без вложенных) и glob-маски в отсортированный список файлов карт."""
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            files.update(os.path.join(path, name) for name in os.listdir(path) if name.endswith(CHART_EXT))
+        else:
+            files.update(glob.glob(path, recursive=True))
+    # *.EXP.txt - результат --export прошлого запуска, не карта
+    return sorted(f for f in files if not f.endswith(EXPORT_EXT) and os.path.isfile(f))
+
+
+_CHART_CACHE = None  # cache.ChartCache рабочего процесса (свое соединение SQLite на процесс)
+
+
+def initWorker(tables_filename=config.TABLES_FILENAME, cache_filename=None):
+    global _CHART_CACHE
+    config.load(tables_filename=tables_filename)
+    if cache_filename and _CHART_CACHE is None:
+        _CHART_CACHE = ChartCache(cache_filename)
+        # close() дописывает отложенные отметки used при нормальном завершении процесса пула
+        util.Finalize(_CHART_CACHE, _CHART_CACHE.close, exitpriority=10)
+
+
+def chartRecord(filename, hor, top_count=DEFAULT_TOP_COUNT):
+    planets = []
+    for pid, p in hor.planets.items():
+        planets.append({
+            'planet': p.name(hor.rules),
+            'znak': hor.rules.ZNAK_2_NAME.get(p.znak),
+            'gradus': round(p.gradus, 4),
+            'house': p.house,
+            'third': p.third,
+            'bonus': p.sum_bonuses(),
+            'bonuses': dict(p.bonuses),
+        })
+
+    return {
+        'file': filename,
+        'name': hor.natName,
+        'date': hor.natDate,
+        'time': hor.natHour,
+        'planets': planets,
+        'aspects': aspectRecords(hor.aspectRating, hor.maxAspectRating, top_count, hor.rules),
+    }
+
+
+def aspectRecords(aspectRating, scale, top_count=DEFAULT_TOP_COUNT, rules=Config):
+    """Строки рейтинга (rateAspects) -> JSON, rating - в баллах [0..10] относительно scale."""
+    aspects = []
+    scale = scale or 1.0
+    for rating, p1name, p2name, (p1b, p2b), cw, aspect, (orbis, max_orbis) in aspectRating[:top_count]:
+        aspects.append({
+            'rating': round(rating / scale * 10, 3),
+            'p1': p1name,
+            'aspect': rules.ASPECT_2_NAME[aspect],
+            'p2': p2name,
+            'orbis': round(orbis, 4),
+            'max_orbis': max_orbis,
+        })
+    return aspects
+
+
+def scoreChart(job):
+    filename, import_raw, export, top_count, bonus_columns = job
+    try:
+        # консольный отчет в пакетном режиме не нужен; все строки рейтинга - только для таблиц export.py
+        hor = vronsky.runHoroscope(filename, import_raw=import_raw, export=export, sink=None, cache=_CHART_CACHE,
+                                   topCount=top_count, keepAll=bonus_columns is not None)
+        record = chartRecord(filename, hor, top_count)
+        if bonus_columns is not None:
+            record[ROWS_KEY] = columnar.chartRows(hor, filename, bonus_columns)
+        return record
+    except Exception as e:
+        return {'file': filename, 'error': '%s: %s' % (type(e).__name__, e)}
+
+
+def scoreCharts(files, jobs=None, import_raw=False, export=False, top_count=DEFAULT_TOP_COUNT,
+                chunksize=DEFAULT_CHUNKSIZE, tables_filename=config.TABLES_FILENAME, bonus_columns=None,
+                cache_filename=None):
+    """Генератор результатов (в порядке files), считает в jobs процессах; bonus_columns - строки для export.py."""
+    tasks = [(filename, import_raw, export, top_count, bonus_columns) for filename in files]
+    jobs = jobs or os.cpu_count() or 1
+    if jobs <= 1 or len(tasks) <= 1:
+        initWorker(tables_filename, cache_filename)
+        yield from map(scoreChart, tasks)
+        if _CHART_CACHE is not None:
+            _CHART_CACHE.flushTouched()
+        return
+    with Pool(processes=min(jobs, len(tasks)), initializer=initWorker,
+              initargs=(tables_filename, cache_filename)) as pool:
+        yield from pool.imap(scoreChart, tasks, chunksize=chunksize)
+        pool.close()
+        pool.join()  # рабочие процессы завершаются сами (с финализаторами), а не terminate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный расчет силы планет по Вронскому")
+    parser.add_argument('paths', nargs='+', help="файлы карт, каталоги или glob-маски")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="число рабочих процессов")
+    parser.add_argument('-o', '--output', default='-', help="файл результатов (JSON lines), '-' = stdout")
+    parser.add_argument('--raw', action='store_true', help="карты в сыром формате импорта (import_raw)")
+    parser.add_argument('--export', action='store_true', help="для --raw: писать *%s рядом с картой" % EXPORT_EXT)
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP_COUNT, help="сколько аспектов рейтинга сохранять")
+    parser.add_argument('--tables', default=config.TABLES_FILENAME, help="вариант правил (vronsky_tables.yaml)")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help="карт на одну задачу пула")
+    parser.add_argument('--cache', help="файл кэша посчитанных карт (SQLite), ключ - содержимое карты + таблицы")
+    parser.add_argument('--purge-cache', action='store_true',
+                        help="удалить из --cache записи, посчитанные с другими таблицами (--tables)")
+    parser.add_argument('--columns', help="каталог для таблиц TSV (точки с бонусами, аспекты), дописываются")
+    args = parser.parse_args(argv)
+
+    files = collectCharts(args.paths)
+    if not files:
+        print("no chart files found: %s" % ' '.join(args.paths), file=sys.stderr)
+        return 1
+
+    if args.cache and args.purge_cache:
+        # только по запросу: при A/B-прогонах с разными --tables записи обоих вариантов нужны
+        with ChartCache(args.cache) as chart_cache:
+            chart_cache.purgeStale(config.loadRules(tables_filename=args.tables))
+
+    exporter = None
+    if args.columns:
+        initWorker(args.tables)  # колонки бонусов зависят от таблиц
+        exporter = columnar.ColumnarExporter(args.columns)
+
+    errors = 0
+    output_file = sys.stdout if args.output == '-' else open(args.output, 'wt', encoding='utf8')
+    try:
+        for record in scoreCharts(files, args.jobs, args.raw, args.export, args.top, args.chunksize,
+                                  args.tables, exporter.bonus_columns if exporter else None, args.cache):
+            if 'error' in record:
+                errors += 1
+                print("ERROR %s: %s" % (record['file'], record['error']), file=sys.stderr)
+            rows = record.pop(ROWS_KEY, None)
+            if rows is not None:
+                exporter.addRows(rows)
+            output_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+        if exporter is not None:
+            exporter.close()
+
+    print("charts: %d, errors: %d" % (len(files), errors), file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
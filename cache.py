@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэш посчитанных карт на диске (SQLite): ключ - хэш содержимого файла карты + хэш таблиц правил (RuleSet.digest),
+значение - Horoscope после всех этапов (разбор, calcHouses, findAspects, calcNatals, rateAspects) без rules и sink.
+Размер ограничен max_bytes, при переполнении выбрасываются давно не использованные записи.
+Поменялись vronsky_tables.yaml/aliases.yaml - меняется digest, старые записи просто не находятся
+и со временем вытесняются (purgeStale() удаляет их сразу; записи разных вариантов таблиц живут рядом).
+Попадания отмечаются в used пачками по TOUCH_BATCH (без записи на каждое чтение из всех рабочих процессов).
+MemoryCache - то же состояние в памяти процесса (LRU с ограничением размера и времени жизни), для сервиса (main.py).
+
+    chart_cache = ChartCache("vronsky_cache.sqlite")
+    hor = vronsky.runHoroscope("data/SV.txt", sink=None, cache=chart_cache)  # при попадании - без расчета
+"""
+import hashlib
+import pickle
+import sqlite3
+import time
+from collections import OrderedDict
+
+from const import *
+from chart import Chart
+
+CACHE_FILENAME = 'vronsky_cache.sqlite'
+CACHE_VERSION = 2  # увеличивать при изменении расчета или состава Horoscope
+DEFAULT_MAX_BYTES = 256 << 20
+TOUCH_BATCH = 256  # отметки использования (used) пишутся пачкой: одна транзакция на столько попаданий
+DEFAULT_MEMORY_BYTES = 64 << 20
+DEFAULT_TTL = 3600.0  # секунд без обращений
+
+_NOT_CACHED = ('rules', 'sink')  # восстанавливаются из аргументов runHoroscope
+_CHART_KEY = '_chart'  # planets + aspects колонками
+
+
+def rulesDigest(rules):
+    """RuleSet.digest; для наборов, собранных не из файлов, - хэш самих таблиц."""
+    digest = getattr(rules, 'digest', None)
+    if digest is None:
+        digest = hashlib.sha256(pickle.dumps(rules, pickle.HIGHEST_PROTOCOL)).hexdigest()
+    return digest
+
+
+def dumpState(hor):
+    """
+    Состояние Horoscope (vars без rules и sink) в байтах; натальные точки и аспекты - колонками (chart.Chart),
+    если транзитов еще нет (после calculate - всегда).
+    """
+    state = {k: v for k, v in vars(hor).items() if k not in _NOT_CACHED}
+    if not hor.transits and not hor.transitAspects:
+        chart = Chart.fromHoroscope(hor)
+        if chart is not None:
+            del state['planets'], state['aspects']
+            state[_CHART_KEY] = chart
+    return pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+
+
+def loadState(data):
+    state = pickle.loads(data)
+    chart = state.pop(_CHART_KEY, None)
+    if chart is not None:
+        state['planets'], state['aspects'] = chart.unpack()
+    return state
+
+
+def chartKey(data, rules_digest, import_raw=False):
+    h = hashlib.sha256(b'%d:%d:' % (CACHE_VERSION, bool(import_raw)))
+    h.update(rules_digest.encode('ascii'))
+    h.update(data)
+    return h.hexdigest()
+
+
+class ChartCache:
+    def __init__(self, filename=CACHE_FILENAME, max_bytes=DEFAULT_MAX_BYTES):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self._digests = {}  # id(rules) -> (rules, digest)
+        self._touched = {}  # key -> время попадания, еще не записанное в used
+        self.db = sqlite3.connect(filename, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")  # параллельные рабочие процессы batch.py
+        self.db.execute("CREATE TABLE IF NOT EXISTS charts (key TEXT PRIMARY KEY, rules TEXT NOT NULL, "
+                        "size INTEGER NOT NULL, used REAL NOT NULL, data BLOB NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS charts_used ON charts (used)")
+        self.db.commit()
+
+    def close(self):
+        self.flushTouched()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def digest(self, rules):
+        cached = self._digests.get(id(rules))
+        if cached is None or cached[0] is not rules:
+            cached = self._digests[id(rules)] = (rules, rulesDigest(rules))
+        return cached[1]
+
+    def key(self, data, rules, import_raw=False):
+        return chartKey(data, self.digest(rules), import_raw)
+
+    def get(self, key):
+        """Состояние Horoscope (vars без rules и sink) или None."""
+        row = self.db.execute("SELECT data FROM charts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            state = loadState(row[0])
+        except (EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError) as e:
+            if verbose: print("cache entry not loaded:", e)
+            self.db.execute("DELETE FROM charts WHERE key = ?", (key,))
+            self.db.commit()
+            return None
+        self._touched[key] = time.time()
+        if len(self._touched) >= TOUCH_BATCH:
+            self.flushTouched()
+        return state
+
+    def flushTouched(self):
+        """Записывает накопленные отметки использования (порядок вытеснения) одной транзакцией."""
+        if not self._touched:
+            return
+        self.db.executemany("UPDATE charts SET used = ? WHERE key = ?",
+                            [(used, key) for key, used in self._touched.items()])
+        self.db.commit()
+        self._touched = {}
+
+    def put(self, key, hor):
+        data = dumpState(hor)
+        self.db.execute("INSERT OR REPLACE INTO charts (key, rules, size, used, data) VALUES (?, ?, ?, ?, ?)",
+                        (key, self.digest(hor.rules), len(data), time.time(), data))
+        self.evict()
+        self.db.commit()
+
+    def size(self):
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM charts").fetchone()[0]
+
+    def evict(self, max_bytes=None):
+        """Удаляет самые давно использованные записи, пока общий размер больше max_bytes."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        excess = self.size() - max_bytes
+        if excess <= 0:
+            return 0
+        self.flushTouched()
+        removed = []
+        for key, size in self.db.execute("SELECT key, size FROM charts ORDER BY used"):
+            removed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.db.executemany("DELETE FROM charts WHERE key = ?", removed)
+        self.db.commit()
+        return len(removed)
+
+    def purgeStale(self, rules):
+        """Удаляет записи, посчитанные с другими таблицами правил (после правки yaml)."""
+        count = self.db.execute("DELETE FROM charts WHERE rules != ?", (self.digest(rules),)).rowcount
+        self.db.commit()
+        return count
+
+    def clear(self):
+        self.db.execute("DELETE FROM charts")
+        self.db.commit()
+
+
+class MemoryCache:
+    """
+    LRU в памяти: key -> байты dumpState(). Ограничения: общий размер max_bytes, число записей max_entries
+    и ttl - запись, к которой не обращались ttl секунд, считается устаревшей (None - без ограничения).
+    """
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BYTES, max_entries=None, ttl=DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (data, used), от давно использованных к недавним
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, now=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        now = time.monotonic() if now is None else now
+        data, used = entry
+        if self.ttl is not None and now - used > self.ttl:
+            self._remove(key)
+            return None
+        self.entries[key] = (data, now)
+        self.entries.move_to_end(key)
+        return data
+
+    def put(self, key, data, now=None):
+        if key in self.entries:
+            self._remove(key)
+        if len(data) > self.max_bytes:
+            return
+        self.entries[key] = (data, time.monotonic() if now is None else now)
+        self.bytes += len(data)
+        self.evict(now)
+
+    def evict(self, now=None):
+        """Удаляет устаревшие записи, затем давно не использованные - пока не уложимся в ограничения."""
+        if self.ttl is not None:
+            now = time.monotonic() if now is None else now
+            while self.entries:
+                key, (data, used) = next(iter(self.entries.items()))
+                if now - used <= self.ttl:
+                    break
+                self._remove(key)
+        while self.entries and (self.bytes > self.max_bytes or
+                                (self.max_entries is not None and len(self.entries) > self.max_entries)):
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        data, used = self.entries.pop(key)
+        self.bytes -= len(data)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Компактное хранение карт: точки (планеты, куспиды, транзиты) одной карты лежат колонками в типизированных массивах,
+бонусы - тоже колонками (номер типа в реестре карты + баллы, строки подряд), аспекты между точками карты -
+номерами строк. Для кода, работающего с Planet, есть легкие представления PlanetView (ссылка на Chart и номер строки).
+
+Карта SV.txt (29 точек): ~4 КБ в Chart против ~20 КБ в словаре Planet с BonusLedger, вместе со 168 аспектами -
+~10 КБ против ~48 КБ. В таком виде хранится состояние карты в cache.py (dumpState/loadState).
+
+    chart = Chart.fromHoroscope(hor)
+    for p in chart:                   # PlanetView: p.name(), p.orb(p2), p.sum_bonuses() ...
+        ...
+    planets, aspects = chart.unpack()  # обратно в {pid: Planet} и кортежи findAspects
+"""
+import math
+from array import array
+from collections.abc import Mapping
+
+from const import *
+from planet import Planet
+
+_NAN = math.nan
+_NO_HOUSE = 0  # house/third = None
+
+
+def _nan2none(value):
+    return None if value != value else value
+
+
+def _none2nan(value):
+    return _NAN if value is None else value
+
+
+class Chart:
+    """Точки одной карты колонками: строка = точка, id точки в ids."""
+
+    def __init__(self, name=None, date=None, hour=None):
+        self.name = name  # natName
+        self.date = date  # natDate: (day, month, year)
+        self.hour = hour  # natHour: (hours, minutes)
+        self.ids = array('h')
+        self.znaks = array('b')
+        self.graduses = array('d')
+        self.sizes = array('d')
+        self.houses = array('b')  # 1..12, _NO_HOUSE - не посчитан
+        self.thirds = array('b')
+        self.house_graduses = array('d')  # NaN = None
+        self.prev_graduses = array('d')  # NaN = None
+        self.day_speeds = array('d')  # NaN = None
+        # бонусы строки row - элементы [bonus_start[row], bonus_start[row + 1]) в порядке начисления
+        self.bonus_names = []  # реестр типов бонусов карты: номер -> тип
+        self.bonus_start = array('i', [0])
+        self.bonus_types = array('h')
+        self.bonus_values = array('i')  # 'd', если встретились дробные баллы
+        # аспекты между точками карты (кортежи findAspects), точки - номерами строк
+        self.aspect_rows1 = array('h')
+        self.aspect_rows2 = array('h')
+        self.aspect_kinds = array('h')  # ASPECT.*
+        self.aspect_arcs = array('d')  # actual_orbis = abs(arc - aspect), как во всех способах findAspects
+        self.aspect_max_orbs = array('d')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return (PlanetView(self, row) for row in range(len(self.ids)))
+
+    def append(self, planet):
+        """Добавить точку (Planet или PlanetView), вернуть ее номер строки."""
+        self.ids.append(planet.planet)
+        self.znaks.append(planet.znak)
+        self.graduses.append(planet.gradus)
+        self.sizes.append(planet.size)
+        self.houses.append(planet.house or _NO_HOUSE)
+        self.thirds.append(planet.third or _NO_HOUSE)
+        self.house_graduses.append(_none2nan(planet.house_gradus))
+        self.prev_graduses.append(_none2nan(planet.prev_gradus))
+        self.day_speeds.append(_none2nan(planet.day_speed))
+        for bonus_type, value in planet.bonuses.items():
+            self._promote(value)
+            self.bonus_types.append(self._bonusIndex(bonus_type))
+            self.bonus_values.append(value)
+        self.bonus_start.append(len(self.bonus_types))
+        return len(self.ids) - 1
+
+    def _bonusIndex(self, bonus_type):
+        try:
+            return self.bonus_names.index(bonus_type)  # типов на карту - десятки
+        except ValueError:
+            self.bonus_names.append(bonus_type)
+            return len(self.bonus_names) - 1
+
+    def _promote(self, value):
+        if not isinstance(value, int) and self.bonus_values.typecode == 'i':
+            self.bonus_values = array('d', self.bonus_values)  # дробные баллы (вариант таблиц)
+
+    def bonusItems(self, row):
+        """(тип, баллы) бонусов строки в порядке начисления."""
+        names, types, values = self.bonus_names, self.bonus_types, self.bonus_values
+        return [(names[types[e]], values[e]) for e in range(self.bonus_start[row], self.bonus_start[row + 1])]
+
+    def setBonus(self, row, bonus_type, value):
+        self._promote(value)
+        t = self._bonusIndex(bonus_type)
+        start, end = self.bonus_start[row], self.bonus_start[row + 1]
+        for e in range(start, end):
+            if self.bonus_types[e] == t:
+                self.bonus_values[e] = value
+                return
+        self.bonus_types.insert(end, t)
+        self.bonus_values.insert(end, value)
+        for r in range(row + 1, len(self.bonus_start)):
+            self.bonus_start[r] += 1
+
+    def appendAspects(self, aspects, rows):
+        """Кортежи findAspects; rows - {id(Planet): номер строки}. False, если точка аспекта не из карты."""
+        for p1, p2, aspect, arc, actual_orbis, max_orbis in aspects:
+            row1, row2 = rows.get(id(p1)), rows.get(id(p2))
+            if row1 is None or row2 is None:
+                return False
+            self.aspect_rows1.append(row1)
+            self.aspect_rows2.append(row2)
+            self.aspect_kinds.append(aspect)
+            self.aspect_arcs.append(arc)
+            self.aspect_max_orbs.append(max_orbis)
+        return True
+
+    @classmethod
+    def fromPlanets(cls, planets, name=None, date=None, hour=None):
+        chart = cls(name, date, hour)
+        for planet in planets:
+            chart.append(planet)
+        return chart
+
+    @classmethod
+    def fromHoroscope(cls, hor, transits=False):
+        """
+        Натальные точки hor.planets и аспекты hor.aspects (или транзиты hor.transits при transits=True, без аспектов);
+        None, если в hor.aspects есть точки не из hor.planets.
+        """
+        planets = hor.transits if transits else hor.planets
+        chart = cls.fromPlanets(planets.values(), hor.natName, hor.natDate, hor.natHour)
+        if not transits:
+            rows = {id(planet): row for row, planet in enumerate(planets.values())}
+            if not chart.appendAspects(hor.aspects, rows):
+                return None
+        return chart
+
+    def toPlanet(self, row):
+        """Отдельный Planet (не представление) со всеми полями строки."""
+        p = Planet(self.ids[row], self.znaks[row], self.graduses[row])
+        p.size = self.sizes[row]
+        p.house = self.houses[row] or None
+        p.third = self.thirds[row] or None
+        p.house_gradus = _nan2none(self.house_graduses[row])
+        p.prev_gradus = _nan2none(self.prev_graduses[row])
+        p.day_speed = _nan2none(self.day_speeds[row])
+        for bonus_type, value in self.bonusItems(row):
+            p.bonuses.set(bonus_type, value)
+        return p
+
+    def unpack(self):
+        """({pid: Planet}, [кортежи аспектов]) - как Horoscope.planets и Horoscope.aspects до упаковки."""
+        points = [self.toPlanet(row) for row in range(len(self.ids))]
+        aspects = [(points[row1], points[row2], aspect, arc, abs(arc - aspect), max_orbis)
+                   for row1, row2, aspect, arc, max_orbis in zip(
+                       self.aspect_rows1, self.aspect_rows2, self.aspect_kinds, self.aspect_arcs, self.aspect_max_orbs)]
+        return {p.planet: p for p in points}, aspects
+
+    def row(self, pid):
+        """Номер строки точки pid или -1."""
+        try:
+            return self.ids.index(pid)
+        except ValueError:
+            return -1
+
+    def get(self, pid, default=None):
+        row = self.row(pid)
+        return PlanetView(self, row) if row >= 0 else default
+
+    def asDict(self):
+        """{pid: PlanetView} - в том же виде, что Horoscope.planets."""
+        return {pid: PlanetView(self, row) for row, pid in enumerate(self.ids)}
+
+
+class RowBonuses(Mapping):
+    """Бонусы строки Chart с интерфейсом ledger.BonusLedger (Mapping + set, total, asc_total)."""
+    __slots__ = ('chart', 'row')
+
+    def __init__(self, chart, row):
+        self.chart = chart
+        self.row = row
+
+    def set(self, bonus_type, value):
+        self.chart.setBonus(self.row, bonus_type, value)
+
+    def items(self):
+        return self.chart.bonusItems(self.row)
+
+    def __getitem__(self, bonus_type):
+        for name, value in self.chart.bonusItems(self.row):
+            if name == bonus_type:
+                return value
+        raise KeyError(bonus_type)
+
+    def __iter__(self):
+        return (name for name, value in self.chart.bonusItems(self.row))
+
+    def __len__(self):
+        return self.chart.bonus_start[self.row + 1] - self.chart.bonus_start[self.row]
+
+    @property
+    def total(self):
+        return sum(value for name, value in self.chart.bonusItems(self.row))
+
+    @property
+    def asc_total(self):
+        return sum(value for name, value in self.chart.bonusItems(self.row) if name in BONUS._ASC_DEPENDENT)
+
+    def ascIndependentItems(self):
+        return [(name, value) for name, value in self.chart.bonusItems(self.row) if name not in BONUS._ASC_DEPENDENT]
+
+
+def _column(name, to_value=None, from_value=None):
+    def getter(view):
+        value = getattr(view.chart, name)[view.row]
+        return to_value(value) if to_value else value
+
+    def setter(view, value):
+        getattr(view.chart, name)[view.row] = from_value(value) if from_value else value
+
+    return property(getter, setter)
+
+
+class PlanetView(Planet):
+    """Planet поверх строки Chart: все чтения и записи идут в колонки карты."""
+    __slots__ = ('chart', 'row')
+
+    def __init__(self, chart, row):
+        self.chart = chart
+        self.row = row
+
+    planet = _column('ids')
+    znak = _column('znaks')
+    gradus = _column('graduses')
+    size = _column('sizes')
+    house = _column('houses', lambda v: v or None, lambda v: v or _NO_HOUSE)
+    third = _column('thirds', lambda v: v or None, lambda v: v or _NO_HOUSE)
+    house_gradus = _column('house_graduses', _nan2none, _none2nan)
+    prev_gradus = _column('prev_graduses', _nan2none, _none2nan)
+    day_speed = _column('day_speeds', _nan2none, _none2nan)
+
+    @property
+    def bonuses(self):
+        return RowBonuses(self.chart, self.row)
+
+    @property
+    def abs_gradus(self):
+        return absGradus(self.znak, self.gradus)
+
+    def __eq__(self, other):
+        return isinstance(other, PlanetView) and other.chart is self.chart and other.row == self.row
+
+    def __hash__(self):
+        return hash((id(self.chart), self.row))
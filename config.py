@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import copy
+import hashlib
+import os
+import pickle
 import yaml
+from array import array
 from pprint import pprint as pretty
 from dataclasses import dataclass
 
 from const import *
+from tokenizer import AliasTokenizer
+import dense
 
 
 @dataclass
@@ -38,18 +45,18 @@ class VronskyTableConfig:
     PLANET_WEIGHT: dict
     ASPECT_COEFFS: dict
 
-@dataclass
+@dataclass(frozen=True)
 class PlanetAttrs:
     gender: int
     stihia: int
     is_evil: bool
     exalt_gradus: float  # OVEN:20*
 
-@dataclass
+@dataclass(frozen=True)
 class BonusAspect:
-    planet_mask: list
+    planet_mask: frozenset
     aspect: int
-    to_planets: list
+    to_planets: tuple
     from_orbis: float
     to_orbis: float
     bonus_type: str
@@ -87,162 +94,296 @@ class Config:
     ASPECT_WEIGHT = {}
     PLANET_WEIGHT = {}
     ASPECT_COEFFS = {}
+    # плотные таблицы (см. dense.py), индекс планеты = dense.PLANET_INDEX[pid]
+    ORBIS_MATRIX = None  # array('d'): [i * PLANET_COUNT + j] -> орбис пары (dense.NO_ORBIS если нет)
+    ROLE_MATRIX = None  # array('b'): [znak * PLANET_COUNT + i] -> ROLE.*
+    GRADUS_BONUS_CUBE = None  # array('b'): [(i * 12 + znak) * 30 + int(gradus)] -> баллы за знак/градус
+    HAS_GRADUS_BONUS = None  # bytes: [i] -> есть ли таблица PLANET_GRADUS_BONUSES
+    HOUSE_THIRD_MATRIX = None  # array('b'): [(i * 12 + house - 1) * 3 + third - 1] -> баллы за дом/треть
+    HAS_HOUSE_THIRD = None  # bytes: [i] -> есть ли таблица HOUSE_THIRD_POINTS
+    ASPECT_BONUS_INDEX = {}  # {(aspect, pid цели): ((маска источников по индексам планет, BonusAspect), ...)}
+    ATLAS = None  # array('i'): [i * atlas.ATLAS_SIZE + минута долготы] -> номер в ATLAS_VECTORS (см. atlas.py)
+    ATLAS_VECTORS = []  # [((BONUS.*, баллы), ...) до OWN_HOUSE, (...) после] - позиционные бонусы
+    TOKENIZER = None  # AliasTokenizer, собирается в readAliases()
+    RULES = None  # RuleSet по умолчанию (см. use())
 
     def __init__(self):
         pass
 
+    @classmethod
+    def get_year_dominant(self, year):
+        return self.YEAR_DOMINANTS[year % 7]
+
+    @classmethod
+    def get_weekday_dominant(self, weekday):
+        return self.WEEKDAY_DOMINANTS[weekday % 7]
+
+    @classmethod
+    def make_planet_args(self, planet_, znak_, gradus_):
+        planet = self.NAME_2_PLANET.get(planet_)
+        znak = self.NAME_2_ZNAK.get(znak_)
+        gradus = self.parse_gradus(gradus_)
+        if (planet is not None) and (znak is not None) and (gradus is not None):
+            return planet, znak, gradus
+        raise BaseException("BAD can_make_planet: %s, %s, %s" % (planet, znak, gradus))
+        return None, None, None
+
+    @classmethod
+    def parse_gradus(self, gradus_):
+        # см. const.parseGradus: один скомпилированный regex, None для нераспознанной позиции
+        return parseGradus(gradus_)
+
+    @classmethod
+    def use(cls, rules):
+        """Сделать rules набором по умолчанию: после этого Config.X is rules.X (для кода без явного RuleSet)."""
+        cls.RULES = rules
+        for k, v in vars(rules).items():
+            if k.isupper():
+                setattr(cls, k, v)
+
     @classmethod
     def readAliases(cls, aliasCfg):
+        cls.use(RuleSet(aliasCfg))
+
+    @classmethod
+    def readAspectOrbises(cls, vronskyCfg):
+        cls.use(RuleSet(cls.RULES.alias_cfg, vronskyCfg))
+
+
+_EMPTY_TABLES = {k: v for k, v in vars(Config).items() if k.isupper() and k != 'RULES'}
+
+
+class FrozenDict(dict):
+    """dict только для чтения (таблицы RuleSet); пиклится как обычный dict."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("RuleSet tables are read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+class FrozenArray(array):
+    """array только для чтения (плотные таблицы RuleSet: ORBIS_MATRIX, ATLAS ...); индексация как у array."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("RuleSet tables are read-only")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = byteswap = extend = frombytes = fromfile = fromlist = fromunicode = insert = pop = remove = reverse = _readonly
+
+    def __reduce_ex__(self, protocol):
+        return FrozenArray, (self.typecode, self.tobytes())
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    if isinstance(value, array) and not isinstance(value, FrozenArray):
+        return FrozenArray(value.typecode, value.tobytes())
+    return value
+
+
+class RuleSet:
+    """
+    Неизменяемый набор таблиц: алиасы (aliases.yaml) + правила Вронского (vronsky_tables.yaml).
+    Атрибуты называются так же, как в Config; в одном процессе можно держать несколько вариантов
+    правил и передавать нужный явно: Horoscope(rules), runHoroscope(..., rules=rules).
+    """
+
+    def __init__(self, aliasCfg, vronskyCfg=None, name=None, digest=None):
+        self.name = name
+        self.digest = digest  # хэш исходных yaml (tablesDigest), None - набор собран не из файлов
+        self.alias_cfg = aliasCfg
+        for k, v in _EMPTY_TABLES.items():
+            setattr(self, k, copy.deepcopy(v))
+        self._readAliases(aliasCfg)
+        if vronskyCfg is not None:
+            self._readTables(vronskyCfg)
+        for k, v in list(vars(self).items()):
+            if k.isupper() and k != 'TOKENIZER':
+                setattr(self, k, _freeze(v))
+        self._frozen = True
+
+    def __setattr__(self, key, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError("RuleSet is immutable: %s" % key)
+        object.__setattr__(self, key, value)
+
+    def __repr__(self):
+        return "RuleSet(%s)" % (self.name or '')
+
+    @staticmethod
+    def parse_cfg_gradus(gradus_):
+        gradus = parseGradus(gradus_)
+        if gradus is None:
+            raise ValueError("BAD gradus in config: %r" % (gradus_,))
+        return gradus
+
+    def get_year_dominant(self, year):
+        return self.YEAR_DOMINANTS[year % 7]
+
+    def get_weekday_dominant(self, weekday):
+        return self.WEEKDAY_DOMINANTS[weekday % 7]
+
+    def _readAliases(self, aliasCfg):
         for ru_key, name in aliasCfg.ALIASES_ZNAK.items():
             znak = getattr(ZNAK, name)
-            cls.NAME_2_ZNAK[ru_key] = znak
-            cls.ZNAK_2_NAME[znak] = ru_key
+            self.NAME_2_ZNAK[ru_key] = znak
+            self.ZNAK_2_NAME[znak] = ru_key
         for ru_key, name in aliasCfg.ALIASES_PLANET.items():
             planet = getattr(PLANET, name)
-            cls.NAME_2_PLANET[ru_key] = planet
-            cls.PLANET_2_NAME[planet] = ru_key
+            self.NAME_2_PLANET[ru_key] = planet
+            self.PLANET_2_NAME[planet] = ru_key
         for ru_key, name in aliasCfg.ALIASES_ASPECT.items():
-            cls.NAME_2_ASPECT[ru_key] = val = getattr(ASPECT, name)
-            cls.ASPECT_2_NAME[val] = ru_key
+            self.NAME_2_ASPECT[ru_key] = val = getattr(ASPECT, name)
+            self.ASPECT_2_NAME[val] = ru_key
         for ru_key, name in aliasCfg.ALIASES_GENDER.items():
             val = getattr(GENDER, name)
-            cls.NAME_2_GENDER[ru_key] = val
-            cls.GENDER_2_NAME[val] = ru_key
+            self.NAME_2_GENDER[ru_key] = val
+            self.GENDER_2_NAME[val] = ru_key
         for ru_key, name in aliasCfg.ALIASES_DOMAIN.items():
             val = getattr(STIHIA, name)
-            cls.NAME_2_STIHIA[ru_key] = val
-            cls.STIHIA_2_NAME[val] = ru_key
+            self.NAME_2_STIHIA[ru_key] = val
+            self.STIHIA_2_NAME[val] = ru_key
+        self.TOKENIZER = AliasTokenizer(self.NAME_2_PLANET, self.NAME_2_ZNAK, self.NAME_2_ASPECT, parseGradus)
 
-    @classmethod
-    def readAspectOrbises(cls, vronskyCfg):
+    def _readTables(self, vronskyCfg):
         for planet1_name, planet_2_orbis in vronskyCfg.MAJOR_ASPECT_ORBIS.items():
-            planet1 = cls.NAME_2_PLANET[planet1_name]
-            planet1_dict = cls.MAJOR_ORBS.setdefault(planet1, {})
+            planet1 = self.NAME_2_PLANET[planet1_name]
+            planet1_dict = self.MAJOR_ORBS.setdefault(planet1, {})
             for planet2_name, orbis in planet_2_orbis.items():
-                planet2 = cls.NAME_2_PLANET[planet2_name]
+                planet2 = self.NAME_2_PLANET[planet2_name]
                 planet1_dict[planet2] = orbis
 
         # Average planet speeds
         for planet_name, gradus_ in vronskyCfg.AVG_PLANET_SPD.items():
             if verbose: print("AVG SPD %s %s" % (planet_name, gradus_))
-            planet = cls.NAME_2_PLANET[planet_name]
-            abs_gradus = cls.parse_gradus(gradus_)
-            cls.AVG_SPD[planet] = abs_gradus
+            planet = self.NAME_2_PLANET[planet_name]
+            abs_gradus = self.parse_cfg_gradus(gradus_)
+            self.AVG_SPD[planet] = abs_gradus
             if verbose: print("AVG SPD %s [%d] = %0.3f (%s)" % (planet_name, planet, abs_gradus, gradus_))
 
         # CARDINAL_FIXED_MUTABLE_BONUS_RANGE
         for (znak_type_, start_, end_) in vronskyCfg.CARDINAL_FIXED_MUTABLE_BONUS_RANGE:
             applicable_signs = getattr(ZNAK, '_' + znak_type_)
-            start_orb = cls.parse_gradus(start_)
-            end_orb = cls.parse_gradus(end_)
+            start_orb = self.parse_cfg_gradus(start_)
+            end_orb = self.parse_cfg_gradus(end_)
             for znak in applicable_signs:
                 abs_start = absGradus(znak, start_orb)
                 abs_end = absGradus(znak, end_orb)
-                range_list = cls.ZNAK_BONUS_RANGES.setdefault(znak, [])
+                range_list = self.ZNAK_BONUS_RANGES.setdefault(znak, [])
                 range_list.append((abs_start, abs_end))
-                if verbose: print(znak_type_, cls.ZNAK_2_NAME[znak], cls.ZNAK_BONUS_RANGES[znak])
+                if verbose: print(znak_type_, self.ZNAK_2_NAME[znak], self.ZNAK_BONUS_RANGES[znak])
 
         # ZNAK_DOMINANTS
         for (znak_name, planet_2_role) in vronskyCfg.ZNAK_DOMINANTS.items():
-            znak = cls.NAME_2_ZNAK[znak_name]
-            roles = cls.ZNAK_ROLES.setdefault(znak, {})
+            znak = self.NAME_2_ZNAK[znak_name]
+            roles = self.ZNAK_ROLES.setdefault(znak, {})
             for planet_name, role_name in planet_2_role.items():
-                planet_id = cls.NAME_2_PLANET[planet_name]
+                planet_id = self.NAME_2_PLANET[planet_name]
                 role = getattr(ROLE, role_name)
                 roles[planet_id] = role
                 if verbose: print("set znak[%s] planet [%s] %d role = %s" % (znak, planet_name, planet_id, role))
-                planet_znak_roles = cls.PLANET_ZNAK_ROLES.setdefault(planet_id, {})
+                planet_znak_roles = self.PLANET_ZNAK_ROLES.setdefault(planet_id, {})
                 planet_znak_roles[znak] = role
                 if verbose: print("set planet[%s] %d znak[%s] role = %s" % (planet_name, planet_id, znak, role))
 
         for planet_name, attrs in vronskyCfg.PLANET_ATTRS.items():
             if verbose: print("PLANET_ATTRS %s %s" % (planet_name, attrs))
-            planet_id = cls.NAME_2_PLANET[planet_name]
-            gender = cls.NAME_2_GENDER[attrs.get('пол', GENDER.NEUTRAL)]
-            stihia = cls.NAME_2_STIHIA[attrs.get('стихия', STIHIA.NONE)]
+            planet_id = self.NAME_2_PLANET[planet_name]
+            gender = self.NAME_2_GENDER[attrs.get('пол', GENDER.NEUTRAL)]
+            stihia = self.NAME_2_STIHIA[attrs.get('стихия', STIHIA.NONE)]
             is_evil = bool(attrs.get('зловред'))
             znak_, gradus = attrs.get('exalt_gradus', (None, BAD_GRADUS))
-            exalt_gradus = absGradus(cls.NAME_2_ZNAK[znak_], gradus) if znak_ is not None else BAD_GRADUS
+            exalt_gradus = absGradus(self.NAME_2_ZNAK[znak_], gradus) if znak_ is not None else BAD_GRADUS
             planet_attrs = PlanetAttrs(gender=gender, stihia=stihia, is_evil=is_evil, exalt_gradus=exalt_gradus)
-            cls.PLANET_ATTRS[planet_id] = planet_attrs
+            self.PLANET_ATTRS[planet_id] = planet_attrs
 
-        cls.BONUS_POINTS = vronskyCfg.BONUS_POINTS
+        self.BONUS_POINTS = vronskyCfg.BONUS_POINTS
 
         # {(weekday % 7): planet}
         # i.e. {0: MOON}
-        cls.WEEKDAY_DOMINANTS = {k:cls.NAME_2_PLANET[v] for k, v in vronskyCfg.WEEKDAY_DOMINANTS.items()}
-        if verbose: pretty(['WEEKDAY_DOMINANTS', cls.WEEKDAY_DOMINANTS])
+        self.WEEKDAY_DOMINANTS = {k:self.NAME_2_PLANET[v] for k, v in vronskyCfg.WEEKDAY_DOMINANTS.items()}
+        if verbose: pretty(['WEEKDAY_DOMINANTS', self.WEEKDAY_DOMINANTS])
 
         # {(year % 7): planet}
-        cls.YEAR_DOMINANTS = {(y % 7):cls.NAME_2_PLANET[v] for y, v in vronskyCfg.YEAR_DOMINANTS.items()}
-        if verbose: pretty(['YEAR_DOMINANTS', cls.YEAR_DOMINANTS])
+        self.YEAR_DOMINANTS = {(y % 7):self.NAME_2_PLANET[v] for y, v in vronskyCfg.YEAR_DOMINANTS.items()}
+        if verbose: pretty(['YEAR_DOMINANTS', self.YEAR_DOMINANTS])
 
         # BONUS_GRADUS
-        cls.BONUS_GRADUS = {}
+        self.BONUS_GRADUS = {}
         for bonus_key, range_pairs in vronskyCfg.BONUS_GRADUS.items():
             (znak1_, gradus1_), (znak2_, gradus2_) = range_pairs
-            znak1, znak2 = cls.NAME_2_ZNAK[znak1_], cls.NAME_2_ZNAK[znak2_]
-            gradus1, gradus2 = cls.parse_gradus(gradus1_), cls.parse_gradus(gradus2_)
+            znak1, znak2 = self.NAME_2_ZNAK[znak1_], self.NAME_2_ZNAK[znak2_]
+            gradus1, gradus2 = self.parse_cfg_gradus(gradus1_), self.parse_cfg_gradus(gradus2_)
             assert getattr(BONUS, bonus_key)
-            cls.BONUS_GRADUS[bonus_key] = (absGradus(znak1, gradus1), absGradus(znak2, gradus2))
+            self.BONUS_GRADUS[bonus_key] = (absGradus(znak1, gradus1), absGradus(znak2, gradus2))
         if verbose: pretty(['cfg.BONUS_GRADUS', vronskyCfg.BONUS_GRADUS])
-        if verbose: pretty(['BONUS_GRADUS', cls.BONUS_GRADUS])
+        if verbose: pretty(['BONUS_GRADUS', self.BONUS_GRADUS])
 
-        cls.NAME_2_PLANET_MASK = {}
+        self.NAME_2_PLANET_MASK = {}
         for ru_key, mask_name in vronskyCfg.PLANET_MASKS.items():
             planet_set = getattr(PLANET_MASK, mask_name)
-            cls.NAME_2_PLANET_MASK[ru_key] = planet_set
+            self.NAME_2_PLANET_MASK[ru_key] = planet_set
         if verbose: pretty(['cfg.PLANET_MASKS', vronskyCfg.PLANET_MASKS])
-        if verbose: pretty(['NAME_2_PLANET_MASK', cls.NAME_2_PLANET_MASK])
+        if verbose: pretty(['NAME_2_PLANET_MASK', self.NAME_2_PLANET_MASK])
 
-        cls.BONUS_ASPECTS = []
+        self.BONUS_ASPECTS = []
         for (mask_, planet_, aspect_, from_, to_, bonus_points) in vronskyCfg.BONUS_ASPECTS:
             if verbose: print('BONUS_ASPECT:', (mask_, aspect_, planet_, from_, to_, bonus_points))
-            mask = cls.NAME_2_PLANET_MASK.get(mask_)
-            aspect = cls.NAME_2_ASPECT.get(aspect_)
-            pid = cls.NAME_2_PLANET.get(planet_)
-            from_orbis = -1 if (from_ == '-') else cls.parse_gradus(from_)
-            to_orbis = -1 if (from_ == '-') else cls.parse_gradus(to_)
+            mask = self.NAME_2_PLANET_MASK.get(mask_)
+            aspect = self.NAME_2_ASPECT.get(aspect_)
+            pid = self.NAME_2_PLANET.get(planet_)
+            from_orbis = -1 if (from_ == '-') else self.parse_cfg_gradus(from_)
+            to_orbis = -1 if (from_ == '-') else self.parse_cfg_gradus(to_)
             bonus_type = "%s(%s)" % (aspect_, planet_[:3])
-            cls.BONUS_ASPECTS.append(BonusAspect(
-                planet_mask=mask, aspect=aspect, to_planets=[pid, pid ^ PLANET._RETRO],
+            self.BONUS_ASPECTS.append(BonusAspect(
+                planet_mask=frozenset(mask), aspect=aspect, to_planets=(pid, pid ^ PLANET._RETRO),
                 from_orbis=from_orbis, to_orbis=to_orbis, bonus_type=bonus_type, bonus_points=bonus_points
             ))
         if verbose: pretty(['cfg.BONUS_ASPECTS', vronskyCfg.BONUS_ASPECTS])
-        if verbose: pretty(['BONUS_ASPECTS', cls.BONUS_ASPECTS])
+        if verbose: pretty(['BONUS_ASPECTS', self.BONUS_ASPECTS])
 
         for planet_, house_points in vronskyCfg.HOUSE_THIRD_POINTS.items():
-            pid = cls.NAME_2_PLANET.get(planet_)
-            cls.HOUSE_THIRD_POINTS[pid] = house_points
+            pid = self.NAME_2_PLANET.get(planet_)
+            self.HOUSE_THIRD_POINTS[pid] = house_points
 
         for planet_, termy_ in vronskyCfg.BONUS_TERMY.items():
-            pid = cls.NAME_2_PLANET.get(planet_)
-            planet_termy = cls.BONUS_TERMY.setdefault(pid, {})
+            pid = self.NAME_2_PLANET.get(planet_)
+            planet_termy = self.BONUS_TERMY.setdefault(pid, {})
             for znak_, (gradus1, gradus2, bonus_points) in termy_.items():
-                znak = cls.NAME_2_ZNAK.get(znak_)
+                znak = self.NAME_2_ZNAK.get(znak_)
                 planet_termy[znak] = (absGradus(znak, gradus1), absGradus(znak, gradus2), bonus_points)
-        if verbose: pretty(['BONUS_TERMY', cls.BONUS_TERMY])
+        if verbose: pretty(['BONUS_TERMY', self.BONUS_TERMY])
 
         for znak_, gradus_planets in vronskyCfg.OWN_GRADUS.items():
-            znak = cls.NAME_2_ZNAK.get(znak_)
-            cls.OWN_GRADUS[znak] = fill_dict = {}
+            znak = self.NAME_2_ZNAK.get(znak_)
+            self.OWN_GRADUS[znak] = fill_dict = {}
             for gradus, planets_ in gradus_planets.items():
-                fill_dict[gradus] = set([cls.NAME_2_PLANET[planet_] for planet_ in planets_])
+                fill_dict[gradus] = set([self.NAME_2_PLANET[planet_] for planet_ in planets_])
             # NB(!): только градусы 0-6 заполнены в табличке, см. is_own_gradus_dominant(), там берем % 7
-            if verbose: pretty(['OWN_GRADUS', cls.OWN_GRADUS])
+            if verbose: pretty(['OWN_GRADUS', self.OWN_GRADUS])
 
         for weekday, planets_ in vronskyCfg.DAY_HOUR_OWNER.items():
-            cls.DAY_HOUR_OWNER[weekday] = [cls.NAME_2_PLANET[p] for p in planets_]
+            self.DAY_HOUR_OWNER[weekday] = [self.NAME_2_PLANET[p] for p in planets_]
         for weekday, planets_ in vronskyCfg.NIGHT_HOUR_OWNER.items():
-            cls.NIGHT_HOUR_OWNER[weekday] = [cls.NAME_2_PLANET[p] for p in planets_]
-        if verbose: pretty(['DAY_HOUR_OWNER', cls.DAY_HOUR_OWNER])
-        if verbose: pretty(['NIGHT_HOUR_OWNER', cls.NIGHT_HOUR_OWNER])
+            self.NIGHT_HOUR_OWNER[weekday] = [self.NAME_2_PLANET[p] for p in planets_]
+        if verbose: pretty(['DAY_HOUR_OWNER', self.DAY_HOUR_OWNER])
+        if verbose: pretty(['NIGHT_HOUR_OWNER', self.NIGHT_HOUR_OWNER])
 
         for planet_, planet_graduses_ in vronskyCfg.PLANET_GRADUS_BONUSES.items():
-            pid = cls.NAME_2_PLANET.get(planet_)
-            planet_graduses = cls.PLANET_GRADUS_BONUSES.setdefault(pid, {})
+            pid = self.NAME_2_PLANET.get(planet_)
+            planet_graduses = self.PLANET_GRADUS_BONUSES.setdefault(pid, {})
             for znak_, gradus_array in planet_graduses_.items():
-                znak = cls.NAME_2_ZNAK.get(znak_)
+                znak = self.NAME_2_ZNAK.get(znak_)
                 planet_graduses[znak] = gradus_array
                 assert(len(gradus_array) == 30)
             assert (len(planet_graduses) == 12)
@@ -259,98 +400,125 @@ class Config:
             (PLANET.URAN, PLANET.SATURN_RETRO),  # Уран + Сатурн-R
         ]
         for tbl_from, tbl_to in DUPLICATE_TABLES:
-            cls.PLANET_GRADUS_BONUSES[tbl_to] = cls.PLANET_GRADUS_BONUSES[tbl_from]
-        if verbose: pretty(['PLANET_GRADUS_BONUSES keys:', cls.PLANET_GRADUS_BONUSES.keys()])
+            self.PLANET_GRADUS_BONUSES[tbl_to] = self.PLANET_GRADUS_BONUSES[tbl_from]
+        if verbose: pretty(['PLANET_GRADUS_BONUSES keys:', self.PLANET_GRADUS_BONUSES.keys()])
 
         for planet_, planet_weight in vronskyCfg.PLANET_WEIGHT.items():
-            pid = cls.NAME_2_PLANET.get(planet_)
-            cls.PLANET_WEIGHT[pid] = planet_weight
-        if verbose: pretty(['PLANET_WEIGHT:', cls.PLANET_WEIGHT])
+            pid = self.NAME_2_PLANET.get(planet_)
+            self.PLANET_WEIGHT[pid] = planet_weight
+        if verbose: pretty(['PLANET_WEIGHT:', self.PLANET_WEIGHT])
 
         for aspect_, aspect_weight in vronskyCfg.ASPECT_WEIGHT.items():
-            aid = cls.NAME_2_ASPECT.get(aspect_)
-            cls.ASPECT_WEIGHT[aid] = aspect_weight
-        if verbose: pretty(['ASPECT_WEIGHT:', cls.PLANET_WEIGHT])
+            aid = self.NAME_2_ASPECT.get(aspect_)
+            self.ASPECT_WEIGHT[aid] = aspect_weight
+        if verbose: pretty(['ASPECT_WEIGHT:', self.PLANET_WEIGHT])
 
-        cls.ASPECT_COEFFS = vronskyCfg.ASPECT_COEFFS
+        self.ASPECT_COEFFS = vronskyCfg.ASPECT_COEFFS
 
-    @classmethod
-    def get_year_dominant(self, year):
-        return self.YEAR_DOMINANTS[year % 7]
+        self._buildDenseTables()
 
-    @classmethod
-    def get_weekday_dominant(self, weekday):
-        return self.WEEKDAY_DOMINANTS[weekday % 7]
+    def _buildDenseTables(self):
+        self.ORBIS_MATRIX = dense.orbisMatrix(self.MAJOR_ORBS)
+        self.ROLE_MATRIX = dense.roleMatrix(self.ZNAK_ROLES)
+        self.GRADUS_BONUS_CUBE, self.HAS_GRADUS_BONUS = dense.gradusBonusCube(self.PLANET_GRADUS_BONUSES)
+        self.HOUSE_THIRD_MATRIX, self.HAS_HOUSE_THIRD = dense.houseThirdMatrix(self.HOUSE_THIRD_POINTS)
+        self.ASPECT_BONUS_INDEX = dense.aspectBonusIndex(self.BONUS_ASPECTS)
+        import atlas  # atlas -> planet -> config, поэтому не на уровне модуля
+        self.ATLAS, self.ATLAS_VECTORS = atlas.buildAtlas(self)
 
-    @classmethod
-    def make_planet_args(self, planet_, znak_, gradus_):
-        planet = self.NAME_2_PLANET.get(planet_)
-        znak = self.NAME_2_ZNAK.get(znak_)
-        gradus = self.parse_gradus(gradus_)
-        if (planet is not None) and (znak is not None) and (gradus is not None):
-            return planet, znak, gradus
-        err = "BAD can_make_planet: %s, %s, %s" % (planet, znak, gradus)
-        print(err)
-        raise BaseException(err)
-        return None, None, None
 
-    @classmethod
-    def parse_gradus(self, gradus_):
-        if verbose3: print("gradus_", gradus_)
-        gradus = 0.0
-        rest = gradus_
-        try:
-            g, rest = gradus_.split('°')
-            gradus = float(g)
-        except:
-            pass
-        try:
-            g, rest = gradus_.split('*')
-            gradus = float(g)
-        except:
-            pass
-        # handle minutes & seconds
-        minutes = None
-        try:
-            m, rest = rest.split("'")
-            minutes = float(m)
-        except:
-            pass
-        try:
-            if rest.endswith("'"):
-                minutes = float(rest[:-1])
-        except:
-            pass
-        if verbose3: print("min/rest", minutes, repr(rest), gradus)
-        if minutes is not None:
-            gradus += minutes/60.0
-        seconds = None
-        try:
-            if rest.endswith('"'):
-                seconds = float(rest[:-1])
-        except:
-            pass
-        if verbose3: print("sec/rest", seconds, repr(rest), gradus)
-        if seconds is not None:
-            gradus += seconds/3600.0
-        return gradus
+CONFIG_DIR = os.path.dirname(os.path.abspath(__file__))
+ALIASES_FILENAME = os.path.join(CONFIG_DIR, "aliases.yaml")
+TABLES_FILENAME = os.path.join(CONFIG_DIR, "vronsky_tables.yaml")
 
+SNAPSHOT_EXT = '.snapshot'
+SNAPSHOT_MAGIC = b'VRONSKY-TABLES'
+SNAPSHOT_VERSION = 7  # увеличивать при изменении состава/формата таблиц RuleSet
 
 ALIAS_CFG = None
 VRONSKY_CFG = None
 
 
-def init():
+def readConfigs(aliases_filename=ALIASES_FILENAME, tables_filename=TABLES_FILENAME):
+    with open(aliases_filename, encoding='utf8') as cfg_file:
+        aliasCfg = AliasConfig(**yaml.safe_load(cfg_file))
+    with open(tables_filename, encoding='utf8') as cfg_file:
+        vronskyCfg = VronskyTableConfig(**yaml.safe_load(cfg_file))
+    return aliasCfg, vronskyCfg
+
+
+def init(aliases_filename=ALIASES_FILENAME, tables_filename=TABLES_FILENAME):
     global ALIAS_CFG
     global VRONSKY_CFG
 
-    with open("aliases.yaml", encoding='utf8') as cfg_file:
-        ALIAS_CFG = AliasConfig(**yaml.safe_load(cfg_file))
-    if verbose: print(f"ALIAS_CFG: '{ALIAS_CFG}'")
-
-    with open("vronsky_tables.yaml", encoding='utf8') as cfg_file:
-        VRONSKY_CFG = VronskyTableConfig(**yaml.safe_load(cfg_file))
+    ALIAS_CFG, VRONSKY_CFG = readConfigs(aliases_filename, tables_filename)
     if verbose:
+        print(f"ALIAS_CFG: '{ALIAS_CFG}'")
         print(f"VRONSKY_CFG: '{VRONSKY_CFG}'")
         pretty(VRONSKY_CFG.ZNAK_DOMINANTS)
 
+
+def snapshotFilename(tables_filename=TABLES_FILENAME):
+    # vronsky_tables.yaml -> vronsky_tables.snapshot (у каждого варианта правил свой снапшот)
+    return os.path.splitext(tables_filename)[0] + SNAPSHOT_EXT
+
+
+SNAPSHOT_FILENAME = snapshotFilename()
+
+
+def tablesDigest(aliases_filename=ALIASES_FILENAME, tables_filename=TABLES_FILENAME):
+    h = hashlib.sha256(b'%s:%d' % (SNAPSHOT_MAGIC, SNAPSHOT_VERSION))
+    for filename in (aliases_filename, tables_filename):
+        with open(filename, 'rb') as cfg_file:
+            h.update(cfg_file.read())
+    return h.hexdigest()
+
+
+def saveSnapshot(rules, digest, snapshot_filename=SNAPSHOT_FILENAME):
+    tmp_filename = '%s.%d.tmp' % (snapshot_filename, os.getpid())
+    try:
+        with open(tmp_filename, 'wb') as snapshot_file:
+            pickle.dump((SNAPSHOT_MAGIC, SNAPSHOT_VERSION, digest), snapshot_file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(rules, snapshot_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, snapshot_filename)  # атомарно: параллельные воркеры не увидят половину файла
+    except OSError as e:
+        if verbose: print("snapshot not saved:", e)
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        return False
+    return True
+
+
+def loadSnapshot(digest, snapshot_filename=SNAPSHOT_FILENAME):
+    """RuleSet из снапшота или None, если снапшота нет или он устарел."""
+    try:
+        with open(snapshot_filename, 'rb') as snapshot_file:
+            if pickle.load(snapshot_file) != (SNAPSHOT_MAGIC, SNAPSHOT_VERSION, digest):
+                return None  # устарел (yaml поменялись) или другой версии
+            return pickle.load(snapshot_file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError) as e:
+        if verbose: print("snapshot not loaded:", e)
+        return None
+
+
+def loadRules(aliases_filename=ALIASES_FILENAME, tables_filename=TABLES_FILENAME, snapshot=True, name=None):
+    """
+    RuleSet по паре yaml. С snapshot=True готовые таблицы берутся из бинарного снапшота рядом с tables_filename,
+    если совпадает хэш обоих yaml, иначе строятся заново и снапшот перезаписывается.
+    """
+    digest = tablesDigest(aliases_filename, tables_filename)
+    snapshot_filename = snapshotFilename(tables_filename)
+    rules = loadSnapshot(digest, snapshot_filename) if snapshot else None
+    if rules is None:
+        aliasCfg, vronskyCfg = readConfigs(aliases_filename, tables_filename)
+        rules = RuleSet(aliasCfg, vronskyCfg, name=name or os.path.basename(tables_filename), digest=digest)
+        if snapshot:
+            saveSnapshot(rules, digest, snapshot_filename)
+    return rules
+
+
+def load(aliases_filename=ALIASES_FILENAME, tables_filename=TABLES_FILENAME, snapshot=True):
+    """loadRules() + Config.use(): то же, что init() + Config.readAliases() + Config.readAspectOrbises()."""
+    rules = loadRules(aliases_filename, tables_filename, snapshot)
+    Config.use(rules)
+    return rules
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import re
 
 GRAD = '°'
 
@@ -242,6 +243,40 @@ def hasGradus(token):
     return token.find('*') > 0 or token.find('°') > 0
 
 
+# 03°23'14", 3*39', 24°, 59'08", 11°30' (градусы/минуты/секунды, любая часть может отсутствовать);
+# после позиции допускаются только R, D и запятая (27°42'41"R, 03°23'14",) - 3°39 или 3°abc не разбираются
+_GRADUS_RE = re.compile(r"""\s*(?:(\d+(?:\.\d*)?)\s*[°*])?\s*(?:(\d+(?:\.\d*)?)\s*')?\s*(?:(\d+(?:\.\d*)?)\s*")?\s*"""
+                        r"""(?:[RD,]\s*)*""")
+
+
+def parseGradus(gradus_):
+    """Градусы (float) или None, если строка не распознана или значение вне диапазона."""
+    if gradus_.__class__ is not str:
+        if isinstance(gradus_, (int, float)) and 0 <= gradus_ < FULL_ARC:
+            return float(gradus_)
+        return None
+    m = _GRADUS_RE.fullmatch(gradus_)
+    if m is None:
+        return None
+    g, mins, secs = m.groups()
+    if g is None and mins is None and secs is None:
+        return None
+    gradus = float(g) if g is not None else 0.0
+    if gradus >= FULL_ARC:
+        return None
+    if mins is not None:
+        mins = float(mins)
+        if mins >= 60.0:
+            return None
+        gradus += mins/60.0
+    if secs is not None:
+        secs = float(secs)
+        if secs >= 60.0:
+            return None
+        gradus += secs/3600.0
+    return gradus
+
+
 def signed(num):
     if num is None: return 0
     sign = "+" if num > 0 else ''
@@ -254,6 +289,12 @@ class INCLUDE_BONUSES:
     ASC_INDEPENDENT_ONLY = -1
 
 
+class ASPECT_METHOD:  # способ поиска аспектов в Horoscope.findAspects (см. aspects.py)
+    LOOP = 0  # попарный цикл планета x планета x аспект
+    MATRIX = 1  # один проход по парам, аспекты в полосе дуга +- макс.орбис находятся бинарным поиском по углам
+    SWEEP = 2  # точки отсортированы по долготе, партнеры ищутся бинарным поиском в окне аспект +- макс.орбис
+
+
 class BONUS:
     SPEED = 'spd'
     CARDINAL_ZNAK = 'крит°(к)'
@@ -300,3 +341,10 @@ class BONUS:
     _ASC_DEPENDENT = {HOUSE_THIRD, OWN_HOUSE, ASC_DOMINANT, MC_DOMINANT, HOUR_DOMINANT,
                       BLIZH_MC, UGOL_ASC, UGOL_DSC, UGOL_MC, UGOL_IC}
 
+
+class TRANSIT_EVENT:  # события между снимками транзитов (см. exact.py)
+    EXACT = 0  # аспект транзит-натал точный
+    ENTER = 1  # вход в орбис аспекта
+    LEAVE = 2  # выход из орбиса аспекта
+    INGRESS = 3  # переход куспида натального дома
+    STATION = 4  # смена направления движения (директ <-> ретро)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Плотные (array-backed) варианты таблиц RuleSet: вместо вложенных dict по разреженным id планет
+(с флагами PLANET._RETRO = 1024 и PLANET._HOUSE_FLAG = 128) - компактный индекс планеты 0..PLANET_COUNT-1
+и плоские массивы, адресуемые арифметикой по индексам.
+"""
+from array import array
+
+from const import *
+
+NO_ORBIS = -1.0  # в ORBIS_MATRIX: для пары нет орбиса (аспекты не ищем)
+
+PLANET_IDS = tuple(sorted(PLANET_MASK.ANY))  # индекс -> id планеты (включая ретро и куспиды)
+PLANET_COUNT = len(PLANET_IDS)
+PLANET_INDEX = {pid: i for i, pid in enumerate(PLANET_IDS)}  # id планеты -> индекс
+
+# id -> индекс без dict (id < 2 * PLANET._RETRO), -1 для id вне PLANET_IDS
+PLANET_INDEX_ARRAY = array('h', [-1]) * (2 * PLANET._RETRO)
+for _i, _pid in enumerate(PLANET_IDS):
+    PLANET_INDEX_ARRAY[_pid] = _i
+
+ZNAK_COUNT = 12
+HOUSE_COUNT = 12
+THIRD_COUNT = 3
+ZNAK_GRADUSES = int(ZNAK_ARC)
+
+
+def planetIndex(pid):
+    return PLANET_INDEX_ARRAY[pid] if 0 <= pid < len(PLANET_INDEX_ARRAY) else -1
+
+
+def nonRetro(pid):
+    return pid if (pid & PLANET._RETRO) == 0 else (pid ^ PLANET._RETRO)
+
+
+def tableOrbis(major_orbs, p1nr, p2nr):
+    """Орбис пары по MAJOR_ORBS с правилом для куспидов - как в Horoscope.findAspects (None = нет орбиса)."""
+    table_orbis = major_orbs.get(p1nr, {}).get(p2nr, None) or major_orbs.get(p2nr, {}).get(p1nr, None)
+    isKuspid1 = p1nr in PLANET._KUSPIDS
+    isKuspid2 = p2nr in PLANET._KUSPIDS
+    if (table_orbis is None) and (isKuspid1 or isKuspid2) and not (isKuspid1 and isKuspid2):
+        table_orbis = LESSER_KUSPID_ORBIS  # только один из пары - куспид дома
+    return table_orbis
+
+
+def orbisMatrix(major_orbs):
+    """planet x planet: ORBIS_MATRIX[i * PLANET_COUNT + j] (по не-ретро id, NO_ORBIS если орбиса нет)."""
+    n = PLANET_COUNT
+    matrix = array('d', [NO_ORBIS]) * (n * n)
+    for i, p1 in enumerate(PLANET_IDS):
+        p1nr = nonRetro(p1)
+        for j, p2 in enumerate(PLANET_IDS):
+            table_orbis = tableOrbis(major_orbs, p1nr, nonRetro(p2))
+            if table_orbis is not None:
+                matrix[i * n + j] = table_orbis
+    return matrix
+
+
+def roleMatrix(znak_roles):
+    """znak x planet: ROLE_MATRIX[znak * PLANET_COUNT + i] = ROLE.* (ROLE._NONE если роли нет)."""
+    n = PLANET_COUNT
+    matrix = array('b', [ROLE._NONE]) * (ZNAK_COUNT * n)
+    for znak, roles in znak_roles.items():
+        for pid, role in roles.items():
+            i = planetIndex(pid)
+            if i >= 0:
+                matrix[znak * n + i] = role
+    return matrix
+
+
+def gradusBonusCube(planet_gradus_bonuses):
+    """
+    planet x znak x 30°: GRADUS_BONUS_CUBE[(i * 12 + znak) * 30 + int(gradus)],
+    HAS_GRADUS_BONUS[i] - есть ли у планеты таблица градусов.
+    """
+    cube = array('b', [0]) * (PLANET_COUNT * ZNAK_COUNT * ZNAK_GRADUSES)
+    present = bytearray(PLANET_COUNT)
+    for pid, znak_graduses in planet_gradus_bonuses.items():
+        i = planetIndex(pid)
+        if i < 0:
+            continue
+        present[i] = 1
+        for znak, graduses in znak_graduses.items():
+            base = (i * ZNAK_COUNT + znak) * ZNAK_GRADUSES
+            cube[base:base + ZNAK_GRADUSES] = array('b', graduses)
+    return cube, bytes(present)
+
+
+def houseThirdMatrix(house_third_points):
+    """
+    planet x house x 1/3: HOUSE_THIRD_MATRIX[(i * 12 + house - 1) * 3 + third - 1],
+    HAS_HOUSE_THIRD[i] - есть ли у планеты таблица баллов за дом/треть.
+    """
+    matrix = array('b', [0]) * (PLANET_COUNT * HOUSE_COUNT * THIRD_COUNT)
+    present = bytearray(PLANET_COUNT)
+    for pid, house_points in house_third_points.items():
+        i = planetIndex(pid)
+        if i < 0:
+            continue
+        present[i] = 1
+        for house, points in house_points.items():
+            base = (i * HOUSE_COUNT + house - 1) * THIRD_COUNT
+            matrix[base:base + THIRD_COUNT] = array('b', points)
+    return matrix, bytes(present)
+
+
+def planetBits(planets):
+    """Битовая маска по индексам планет: bit(PLANET_INDEX[pid]) для каждой pid из planets."""
+    bits = 0
+    for pid in planets:
+        i = planetIndex(pid)
+        if i >= 0:
+            bits |= 1 << i
+    return bits
+
+
+def aspectBonusIndex(bonus_aspects):
+    """
+    {(aspect, pid цели): ((маска источников, BonusAspect), ...)} - правила BONUS_ASPECTS в исходном порядке
+    (важно для set_bonus: более позднее правило перезаписывает баллы того же типа).
+    """
+    index = {}
+    for bonus in bonus_aspects:
+        bits = planetBits(bonus.planet_mask)
+        for pid in dict.fromkeys(bonus.to_planets):
+            index.setdefault((bonus.aspect, pid), []).append((bits, bonus))
+    return index
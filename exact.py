@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Точное время событий транзитов по последовательным снимкам положений: между соседними снимками движение точки
+считается равномерным по кратчайшей дуге (ретроградное - с отрицательной скоростью), моменты находятся решением
+линейного уравнения, а не перебором промежуточных снимков.
+
+    snapshots = [(0.0, transits_day0), (1.0, transits_day1), ...]  # время - число (дни) или datetime
+    for event in findEvents(hor.planets, snapshots): print(formatEvent(event))
+
+События (TRANSIT_EVENT): EXACT / ENTER / LEAVE - аспект транзит-натал точный, вход и выход из орбиса (TRANSIT_ORBIS,
+как в runTransits), INGRESS - переход куспида натального дома (как в calcTransitHouses), STATION - смена направления.
+Внутри шага снимков движение монотонно, поэтому станции и события рядом с ними точны с точностью до шага.
+"""
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from const import *
+from config import Config
+import dense
+from houses import HouseCusps
+from planet import Planet
+
+# transit/natal: id точек, aspect: для EXACT/ENTER/LEAVE, house: новый дом (1..12) для INGRESS
+TransitEvent = namedtuple('TransitEvent', ['time', 'kind', 'transit', 'natal', 'aspect', 'house'])
+
+_EVENT_NAMES = {TRANSIT_EVENT.EXACT: 'EXACT', TRANSIT_EVENT.ENTER: 'ENTER', TRANSIT_EVENT.LEAVE: 'LEAVE',
+                TRANSIT_EVENT.INGRESS: 'INGRESS', TRANSIT_EVENT.STATION: 'STATION'}
+
+
+def unwrap(delta):
+    """Кратчайшая дуга со знаком (-180..180)."""
+    return (delta + HALF_ARC) % FULL_ARC - HALF_ARC
+
+
+def _span(t0, t1):
+    span = t1 - t0
+    return span.total_seconds() if hasattr(span, 'total_seconds') else span
+
+
+def prevSnapshots(planets, time, step=1.0):
+    """
+    Два снимка из PREV-строк карты: (time - step, положения PREV) и (time, planets).
+    В prev_gradus хранится только градус в знаке - знак берется ближайший к текущему положению.
+    """
+    prev = {}
+    for pid, p in planets.items():
+        if p.prev_gradus is None:
+            continue
+        candidates = [absGradus((p.znak + dz) % dense.ZNAK_COUNT, p.prev_gradus) for dz in (-1, 0, 1)]
+        prev_abs = min(candidates, key=lambda g: orb(g, p.abs_gradus))
+        znak = int(prev_abs // ZNAK_ARC)
+        prev[pid] = Planet(pid, znak, prev_abs - znak * ZNAK_ARC)
+    return [(time - step, prev), (time, planets)]
+
+
+def aspectMarks(orbis=TRANSIT_ORBIS):
+    """
+    Отметки на разности долгот (транзит - натал, 0..360) со стороны каждого аспекта:
+    (значение, событие, аспект); значения продублированы +360 для поиска с переходом через 0.
+    """
+    marks = set()
+    for aspect in ASPECT_VALUES:
+        aspect_orbis = orbis if aspect not in ASPECT._MINORS else min(orbis, MINOR_ASPECT_ORBIS)
+        for target in {aspect % FULL_ARC, -aspect % FULL_ARC}:
+            marks.add((target, TRANSIT_EVENT.EXACT, aspect, 0))
+            marks.add(((target - aspect_orbis) % FULL_ARC, None, aspect, -1))  # граница орбиса снизу
+            marks.add(((target + aspect_orbis) % FULL_ARC, None, aspect, +1))  # граница сверху
+    marks = sorted(marks)
+    return marks + [(value + FULL_ARC, kind, aspect, side) for value, kind, aspect, side in marks]
+
+
+def _crossed(values, start, delta):
+    """Номера отметок, которые пересекает точка при движении start -> start + delta (0 < f <= 1)."""
+    start %= FULL_ARC
+    if delta > 0:
+        return range(bisect_right(values, start), bisect_right(values, start + delta))
+    if start + delta < 0:
+        start += FULL_ARC
+    return reversed(range(bisect_left(values, start + delta), bisect_left(values, start)))
+
+
+def findEvents(natal_planets, snapshots, orbis=TRANSIT_ORBIS):
+    """
+    TransitEvent по всем интервалам между снимками, по возрастанию времени.
+    natal_planets - {pid: Planet} натальной карты (с куспидами), snapshots - [(время, {pid: Planet}), ...] по порядку.
+    """
+    house_cusps = HouseCusps.fromPlanets(natal_planets)
+    cusp_order = sorted(range(len(house_cusps.cusps)), key=lambda n: house_cusps.cusps[n] % FULL_ARC)
+    cusp_values = [house_cusps.cusps[n] % FULL_ARC for n in cusp_order]
+    cusp_values += [value + FULL_ARC for value in cusp_values]
+    cusp_order += cusp_order
+
+    marks = aspectMarks(orbis)
+    mark_values = [mark[0] for mark in marks]
+    natal = [(pid, p.abs_gradus) for pid, p in natal_planets.items()]
+
+    # треки транзитных точек: ретро и директ - одна точка (id без PLANET._RETRO)
+    tracks = {}
+    for time, transits in snapshots:
+        for pid, p in transits.items():
+            if pid in PLANET._KUSPIDS:
+                continue
+            tracks.setdefault(p.get_non_retro(), []).append((time, p.abs_gradus, pid))
+
+    events = []
+    for track in tracks.values():
+        last = None  # (середина интервала, скорость) предыдущего интервала
+        for (t0, lon0, pid), (t1, lon1, _) in zip(track, track[1:]):
+            delta = unwrap(lon1 - lon0)
+            span = _span(t0, t1)
+            if not delta or not span:
+                continue
+            mid, speed = t0 + (t1 - t0) * 0.5, delta / span
+            if last is not None and (last[1] > 0) != (speed > 0):
+                # скорость меняет знак между серединами интервалов - линейно
+                events.append(TransitEvent(last[0] + (mid - last[0]) * (last[1] / (last[1] - speed)),
+                                           TRANSIT_EVENT.STATION, pid, None, None, None))
+            last = (mid, speed)
+
+            for n in _crossed(cusp_values, lon0, delta):
+                house = cusp_order[n] + 1 if delta > 0 else (cusp_order[n] - 1) % dense.HOUSE_COUNT + 1
+                f = ((cusp_values[n] - lon0 % FULL_ARC) % FULL_ARC if delta > 0 else
+                     (lon0 % FULL_ARC - cusp_values[n]) % FULL_ARC) / abs(delta)
+                events.append(TransitEvent(t0 + (t1 - t0) * f, TRANSIT_EVENT.INGRESS, pid, None, None, house))
+
+            for natal_pid, natal_lon in natal:
+                d0 = (lon0 - natal_lon) % FULL_ARC
+                for n in _crossed(mark_values, d0, delta):
+                    value, kind, aspect, side = marks[n]
+                    f = ((value - d0) % FULL_ARC if delta > 0 else (d0 - value) % FULL_ARC) / abs(delta)
+                    if kind is None:
+                        # к точному аспекту движемся <=> вход в орбис
+                        kind = TRANSIT_EVENT.ENTER if side * delta < 0 else TRANSIT_EVENT.LEAVE
+                    events.append(TransitEvent(t0 + (t1 - t0) * f, kind, pid, natal_pid, aspect, None))
+
+    events.sort(key=lambda event: event.time)
+    return events
+
+
+def formatEvent(event, rules=Config):
+    s = "%s %s %s" % (event.time, _EVENT_NAMES[event.kind], rules.PLANET_2_NAME.get(event.transit))
+    if event.aspect is not None:
+        s += " %s %s" % (rules.ASPECT_2_NAME[event.aspect], rules.PLANET_2_NAME.get(event.natal))
+    if event.house is not None:
+        s += " -> %s дом" % toRoman(event.house)
+    return s
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Выгрузка результатов карт таблицами (TSV, UTF-8) для анализа (pandas.read_csv(..., sep='\\t') и т.п.):
+
+    points.tsv          - точки карты: знак, градус, дом, треть, скорость, сумма и каждый тип бонуса отдельной колонкой
+    aspects.tsv         - рейтинг аспектов карты (aspectRating)
+    transit_aspects.tsv - рейтинг транзитных аспектов (trAspectRating), если транзиты считались (runTransits);
+                          batch.py транзиты не считает - у него здесь только заголовок
+
+Строки копятся в памяти и дописываются в файлы пачками (batch_size карт), заголовок пишется только в новый файл.
+
+    with ColumnarExporter("results/") as exporter:
+        for filename in files:
+            exporter.add(vronsky.runHoroscope(filename, sink=None, keepAll=True), chart=filename)
+"""
+import csv
+import os
+
+from const import *
+from config import Config
+
+POINTS_FILENAME = 'points.tsv'
+ASPECTS_FILENAME = 'aspects.tsv'
+TRANSIT_ASPECTS_FILENAME = 'transit_aspects.tsv'
+
+DEFAULT_BATCH_SIZE = 64
+WRITE_BUFSIZE = 1 << 20
+
+POINT_COLUMNS = ['chart', 'name', 'date', 'time', 'planet', 'znak', 'gradus', 'abs_gradus', 'house', 'third',
+                 'day_speed', 'bonus']
+ASPECT_COLUMNS = ['chart', 'rank', 'rating', 'score', 'p1', 'aspect', 'p2', 'p1_bonus', 'p2_bonus', 'cw',
+                  'orbis', 'max_orbis']
+EXTRA_COLUMN = 'extra'  # бонусы, для которых нет колонки в файле ("тип=баллы; ...")
+
+
+def bonusColumns(rules=Config):
+    """Колонки бонусов: BONUS.* в порядке объявления + типы аспектных бонусов таблиц (BONUS_ASPECTS)."""
+    columns = [v for k, v in BONUS.__dict__.items() if not k.startswith('_') and isinstance(v, str)]
+    for bonus in rules.BONUS_ASPECTS:
+        if bonus.bonus_type not in columns:
+            columns.append(bonus.bonus_type)
+    return columns
+
+
+def _formatDate(date):
+    return "%02d.%02d.%04d" % date if date else ''
+
+
+def _formatTime(hour):
+    return "%02d:%02d" % hour if hour else ''
+
+
+def _blank(value):
+    return '' if value is None else value
+
+
+def pointRows(hor, chart, bonus_columns):
+    """Строки points.tsv (без колонок бонусов не из bonus_columns - они уходят в extra)."""
+    known = set(bonus_columns)
+    date, time = _formatDate(hor.natDate), _formatTime(hor.natHour)
+    name = (hor.natName or '').strip()
+    rows = []
+    for pid, p in hor.planets.items():
+        bonuses = p.bonuses
+        extra = '; '.join('%s=%s' % (bonus_type, points) for bonus_type, points in bonuses.items()
+                          if bonus_type not in known)
+        rows.append([chart, name, date, time, p.name(hor.rules), hor.rules.ZNAK_2_NAME.get(p.znak),
+                     round(p.gradus, 6), round(p.abs_gradus, 6), _blank(p.house), _blank(p.third),
+                     '' if p.day_speed is None else round(p.day_speed, 6), p.sum_bonuses()]
+                    + [_blank(bonuses.get(bonus_type)) for bonus_type in bonus_columns] + [extra])
+    return rows
+
+
+def aspectRows(chart, aspectRating, maxAspectRating, rules=Config):
+    """Строки aspects.tsv / transit_aspects.tsv из строк rateAspects; score - как в отчете ([0..10])."""
+    scale = maxAspectRating or 1.0
+    rows = []
+    for rank, (rating, p1name, p2name, (p1b, p2b), cw, aspect, (orbis, max_orbis)) in enumerate(aspectRating, 1):
+        rows.append([chart, rank, rating, round(rating / scale * 10, 6), p1name, rules.ASPECT_2_NAME[aspect], p2name,
+                     p1b, p2b, cw, orbis, max_orbis])
+    return rows
+
+
+def chartRows(hor, chart=None, bonus_columns=None):
+    """(points, aspects, transit_aspects) - строки всех таблиц одной карты (можно считать в рабочем процессе)."""
+    chart = chart if chart is not None else (hor.natName or '').strip()
+    bonus_columns = bonus_columns if bonus_columns is not None else bonusColumns(hor.rules)
+    transit_rows = []
+    if hor.trAspectRating:
+        # шкала транзитов - натальный максимум, как в runTransits
+        scale = hor.maxAspectRating if hor.maxAspectRating >= 0.001 else hor.maxTrAspectRating
+        transit_rows = aspectRows(chart, hor.trAspectRating, scale, hor.rules)
+    return (pointRows(hor, chart, bonus_columns),
+            aspectRows(chart, hor.aspectRating, hor.maxAspectRating, hor.rules),
+            transit_rows)
+
+
+class _Table:
+    def __init__(self, filename, columns):
+        self.filename = filename
+        self.columns = columns
+        self.rows = []
+
+    def readHeader(self):
+        """Заголовок уже существующего файла (None - файла нет или он пуст)."""
+        if not os.path.exists(self.filename) or not os.path.getsize(self.filename):
+            return None
+        with open(self.filename, 'rt', encoding='utf8', newline='') as table_file:
+            return next(csv.reader(table_file, delimiter='\t'), None)
+
+    def flush(self):
+        if not self.rows:
+            return
+        new_file = not os.path.exists(self.filename) or not os.path.getsize(self.filename)
+        with open(self.filename, 'at', encoding='utf8', newline='', buffering=WRITE_BUFSIZE) as table_file:
+            writer = csv.writer(table_file, delimiter='\t', lineterminator='\n')
+            if new_file:
+                writer.writerow(self.columns)
+            writer.writerows(self.rows)
+        self.rows = []
+
+
+class ColumnarExporter:
+    def __init__(self, directory, rules=Config, batch_size=DEFAULT_BATCH_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.batch_size = batch_size
+        self.pending = 0  # карт в буфере
+
+        points = _Table(os.path.join(directory, POINTS_FILENAME), None)
+        header = points.readHeader()
+        if header:
+            # дописываем в существующий файл - колонки бонусов берем из его заголовка
+            self.bonus_columns = header[len(POINT_COLUMNS):-1]
+        else:
+            self.bonus_columns = bonusColumns(rules)
+        points.columns = POINT_COLUMNS + self.bonus_columns + [EXTRA_COLUMN]
+        self.points = points
+        self.aspects = _Table(os.path.join(directory, ASPECTS_FILENAME), ASPECT_COLUMNS)
+        self.transit_aspects = _Table(os.path.join(directory, TRANSIT_ASPECTS_FILENAME), ASPECT_COLUMNS)
+
+    def add(self, hor, chart=None):
+        self.addRows(chartRows(hor, chart, self.bonus_columns))
+
+    def addRows(self, rows):
+        """Строки chartRows() одной карты (например, посчитанные в другом процессе)."""
+        points, aspects, transit_aspects = rows
+        self.points.rows.extend(points)
+        self.aspects.rows.extend(aspects)
+        self.transit_aspects.rows.extend(transit_aspects)
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for table in (self.points, self.aspects, self.transit_aspects):
+            table.flush()
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Размещение точек по домам: долготы куспидов I..XII берутся один раз, дом каждой точки находится бинарным поиском
+по смещениям куспидов от ASC (с учетом перехода через 0°), вместо проверки всех 12 домов для каждой планеты.
+
+Результат совпадает с попарной проверкой из calcHouses (start_orb < size and end_orb < size, первый подходящий
+дом): найденный дом перепроверяется тем же условием, а если куспиды идут не по порядку или есть дом больше 120°
+(тогда условию может удовлетворять и "чужой" дом) - точка размещается старым перебором.
+"""
+from array import array
+from bisect import bisect_right
+
+from const import *
+
+HOUSE_COUNT = len(PLANET._KUSPIDS)
+_MAX_BISECT_HOUSE = FULL_ARC / 3  # дом больше 120° - возможны ложные попадания, только перебор
+
+
+class HouseCusps:
+    def __init__(self, cusps):
+        """cusps: абсолютные долготы куспидов I..XII (в порядке PLANET._KUSPIDS)."""
+        self.cusps = array('d', cusps)
+        self.sizes = array('d', [orb(self.cusps[h], self.cusps[(h + 1) % HOUSE_COUNT]) for h in range(HOUSE_COUNT)])
+        # смещения куспидов от ASC по ходу знаков; None - бинарный поиск неприменим
+        offsets = [(c - self.cusps[0]) % FULL_ARC for c in self.cusps]
+        ordered = all(offsets[h] < offsets[h + 1] for h in range(HOUSE_COUNT - 1))
+        self.offsets = offsets if ordered and max(self.sizes) <= _MAX_BISECT_HOUSE else None
+
+    @classmethod
+    def fromPlanets(cls, planets):
+        """По словарю {pid: Planet} с куспидами (Horoscope.planets)."""
+        return cls([planets[house_id].abs_gradus for house_id in PLANET._KUSPIDS])
+
+    def _check(self, h, abs_gradus):
+        # учитываем, что градусы зациклены, так что проще посмотреть орбы от начала и конца дома
+        size = self.sizes[h]
+        start_orb = orb(abs_gradus, self.cusps[h])
+        end_orb = orb(abs_gradus, self.cusps[(h + 1) % HOUSE_COUNT])
+        if start_orb < size and end_orb < size:
+            return h + 1, start_orb, end_orb
+        return None
+
+    def place(self, abs_gradus):
+        """(дом 1..12, start_orb, end_orb) или (None, None, None), если точка не попала ни в один дом."""
+        if self.offsets is not None:
+            h = bisect_right(self.offsets, (abs_gradus - self.cusps[0]) % FULL_ARC) - 1
+            placed = self._check(h, abs_gradus)
+            if placed is not None:
+                return placed
+        for h in range(HOUSE_COUNT):  # точка на куспиде (или дома "неправильные") - как раньше, первый подходящий
+            placed = self._check(h, abs_gradus)
+            if placed is not None:
+                return placed
+        return None, None, None
+
+    def third(self, house, start_orb, end_orb):
+        """В какой трети дома (1..3), как в calcHouses."""
+        size = self.sizes[house - 1]
+        if start_orb < size/3:
+            return 1  # ближе к началу дома
+        elif end_orb < size/3:
+            return 3  # ближе к концу дома
+        return 2  # посерединке
+
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бонусы планеты вектором целых чисел: у каждого типа бонуса (BONUS.* и составные типы из BONUS_ASPECTS,
+например "трин(Сол)") свой номер в BONUS_REGISTRY, сумма и ASC-зависимая часть суммы ведутся при каждом set().
+Снаружи BonusLedger - Mapping только для чтения {тип бонуса: баллы} в порядке начисления, запись - через set().
+"""
+from array import array
+from collections.abc import Mapping
+
+from const import *
+
+
+class BonusRegistry:
+    """Номера типов бонусов (общие на процесс; новые типы добавляются по мере появления)."""
+
+    def __init__(self, names=()):
+        self.names = []
+        self.index = {}
+        self.asc_dependent = bytearray()  # [номер] -> бонус зависит от ASC (BONUS._ASC_DEPENDENT)
+        for name in names:
+            self.register(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def register(self, name):
+        idx = self.index.get(name)
+        if idx is None:
+            idx = self.index[name] = len(self.names)
+            self.names.append(name)
+            self.asc_dependent.append(name in BONUS._ASC_DEPENDENT)
+        return idx
+
+
+BONUS_REGISTRY = BonusRegistry(v for k, v in BONUS.__dict__.items() if not k.startswith('_') and isinstance(v, str))
+
+
+class BonusLedger(Mapping):
+    __slots__ = ('values', 'present', 'order', 'total', 'asc_total')
+
+    def __init__(self, items=()):
+        self.values = array('i', [0]) * len(BONUS_REGISTRY)  # баллы по номеру типа
+        self.present = 0  # битовая маска начисленных типов
+        self.order = array('H')  # номера типов в порядке начисления
+        self.total = 0  # сумма всех бонусов
+        self.asc_total = 0  # сумма ASC-зависимых бонусов
+        for bonus_type, value in items:
+            self.set(bonus_type, value)
+
+    def set(self, bonus_type, value):
+        idx = BONUS_REGISTRY.register(bonus_type)
+        if idx >= len(self.values):
+            self.values.extend([0] * (len(BONUS_REGISTRY) - len(self.values)))
+        if not isinstance(value, int) and self.values.typecode == 'i':
+            self.values = array('d', self.values)  # дробные баллы (вариант таблиц) - дальше храним float
+        bit = 1 << idx
+        if self.present & bit:
+            old = self.values[idx]
+        else:
+            old = 0
+            self.present |= bit
+            self.order.append(idx)
+        self.values[idx] = value
+        self.total += value - old
+        if BONUS_REGISTRY.asc_dependent[idx]:
+            self.asc_total += value - old
+
+    def _index(self, bonus_type):
+        idx = BONUS_REGISTRY.index.get(bonus_type)
+        return idx if (idx is not None and self.present & (1 << idx)) else None
+
+    def __getitem__(self, bonus_type):
+        idx = self._index(bonus_type)
+        if idx is None:
+            raise KeyError(bonus_type)
+        return self.values[idx]
+
+    def __contains__(self, bonus_type):
+        return self._index(bonus_type) is not None
+
+    def __iter__(self):
+        return (BONUS_REGISTRY.names[idx] for idx in self.order)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __repr__(self):
+        return "BonusLedger(%r)" % dict(self.items())
+
+    def __reduce__(self):
+        # номера типов зависят от процесса - пиклим по именам
+        return BonusLedger, (list(self.items()),)
+
+    def ascIndependentItems(self):
+        """(тип, баллы) без ASC-зависимых бонусов, в порядке начисления."""
+        asc_dependent = BONUS_REGISTRY.asc_dependent
+        return [(BONUS_REGISTRY.names[idx], self.values[idx]) for idx in self.order if not asc_dependent[idx]]
@@ -1,13 +1,341 @@
-from fastapi import FastAPI
+"""
+HTTP API расчета карт: таблицы грузятся один раз при старте (config.load), расчет идет в пуле процессов,
+каждый рабочий процесс тоже грузит таблицы один раз (batch.initWorker) - event loop не блокируется.
 
-app = FastAPI()
+    uvicorn main:app --workers 1          # VRONSKY_WORKERS - размер пула, VRONSKY_TABLES - вариант правил
+    POST /chart       JSON: {"text": "...", "raw": false} или {"date": "25.03.1915", "time": "04:49", "planets": [...]}
+    POST /chart/text  тело - текст карты как в файле (?raw=true - сырой формат geocult)
+    POST /charts      NDJSON: по строке ChartRequest на карту, ответ - поток NDJSON по мере готовности карт
+                      (в порядке готовности, "index" - номер строки запроса)
+    POST /transits    {"natal": {...как /chart...}, "transits": "..."} или {"chart_id": "...", "transits": "..."}:
+                      натал считается один раз и держится в LRU (chart_id - хэш текста карты и таблиц),
+                      повторные запросы транзитов только разбирают и оценивают снимок
+"""
+import asyncio
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Optional, Union
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from pydantic import BaseModel, confloat
+
+import batch
+import cache
+import config
+from config import Config
+from const import *
+import timeline
+import vronsky
+
+TABLES_FILENAME = os.environ.get('VRONSKY_TABLES', config.TABLES_FILENAME)
+WORKERS = int(os.environ.get('VRONSKY_WORKERS', 0)) or os.cpu_count() or 1
+BATCH_CHUNKSIZE = batch.DEFAULT_CHUNKSIZE  # карт на одну задачу пула в /charts
+BATCH_IN_FLIGHT = 2 * WORKERS  # задач пула одновременно на один запрос /charts (остальное ждет в теле запроса)
+NATAL_CACHE_BYTES = int(os.environ.get('VRONSKY_NATAL_CACHE_MB', 64)) << 20
+NATAL_CACHE_TTL = float(os.environ.get('VRONSKY_NATAL_CACHE_TTL', cache.DEFAULT_TTL))  # секунд без обращений
+
+SignGradus = confloat(ge=0.0, lt=ZNAK_ARC)  # градус в знаке; строки проверяет _positionLine
+
+
+class PlanetPosition(BaseModel):
+    planet: str  # имя или алиас из aliases.yaml ("Солнце", "Нептун-R", "ASC", "10-й")
+    znak: str
+    gradus: Union[str, SignGradus]  # 03°23'14" или градусы в знаке числом
+    prev_znak: Optional[str] = None  # положение днем раньше (строка PREV) - для бонуса скорости
+    prev_gradus: Optional[Union[str, SignGradus]] = None
+
+
+class ChartRequest(BaseModel):
+    text: Optional[str] = None  # карта текстом, как в файле
+    raw: bool = False  # text в сыром формате (geocult)
+    name: Optional[str] = None
+    date: Optional[str] = None  # 25.03.1915
+    time: Optional[str] = None  # 04:49
+    voshod: Optional[str] = None  # 06:10
+    zakat: Optional[str] = None  # 18:48
+    planets: Optional[List[PlanetPosition]] = None
+    top: int = batch.DEFAULT_TOP_COUNT
+
+
+class TransitRequest(BaseModel):
+    chart_id: Optional[str] = None  # из ответа /transits: натал берется из кэша без пересчета
+    natal: Optional[ChartRequest] = None  # натальная карта (нет chart_id или он уже вытеснен из кэша)
+    transits: str  # снимок транзитов текстом, как в файле транзитов
+    top: int = timeline.DEFAULT_TOP_COUNT
+
+
+def _gradusStr(gradus):
+    # фиксированная запись: '%r' дал бы 1e-05°, которое parseGradus не разбирает
+    return gradus if isinstance(gradus, str) else '%.6f°' % float(gradus)
+
+
+def _positionLine(*fields):
+    """Строка положения для файла карты; нераспознанное положение - ValueError (а не молча пропущенная точка)."""
+    line = ' '.join(fields)
+    if Config.RULES.TOKENIZER.parseFields(line.split()) is None:
+        raise ValueError("bad planet position: %r" % line)
+    return line
+
+
+def positionsText(request):
+    """JSON-положения -> строки форматированного файла карты (дальше тот же разбор, что у файлов)."""
+    lines = []
+    if request.name:
+        lines.append('%s %s' % (request.name, NATAL.NAME))
+    if request.date and request.time:
+        lines.append('%s %s %s' % (NATAL.DATE_TIME, request.date, request.time))
+    if request.voshod:
+        lines.append('%s %s' % (NATAL.VOSHOD, request.voshod))
+    if request.zakat:
+        lines.append('%s %s' % (NATAL.ZAKAT, request.zakat))
+    for p in request.planets or []:
+        lines.append(_positionLine(p.planet, p.znak, _gradusStr(p.gradus)))
+    for p in request.planets or []:
+        if p.prev_gradus is not None:
+            lines.append(PREV_TAG + ' ' + _positionLine(p.planet, p.prev_znak or p.znak, _gradusStr(p.prev_gradus)))
+    return '\n'.join(lines)
+
+
+def scoreChartText(text, import_raw=False, top_count=batch.DEFAULT_TOP_COUNT):
+    """Расчет в рабочем процессе пула: JSON-запись как у batch.py (или {'error': ...})."""
+    try:
+        hor = vronsky.calcHoroscope(text.splitlines(), import_raw, sink=None, topCount=top_count)
+        return batch.chartRecord(None, hor, top_count)
+    except Exception as e:
+        return {'file': None, 'error': '%s: %s' % (type(e).__name__, e)}
+
+
+def scoreChartTexts(jobs):
+    """Пачка [(index, text, import_raw, top_count)] одной задачей пула: записи с index вместо file."""
+    records = []
+    for index, text, import_raw, top_count in jobs:
+        record = scoreChartText(text, import_raw, top_count)
+        del record['file']
+        records.append(dict(index=index, **record))
+    return records
+
+
+def natalState(text, import_raw=False):
+    """Натал в рабочем процессе пула: байты cache.dumpState (или {'error': ...})."""
+    try:
+        return cache.dumpState(vronsky.calcHoroscope(text.splitlines(), import_raw, sink=None))
+    except Exception as e:
+        return {'error': '%s: %s' % (type(e).__name__, e)}
+
+
+def scoreTransitText(state, text, top_count=timeline.DEFAULT_TOP_COUNT):
+    """Транзиты против готового натала (state - байты natalState): разбор снимка, дома, аспекты, рейтинг."""
+    try:
+        hor = vronsky.Horoscope(sink=None)
+        vars(hor).update(cache.loadState(state))
+        label = timeline.headerLabel(text.split('\n', 1)[0])
+        transits = timeline.readTransits(hor, io.StringIO(text))
+        day, = timeline.iterTimeline(hor, [(label, transits)], top_count)
+    except Exception as e:
+        return {'error': '%s: %s' % (type(e).__name__, e)}
+
+    planets = []
+    for pid, p in day.transits.items():
+        planets.append({
+            'planet': p.name(hor.rules),
+            'znak': hor.rules.ZNAK_2_NAME.get(p.znak),
+            'gradus': round(p.gradus, 4),
+            'house': p.house,
+        })
+    return {
+        'date': day.label,
+        'score': round(day.score, 3),
+        'transits': planets,
+        'aspects': batch.aspectRecords(day.aspects, day.scale, top_count, hor.rules),
+    }
+
+
+def chartText(request):
+    """(text, import_raw) запроса - текст как есть или JSON-положения в формате файла."""
+    if request.text is not None:
+        return request.text, request.raw
+    if not request.planets:
+        raise ValueError("chart text or planets required")
+    return positionsText(request), False
+
+
+def batchJob(index, line):
+    """Строка NDJSON -> задача scoreChartTexts или запись с ошибкой."""
+    try:
+        request = ChartRequest(**json.loads(line))
+        text, import_raw = chartText(request)
+    except (ValueError, TypeError) as e:  # в т.ч. JSONDecodeError и ValidationError
+        return None, {'index': index, 'error': '%s: %s' % (type(e).__name__, e)}
+    return (index, text, import_raw, request.top), None
+
+
+def _ndjson(record):
+    return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf8')
+
+
+async def _bodyLines(request):
+    """Строки тела запроса по мере поступления (тело не держится в памяти целиком)."""
+    tail = b''
+    async for chunk in request.stream():
+        lines = (tail + chunk).split(b'\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    if tail:
+        yield tail
+
+
+@asynccontextmanager
+async def lifespan(app):
+    config.load(tables_filename=TABLES_FILENAME)  # один раз на приложение (снапшот таблиц)
+    app.state.pool = ProcessPoolExecutor(max_workers=WORKERS, initializer=batch.initWorker,
+                                         initargs=(TABLES_FILENAME,))
+    app.state.rules_digest = cache.rulesDigest(Config.RULES)
+    app.state.natal_cache = cache.MemoryCache(NATAL_CACHE_BYTES, ttl=NATAL_CACHE_TTL)
+    app.state.natal_pending = {}  # chart_id -> future расчета натала (одновременные запросы считают его один раз)
+    try:
+        yield
+    finally:
+        app.state.pool.shutdown(cancel_futures=True)
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+async def _score(text, import_raw, top_count):
+    loop = asyncio.get_running_loop()
+    record = await loop.run_in_executor(app.state.pool, scoreChartText, text, import_raw, top_count)
+    if 'error' in record:
+        raise HTTPException(status_code=422, detail=record['error'])
+    del record['file']
+    return record
 
 
 @app.get("/")
 async def root():
-    return {"message": "Hello World"}
+    return {"status": "ok", "tables": Config.RULES.name, "workers": WORKERS, "natal_cache": len(app.state.natal_cache)}
+
+
+@app.post("/chart")
+async def score_chart(request: ChartRequest):
+    try:
+        text, import_raw = chartText(request)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return await _score(text, import_raw, request.top)
+
+
+@app.post("/chart/text")
+async def score_chart_text(request: Request, raw: bool = False, top: int = batch.DEFAULT_TOP_COUNT):
+    text = (await request.body()).decode('utf8')
+    return await _score(text, raw, top)
+
+
+async def _scoreStream(lines):
+    loop = asyncio.get_running_loop()
+    pending = set()
+    chunk = []
+
+    def submit():
+        pending.add(loop.run_in_executor(app.state.pool, scoreChartTexts, chunk[:]))
+        chunk.clear()
+
+    async def collect(block):
+        nonlocal pending
+        if not pending:
+            return []
+        done, pending = await asyncio.wait(pending, timeout=None if block else 0,
+                                           return_when=asyncio.FIRST_COMPLETED)
+        return [_ndjson(record) for future in done for record in future.result()]
+
+    try:
+        index = 0
+        async for line in lines:
+            if not line.strip():
+                continue
+            job, error = batchJob(index, line)
+            index += 1
+            if error:
+                yield _ndjson(error)
+                continue
+            chunk.append(job)
+            if len(chunk) >= BATCH_CHUNKSIZE:
+                submit()
+            # готовое отдаем сразу, при BATCH_IN_FLIGHT задачах в пуле перестаем читать тело
+            for out in await collect(len(pending) >= BATCH_IN_FLIGHT):
+                yield out
+        if chunk:
+            submit()
+        while pending:
+            for out in await collect(True):
+                yield out
+    finally:
+        for future in pending:  # клиент отключился - не считаем остальное
+            future.cancel()
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    Ответ, который пишется, пока еще читается тело запроса. StreamingResponse (ASGI < 2.4) слушает
+    http.disconnect через тот же receive и забирает себе куски тела - здесь отключение клиента видно по ошибке send.
+    """
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+
+
+@app.post("/charts")
+async def score_charts(request: Request):
+    return BodyStreamingResponse(_scoreStream(_bodyLines(request)), media_type="application/x-ndjson")
+
+
+def _natalDone(key, future):
+    app.state.natal_pending.pop(key, None)
+    if not future.cancelled() and future.exception() is None and isinstance(future.result(), bytes):
+        app.state.natal_cache.put(key, future.result())
+
+
+async def _natalState(key, text, import_raw):
+    state = app.state.natal_cache.get(key)
+    if state is not None:
+        return state
+    future = app.state.natal_pending.get(key)
+    if future is None:
+        future = asyncio.get_running_loop().run_in_executor(app.state.pool, natalState, text, import_raw)
+        app.state.natal_pending[key] = future
+        future.add_done_callback(lambda f: _natalDone(key, f))
+    state = await asyncio.shield(future)  # отключение одного клиента не отменяет расчет для остальных
+    if isinstance(state, dict):
+        raise HTTPException(status_code=422, detail=state['error'])
+    return state
+
 
+@app.post("/transits")
+async def score_transits(request: TransitRequest):
+    if request.natal is not None:
+        try:
+            text, import_raw = chartText(request.natal)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        key = cache.chartKey(text.encode('utf8'), app.state.rules_digest, import_raw)
+        state = await _natalState(key, text, import_raw)
+    elif request.chart_id:
+        key = request.chart_id
+        state = app.state.natal_cache.get(key)
+        if state is None:
+            raise HTTPException(status_code=404, detail="chart_id not cached, send natal")
+    else:
+        raise HTTPException(status_code=422, detail="natal or chart_id required")
 
-@app.get("/hello/{name}")
-async def say_hello(name: str):
-    return {"message": f"Hello {name}"}
+    loop = asyncio.get_running_loop()
+    record = await loop.run_in_executor(app.state.pool, scoreTransitText, state, request.transits, request.top)
+    if 'error' in record:
+        raise HTTPException(status_code=422, detail=record['error'])
+    return dict(chart_id=key, **record)
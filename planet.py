@@ -2,9 +2,13 @@
 # -*- coding: utf-8 -*-
 from const import *
 from config import Config
+from ledger import BonusLedger
 
 
 class Planet(object):
+    __slots__ = ('planet', 'znak', 'gradus', 'abs_gradus', 'size', 'house', 'third', 'house_gradus',
+                 'prev_gradus', 'day_speed', 'bonuses')
+
     def __init__(self, planet=PLANET._NONE, znak=ZNAK._NONE, gradus=0.0):
         self.planet = planet
         self.znak = znak
@@ -17,12 +21,13 @@ class Planet(object):
         # in which house, and which 1/3 of the house planet dwells
         self.house = None
         self.third = None
+        self.house_gradus = None  # орб от куспида своего дома (для транзитов, см. calcTransitHouses)
 
         # can be calculated with prev.day gradus (use PREV tag in the beginning of the planet line)
         self.prev_gradus = None
         self.day_speed = None
 
-        self.bonuses = {}  # {BONUS.SPEED: +2}
+        self.bonuses = BonusLedger()  # {BONUS.SPEED: +2}
 
     @staticmethod
     def get_znak_bonus_type(znak):
@@ -34,7 +39,7 @@ class Planet(object):
             return BONUS.MUTABLE_ZNAK
 
     def set_bonus(self, bonus_type, bonus_value):
-        self.bonuses[bonus_type] = bonus_value
+        self.bonuses.set(bonus_type, bonus_value)
 
     def get_bonus(self, bonus_type):
         return self.bonuses.get(bonus_type)
@@ -42,22 +47,24 @@ class Planet(object):
     def get_bonus_str(self, bonus_types=None):
         s = ''
         if bonus_types is None:
-            bonus_types = self.bonuses.keys()
+            items = self.bonuses.items()
         elif bonus_types is INCLUDE_BONUSES.ASC_INDEPENDENT_ONLY:
-            bonus_types = set(self.bonuses.keys()) - BONUS._ASC_DEPENDENT
-        for bonus in bonus_types:
-            val = self.bonuses.get(bonus)
+            items = self.bonuses.ascIndependentItems()
+        else:
+            items = [(bonus, self.bonuses.get(bonus)) for bonus in bonus_types]
+        for bonus, val in items:
             if val:
                 sign = "+" if val > 0 else ''
                 s += '%s%s%d, ' % (bonus, sign, val)
         return s[:-2]  # cut trailing  ", "
 
     def sum_bonuses(self, bonus_types=None):
-        s = 0
+        # суммы ведет BonusLedger при каждом set_bonus
         if bonus_types is None:
-            bonus_types = self.bonuses.keys()
+            return self.bonuses.total
         elif bonus_types is INCLUDE_BONUSES.ASC_INDEPENDENT_ONLY:
-            bonus_types = set(self.bonuses.keys()) - BONUS._ASC_DEPENDENT
+            return self.bonuses.total - self.bonuses.asc_total
+        s = 0
         for bonus in bonus_types:
             s += self.bonuses.get(bonus) or 0
         return s
@@ -78,23 +85,23 @@ class Planet(object):
             s += ', spd=%s' % formatOrb(self.day_speed)
         return s + ')'
 
-    def name(self):
-        return Config.PLANET_2_NAME.get(self.planet)
+    def name(self, rules=Config):
+        return rules.PLANET_2_NAME.get(self.planet)
 
     # get base planet sign, without retrograde component
     def get_non_retro(self):
         p = self.planet
         return p if (p & PLANET._RETRO) == 0 else (p ^ PLANET._RETRO)
 
-    def has_znak_bonus(self):
-        bonus_ranges = Config.ZNAK_BONUS_RANGES.get(self.znak)
+    def has_znak_bonus(self, rules=Config):
+        bonus_ranges = rules.ZNAK_BONUS_RANGES.get(self.znak)
         for (start, end) in bonus_ranges:
             if verbose: print("ZNAK BONUS:", str(self), start, self.abs_gradus, end)
             if start <= self.abs_gradus <= end:
                 return True
         return False
 
-    def is_own_gradus_dominant(self):
+    def is_own_gradus_dominant(self, rules=Config):
         gradus7 = int(self.gradus) % 7
-        return self.planet in Config.OWN_GRADUS.get(self.znak).get(gradus7)
+        return self.planet in rules.OWN_GRADUS.get(self.znak).get(gradus7)
 
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Рейтинг аспектов по колонкам: суммы бонусов считаются один раз на точку, фильтры (дубликаты, вторичные куспиды,
+нулевые веса) - в том же проходе по аспектам, рейтинги - массивом, а кортежи с именами строятся только для top-K.
+Формула и порядок результата - как в Horoscope.rateAspects (sorted(..., reverse=True)[:K]).
+"""
+import heapq
+import math
+from array import array
+
+from const import *
+
+
+class RatedAspects:
+    def __init__(self, aspects):
+        self.aspects = aspects  # кортежи findAspects
+        self.index = array('i')  # номера аспектов, прошедших фильтры
+        self.ratings = array('d')
+        self.p1b = []  # суммы бонусов (int, как у sum_bonuses)
+        self.p2b = []
+        self.cw = array('d')
+
+    def maxRating(self, scale=0.0):
+        return max(scale, max(self.ratings)) if self.ratings else scale
+
+    def _row(self, rules, k):
+        p1, p2, aspect, arc, actual_orbis, max_orbis = self.aspects[self.index[k]]
+        return (self.ratings[k], p1.name(rules), p2.name(rules), (self.p1b[k], self.p2b[k]), self.cw[k], aspect,
+                (actual_orbis, max_orbis))
+
+    def rows(self, rules, top=None):
+        """Строки рейтинга (rating, p1name, p2name, (p1b, p2b), cw, aspect, (orbis, max_orbis)) по убыванию."""
+        count = len(self.ratings)
+        if top is None or top >= count:
+            candidates = range(count)
+        else:
+            # частичный выбор: все аспекты с рейтингом не ниже K-го (равные рейтинги добирают по полному кортежу)
+            threshold = heapq.nlargest(top, self.ratings)[-1] if top > 0 else math.inf
+            candidates = [k for k in range(count) if self.ratings[k] >= threshold]
+        rows = sorted([self._row(rules, k) for k in candidates], reverse=True)
+        return rows if top is None else rows[:top]
+
+
+def rateAspectArrays(rules, natal_planets, aspects, noDuplicates=True, noKuspids=False):
+    """RatedAspects для списка аспектов; p1 может быть транзитной планетой - бонусы берутся у натальной."""
+    rated = RatedAspects(aspects)
+    AC = rules.ASPECT_COEFFS
+    p_add, ps_deg = AC.get('ADD_PLANET_BALL'), AC.get('PLANET_SUM_DEGREE')
+    mult = AC.get('ASPECT_EXACTNESS_EXP_DEGREE_MULT')
+
+    totals = {}  # Planet -> sum_bonuses(), один раз на точку
+    def total(p):
+        b = totals.get(p)
+        if b is None:
+            b = totals[p] = p.sum_bonuses()
+        return b
+
+    # колонки с фильтрами
+    for n, (p1, p2, aspect, arc, actual_orbis, max_orbis) in enumerate(aspects):
+        natal_p1 = natal_planets.get(p1.planet) or natal_planets.get(p1.planet ^ PLANET._RETRO)
+        p1b, p2b = total(natal_p1), total(p2)
+        if noDuplicates and ((p2b > p1b) or (p1b == p2b and p1.get_non_retro() > p2.get_non_retro())):
+            if verbose: print("(!) REMOVE DUPLICATE:", p1, p1b, aspect, p2, p2b)
+            continue  # все аспекты в списке по 2 раза, исключаем дубликаты; оставляем вариант сила1 >= сила2
+        # для вторичных куспидов (кроме ASC и MC) оставляем только соединения (~вход в новый дом)
+        if noKuspids and (p2.planet in PLANET._SECONDARY_KUSPIDS) and (aspect != ASPECT.CON):
+            if verbose: print("(!) REMOVE KUSPID:", p1, aspect, p2)
+            continue
+        w_aspect = rules.ASPECT_WEIGHT.get(aspect, 0)
+        p1w = rules.PLANET_WEIGHT.get(p1.get_non_retro())
+        p2w = rules.PLANET_WEIGHT.get(p2.get_non_retro())
+        if not p1w or not p2w or not w_aspect:
+            if verbose: print("(!) REMOVE:", p1, p1w, aspect, p2, p2w, w_aspect)
+            continue
+        rated.index.append(n)
+        rated.p1b.append(p1b)
+        rated.p2b.append(p2b)
+        rated.cw.append(math.sqrt(p1w * p2w))
+        rated.ratings.append(w_aspect)  # дальше домножается на ps * ow * cw
+
+    # рейтинги всех прошедших фильтры аспектов
+    exp = math.exp
+    for k, n in enumerate(rated.index):
+        actual_orbis, max_orbis = aspects[n][4], aspects[n][5]
+        ps = pow((abs(rated.p1b[k]) + p_add) * (abs(rated.p2b[k]) + p_add), ps_deg)
+        ow = exp(mult * (abs(actual_orbis) / max_orbis))
+        rated.ratings[k] = rated.ratings[k] * ps * ow * rated.cw[k]
+    return rated
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ректификация времени рождения: одна посчитанная карта + список кандидатов (наборы куспидов и/или время рождения).
+Все, что не зависит от ASC (скорость, позиционные бонусы, доминанты года/дня, аспекты планета-планета),
+берется из карты один раз; для каждого кандидата пересчитываются только дома и трети, свой дом,
+доминанты ASC/MC/часа, ближайшая к MC и аспектные бонусы с участием куспидов.
+
+    hor = vronsky.runHoroscope("data/SV.txt")
+    results = rectify(hor, [Candidate(cusps1), Candidate(cusps2, (4, 30)), Candidate(None, (5, 10))])
+"""
+from collections import namedtuple
+
+from const import *
+import dense
+from aspects import matrixAspects
+from houses import HouseCusps
+from planet import Planet
+import vronsky
+
+# cusps: долготы куспидов I..XII (None - куспиды карты), hour: время рождения (часы, минуты) или None - время карты
+Candidate = namedtuple('Candidate', ['cusps', 'hour'], defaults=[None])
+
+# totals: {pid: сумма бонусов} (планеты и куспиды), houses: {pid: (дом, треть)}, score: сумма по планетам (без куспидов)
+CandidateScore = namedtuple('CandidateScore', ['candidate', 'score', 'totals', 'houses', 'asc_dominant', 'mc_dominant'])
+
+
+def cuspBonusTypes(rules):
+    """Типы бонусов, зависящие от ASC/куспидов: BONUS._ASC_DEPENDENT + аспектные бонусы к куспидам (угол(ASC) и т.п.)."""
+    types = set(BONUS._ASC_DEPENDENT)
+    for bonus in rules.BONUS_ASPECTS:
+        if any(pid in PLANET._KUSPIDS for pid in bonus.to_planets):
+            types.add(bonus.bonus_type)
+    return types
+
+
+def cuspsFromFile(filename, rules=None):
+    """Куспиды I..XII из файла карты (строки домов в обычном формате)."""
+    hor = vronsky.Horoscope(rules, sink=None)
+    with open(filename, "rt", encoding='utf8') as chart_file:
+        for line in chart_file:
+            hor.parseLine(line)
+    return [hor.planets[house_id].abs_gradus for house_id in PLANET._KUSPIDS]
+
+
+class Rectifier:
+    def __init__(self, hor):
+        """hor - карта после runHoroscope (calcHouses, findAspects, calcNatals)."""
+        self.hor = hor
+        self.rules = rules = hor.rules
+        self.cusp_types = cuspBonusTypes(rules)
+        self.planets = [p for pid, p in hor.planets.items() if pid not in PLANET._KUSPIDS]
+        self.cusp_ids = list(PLANET._KUSPIDS)
+        self.natal_cusps = [hor.planets[house_id].abs_gradus for house_id in self.cusp_ids]
+
+        # ASC-независимая часть - один раз на карту
+        self.base_totals = {}
+        for p in self.planets:
+            self.base_totals[p.planet] = sum(v for t, v in p.bonuses.items() if t not in self.cusp_types)
+        self.has_hour = bool(hor.natHour and hor.natVoshod and hor.natZakat)
+
+    def _cuspPoints(self, cusps):
+        points = []
+        for house_id, abs_gradus in zip(self.cusp_ids, cusps):
+            abs_gradus %= FULL_ARC
+            znak = int(abs_gradus // ZNAK_ARC)
+            points.append(Planet(house_id, znak, abs_gradus - znak * ZNAK_ARC))
+        return points
+
+    def _aspectBonuses(self, dep, aspects):
+        # как Horoscope.checkAspectBonus, но баллы пишутся в dep[p1] (только бонусы с участием куспидов)
+        for p1, p2, aspect, arc, actual_orbis, orbis in aspects:
+            entries = self.rules.ASPECT_BONUS_INDEX.get((aspect, p2.planet))
+            if not entries:
+                continue
+            i = dense.planetIndex(p1.planet)
+            bit = (1 << i) if i >= 0 else 0
+            for bits, bonus in entries:
+                if bits & bit and ((bonus.from_orbis < 0) or (bonus.from_orbis <= actual_orbis <= bonus.to_orbis)):
+                    dep[p1.planet][bonus.bonus_type] = bonus.bonus_points
+
+    def score(self, candidate):
+        rules = self.rules
+        cusps = candidate.cusps if candidate.cusps is not None else self.natal_cusps
+        cusp_points = self._cuspPoints(cusps)
+        dep = {p.planet: {} for p in self.planets + cusp_points}  # ASC-зависимые бонусы кандидата
+
+        # дома и трети, свой дом (порядок как в calcHouses: по домам, внутри дома - по порядку карты)
+        house_cusps = HouseCusps(cusps)
+        houses = {}
+        placed = []
+        for n, p in enumerate(self.planets):
+            house, start_orb, end_orb = house_cusps.place(p.abs_gradus)
+            if house is None:
+                continue
+            third = house_cusps.third(house, start_orb, end_orb)
+            houses[p.planet] = (house, third)
+            placed.append((house, n, p))
+            pi = dense.planetIndex(p.planet)
+            if pi >= 0 and rules.HAS_HOUSE_THIRD[pi]:
+                dep[p.planet][BONUS.HOUSE_THIRD] = rules.HOUSE_THIRD_MATRIX[
+                    (pi * dense.HOUSE_COUNT + house - 1) * dense.THIRD_COUNT + third - 1]
+            role = rules.ROLE_MATRIX[(house - 1) * dense.PLANET_COUNT + pi] if pi >= 0 else ROLE._NONE
+            if role == ROLE.DOMICILE:
+                dep[p.planet][BONUS.OWN_HOUSE] = rules.BONUS_POINTS['OWN_HOUSE']
+
+        # ближайшая к MC планета (IX/X дом)
+        mc = cusp_points[PLANET._KUSPIDS.index(PLANET.MC)]
+        closest = (None, FULL_ARC)
+        for house, n, p in sorted(placed, key=lambda item: item[:2]):
+            if house in (9, 10) and p.get_non_retro() in PLANET._REAL_PLANETS:
+                distance = orb(p.abs_gradus, mc.abs_gradus)
+                if distance < closest[1]:
+                    closest = (p, distance)
+        if closest[0] is not None:
+            self._aspectBonuses(dep, [(closest[0], mc, ASPECT._CLOSEST_MC, None, closest[1], None)])
+
+        # аспекты с куспидами (в обе стороны) - в порядке findAspects по всей карте
+        points = self.planets + cusp_points
+        aspects = [a for a in matrixAspects(rules, points, points)
+                   if a[0].planet in PLANET._KUSPIDS or a[1].planet in PLANET._KUSPIDS]
+        self._aspectBonuses(dep, aspects)
+
+        # доминанты часа, ASC и MC
+        natal = {p.planet: p for p in self.planets}
+        hour = candidate.hour or self.hor.natHour
+        if self.has_hour and hour:
+            owner = self.hor.hourOwner(hour)[0]
+            p = natal.get(owner) or natal.get(owner + PLANET._RETRO)
+            dep[p.planet][BONUS.HOUR_DOMINANT] = rules.BONUS_POINTS['HOUR_DOMINANT']
+        dominants = []
+        for point, bonus_type, points_key in ((cusp_points[0], BONUS.ASC_DOMINANT, 'ASC_DOMINANT'),
+                                              (mc, BONUS.MC_DOMINANT, 'MC_DOMINANT')):
+            found = []
+            if self.has_hour:  # как в calcNatals: доминанты ASC/MC считаются вместе с часом рождения
+                for pid, role in rules.ZNAK_ROLES[point.znak].items():
+                    if role == ROLE.DOMICILE and pid in natal:
+                        dep[pid][bonus_type] = rules.BONUS_POINTS[points_key]
+                        found.append(pid)
+            dominants.append(tuple(found))
+
+        totals = {}
+        for p in self.planets:
+            totals[p.planet] = self.base_totals[p.planet] + sum(dep[p.planet].values())
+        for p in cusp_points:
+            totals[p.planet] = sum(dep[p.planet].values())
+        score = sum(totals[p.planet] for p in self.planets)
+        return CandidateScore(candidate, score, totals, houses, dominants[0], dominants[1])
+
+    def sweep(self, candidates):
+        """Оценки кандидатов в исходном порядке."""
+        return [self.score(candidate) for candidate in candidates]
+
+
+def rectify(hor, candidates, top=None):
+    """Кандидаты, отсортированные по убыванию суммы бонусов планет (top - только лучшие)."""
+    scores = sorted(Rectifier(hor).sweep(candidates), key=lambda s: -s.score)
+    return scores if top is None else scores[:top]
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+События расчета карты: Horoscope не печатает сам, а отдает типизированные события в sink (Horoscope.sink).
+
+    ConsoleSink() - прежний консольный отчет (по умолчанию, report.CONSOLE)
+    ListSink()    - события списком (тесты, API, свои форматы)
+    None          - тихий режим: события даже не создаются
+
+    hor = vronsky.runHoroscope("data/SV.txt", sink=None)
+"""
+from collections import namedtuple
+
+from const import *
+
+# разбор карты
+DateToken = namedtuple('DateToken', ['day', 'month', 'year'])
+TimeToken = namedtuple('TimeToken', ['hours', 'minutes'])
+NatalDate = namedtuple('NatalDate', ['date', 'hour'])
+NatalVoshod = namedtuple('NatalVoshod', ['hour'])
+NatalZakat = namedtuple('NatalZakat', ['hour'])
+BadPlanet = namedtuple('BadPlanet', ['elems'])
+BadChunk = namedtuple('BadChunk', ['token'])
+Parsed = namedtuple('Parsed', ['planet'])
+ParsedTransit = namedtuple('ParsedTransit', ['planet', 'natal_planet', 'is_natal'])
+DaySpeed = namedtuple('DaySpeed', ['planet', 'prev', 'avg_speed', 'speed_str'])
+
+# расчет
+Section = namedtuple('Section', [])  # разделитель этапов ('---')
+HouseThird = namedtuple('HouseThird', ['planet', 'size', 'start_orb', 'house', 'role_str'])
+BirthHour = namedtuple('BirthHour', ['is_day', 'hour12', 'fhour', 'minutes', 'total_minutes'])
+NoDominant = namedtuple('NoDominant', ['point', 'names'])  # point: PLANET.ASC / PLANET.MC
+Aspect = namedtuple('Aspect', ['header', 'p1', 'p2', 'aspect', 'arc', 'actual_orbis', 'orbis', 'rules'])
+AspectRating = namedtuple('AspectRating', ['header', 'top_count', 'max_rating', 'scale', 'rows', 'rules'])
+PlanetsTable = namedtuple('PlanetsTable', ['planets', 'include_bonuses', 'rules'])
+TransitPlanetsTable = namedtuple('TransitPlanetsTable', ['transits', 'planets', 'rules'])
+
+
+class Sink:
+    """Получатель событий; по умолчанию события игнорируются."""
+
+    def emit(self, event):
+        pass
+
+
+class ListSink(Sink):
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event):
+        self.events.append(event)
+
+
+class ConsoleSink(Sink):
+    """Консольный отчет (строки - как печатал Horoscope)."""
+
+    def __init__(self, file=None):
+        self.file = file  # None - текущий sys.stdout (работает contextlib.redirect_stdout)
+        self._formatters = {
+            DateToken: lambda e: ("DMY", e.day, e.month, e.year),
+            TimeToken: lambda e: ("HM", e.hours, e.minutes),
+            NatalDate: lambda e: ("NATAL DATE:", e.date, e.hour),
+            NatalVoshod: lambda e: ("NATAL VOSHOD:", e.hour),
+            NatalZakat: lambda e: ("NATAL ZAKAT:", e.hour),
+            BadPlanet: lambda e: ("BAD planet:", e.elems),
+            BadChunk: lambda e: ("BAD planet chunk:", e.token),
+            Parsed: lambda e: ("PARSED:", e.planet),
+            ParsedTransit: lambda e: (
+                "// PARSED TRANSIT (natal):" if e.is_natal else "PARSED TRANSIT:", e.planet, e.natal_planet),
+            DaySpeed: self._daySpeed,
+            Section: lambda e: ('---',),
+            HouseThird: lambda e: ("THIRD: %s %d/3 size=%0.2f/3=%0.2f orb=%0.2f %s %s" % (
+                e.planet, e.planet.third, e.size, e.size/3, e.start_orb, e.house, e.role_str),),
+            BirthHour: lambda e: ("%s BIRTH: natal hour %d (%0.2f), %d/%d" % (
+                "DAY" if e.is_day else "NIGHT", e.hour12, e.fhour, e.minutes, e.total_minutes),),
+            NoDominant: lambda e: ("%sNOTE: Нет доминанта %s (%s)" % (
+                "(!) " if e.point == PLANET.ASC else "", "ASC" if e.point == PLANET.ASC else "MC", e.names),),
+            Aspect: self._aspect,
+            AspectRating: self._aspectRating,
+            PlanetsTable: self._planetsTable,
+            TransitPlanetsTable: self._transitPlanetsTable,
+        }
+
+    def _print(self, *args):
+        print(*args, file=self.file)
+
+    def emit(self, event):
+        formatter = self._formatters.get(type(event))
+        if formatter is not None:
+            lines = formatter(event)
+            if isinstance(lines, tuple):
+                self._print(*lines)
+
+    @staticmethod
+    def _daySpeed(e):
+        return ("day SPEED: %s (%s) avg:%s %s %s" % (formatOrb(e.planet.day_speed), e.speed_str,
+                                                     formatOrb(e.avg_speed or 0), e.planet, e.prev),)
+
+    @staticmethod
+    def _aspect(e):
+        return ("%s%s %s %s (%d %0.3f %0.1f)  %s" % (
+            e.header, e.p1.name(e.rules), e.rules.ASPECT_2_NAME[e.aspect], e.p2.name(e.rules),
+            e.aspect, e.arc, e.orbis, formatOrb(e.actual_orbis, minutes_only=True)),)
+
+    def _aspectRating(self, e):
+        self._print("-------------\nTOP-%d %s ASPECTS (max %0.3f, defMax %0.3f):" % (
+            e.top_count, e.header, e.max_rating, e.scale))
+        for i, (rating, p1name, p2name, (p1b, p2b), cw, aspect, (orb, max_orb)) in enumerate(e.rows[:e.top_count]):
+            self._print("[%0.1f] %s%s(%s) %s %s(%s)  %s" % (
+                rating/e.scale*10, e.header, p1name, signed(p1b), e.rules.ASPECT_2_NAME[aspect],
+                p2name, signed(p2b), formatOrb(orb, minutes_only=True)
+            ))
+
+    def _planetsTable(self, e):
+        "Уран; Рыбы 4*39';	II;	3/3; FAST; 2"
+        rules = e.rules
+        self._print("--- PLANETS: ---")
+        for pid, p in e.planets.items():
+            roleBonus = p.get_bonus_str(BONUS._HOUSE_ROLES)
+            roleStr = "{%s}" % roleBonus[:-1] if roleBonus else ''
+
+            znak = rules.ZNAK_2_NAME[p.znak]
+            znakStr = "%s %s %s" % (znak, formatOrb(p.gradus), roleStr)
+
+            house = toRoman(p.house) if p.house else '-'
+            houseStr = "%3s/%s" % (house, p.third or '-')
+
+            if e.include_bonuses == INCLUDE_BONUSES.ASC_INDEPENDENT_ONLY:
+                bonus_types = INCLUDE_BONUSES.ASC_INDEPENDENT_ONLY
+                houseStr = '-'
+            else:
+                bonus_types = None
+            allBonuses = p.get_bonus_str(bonus_types)
+            bonusSumStr = signed(p.sum_bonuses(bonus_types))
+
+            outputStr = "%3s %-10s %-30s %6s" % (bonusSumStr, p.name(rules), znakStr, houseStr)
+
+            if e.include_bonuses != INCLUDE_BONUSES.NONE:
+                outputStr += '   # %s ' % allBonuses
+            self._print(outputStr)
+
+    def _transitPlanetsTable(self, e):
+        rules = e.rules
+        self._print("--- TRANSIT PLANETS: ---")
+        for pid, p in e.transits.items():
+            natal_p = e.planets.get(pid) or e.planets.get(pid ^ PLANET._RETRO)
+
+            znak = rules.ZNAK_2_NAME[p.znak]
+            znakStr = "%s %s" % (znak, formatOrb(p.gradus))
+
+            house = toRoman(p.house) if p.house else '-'
+            bonusSumStr = signed(natal_p.sum_bonuses())
+
+            outputStr = "(T)%s(%s) -- %s, %s дом (%d°)" % (
+                p.name(rules), bonusSumStr, znakStr, house, int(p.house_gradus))
+            self._print(outputStr)
+
+
+CONSOLE = ConsoleSink()
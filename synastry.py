@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Синастрия группы карт: аспекты всех пар карт (i < j) одним проходом на карту, без печати и без checkAspectBonus -
+бонусы карт не меняются, рейтинг аспектов - как в rateAspects (суммы бонусов планет обеих карт, веса таблиц).
+
+    python synastry.py data/team/*.txt --top 5
+    syn = Synastry([hor1, hor2, hor3]); syn.score(0, 2); syn.rows(0, 2, top=10)
+"""
+import argparse
+import glob
+import os
+import sys
+from array import array
+
+import config
+from const import *
+from aspects import sweepAspects
+from rating import rateAspectArrays
+import vronsky
+
+DEFAULT_TOP_COUNT = 10
+
+
+def synastryPoints(hor, kuspids=False):
+    """Точки карты для синастрии: планеты + ASC/MC (все куспиды при kuspids=True)."""
+    return [p for pid, p in hor.planets.items() if kuspids or pid not in PLANET._SECONDARY_KUSPIDS]
+
+
+class Synastry:
+    def __init__(self, charts, rules=None, orbis_override=None, kuspids=False):
+        """charts - карты после runHoroscope (Horoscope), rules - по умолчанию правила первой карты."""
+        self.charts = list(charts)
+        self.rules = rules if rules is not None else (self.charts[0].rules if self.charts else config.Config.RULES)
+        self.count = n = len(self.charts)
+        self.rated = {}  # (i, j) -> rating.RatedAspects, i < j
+        self.scores = array('d', [0.0]) * (n * n)  # сумма рейтингов аспектов пары, симметрично
+        self.maxAspectRating = 0.0
+
+        points = [synastryPoints(hor, kuspids) for hor in self.charts]
+        for i in range(n - 1):
+            # партнеры - точки всех карт j > i одним списком; owner - номер карты точки
+            others, owner = [], []
+            for j in range(i + 1, n):
+                others.extend(points[j])
+                owner.extend([j] * len(points[j]))
+            position = {id(p): k for k, p in enumerate(others)}
+            by_chart = {j: [] for j in range(i + 1, n)}
+            for aspect in sweepAspects(self.rules, points[i], others, orbis_override):
+                by_chart[owner[position[id(aspect[1])]]].append(aspect)
+
+            for j, aspects in by_chart.items():
+                rated = rateAspectArrays(self.rules, self.charts[i].planets, aspects, noDuplicates=False)
+                self.rated[(i, j)] = rated
+                self.scores[i * n + j] = self.scores[j * n + i] = sum(rated.ratings)
+                self.maxAspectRating = rated.maxRating(self.maxAspectRating)
+
+    def _pair(self, i, j):
+        return self.rated[(i, j)] if i < j else self.rated[(j, i)]
+
+    def aspects(self, i, j):
+        """Аспекты пары (точки карты min(i, j) - первые в кортеже), в порядке findAspects."""
+        rated = self._pair(i, j)
+        return [rated.aspects[n] for n in rated.index]
+
+    def rows(self, i, j, top=None):
+        """Строки рейтинга пары, как у rateAspects: (rating, p1name, p2name, (p1b, p2b), cw, aspect, (orbis, max))."""
+        return self._pair(i, j).rows(self.rules, top)
+
+    def score(self, i, j):
+        return self.scores[i * self.count + j]
+
+    def matrix(self, scale=None):
+        """Матрица N x N сумм рейтингов (scale - нормировка на [0..10], по умолчанию maxAspectRating)."""
+        scale = scale or self.maxAspectRating or 1.0
+        n = self.count
+        return [[self.scores[i * n + j] / scale * 10 for j in range(n)] for i in range(n)]
+
+
+def loadCharts(filenames, import_raw=False, rules=None):
+    """Карты без консольного отчета (runHoroscope на каждый файл)."""
+    return [vronsky.runHoroscope(filename, import_raw=import_raw, export=False, rules=rules, sink=None)
+            for filename in filenames]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Синастрия группы карт")
+    parser.add_argument('paths', nargs='+', help="файлы карт или glob-маски")
+    parser.add_argument('--raw', action='store_true', help="карты в сыром формате импорта")
+    parser.add_argument('--kuspids', action='store_true', help="учитывать все куспиды (по умолчанию только ASC/MC)")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP_COUNT, help="сколько аспектов печатать на пару")
+    parser.add_argument('--tables', default=config.TABLES_FILENAME, help="вариант правил (vronsky_tables.yaml)")
+    args = parser.parse_args(argv)
+
+    files = []
+    for path in args.paths:
+        files.extend(sorted(glob.glob(path)) or [path])
+    config.load(tables_filename=args.tables)
+
+    charts = loadCharts(files, args.raw)
+    syn = Synastry(charts, kuspids=args.kuspids)
+    names = [(hor.natName or os.path.basename(filename)).strip() for hor, filename in zip(charts, files)]
+    matrix = syn.matrix()
+    for i, name in enumerate(names):
+        print("%-20s %s" % (name[:20], ' '.join('%6.1f' % value for value in matrix[i])))
+    scale = syn.maxAspectRating or 1.0
+    for i in range(len(charts)):
+        for j in range(i + 1, len(charts)):
+            print("--- %s x %s: %0.1f" % (names[i], names[j], matrix[i][j]))
+            for rating, p1name, p2name, (p1b, p2b), cw, aspect, (orb, max_orb) in syn.rows(i, j, args.top):
+                print("    [%0.1f] %s(%s) %s %s(%s)  %s" % (
+                    rating / scale * 10, p1name, signed(p1b), syn.rules.ASPECT_2_NAME[aspect],
+                    p2name, signed(p2b), formatOrb(orb, minutes_only=True)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""
+Тесты RuleSet (config.py): таблицы только для чтения, в том числе плотные array-таблицы.
+
+    python -m pytest -q test_config.py
+"""
+import pickle
+
+import pytest
+
+import config
+
+DENSE_TABLES = ('ORBIS_MATRIX', 'ROLE_MATRIX', 'GRADUS_BONUS_CUBE', 'HOUSE_THIRD_MATRIX', 'ATLAS')
+
+
+@pytest.fixture(scope='module')
+def rules():
+    return config.loadRules(snapshot=False)
+
+
+def test_ruleset_immutable(rules):
+    with pytest.raises(AttributeError):
+        rules.ORBIS_MATRIX = None
+    with pytest.raises(TypeError):
+        rules.BONUS_POINTS['SLOW_SPEED'] = 0
+
+
+@pytest.mark.parametrize('name', DENSE_TABLES)
+def test_dense_tables_readonly(rules, name):
+    table = getattr(rules, name)
+    value = table[0]
+    with pytest.raises(TypeError):
+        table[0] = value
+    with pytest.raises(TypeError):
+        table.append(value)
+    with pytest.raises(TypeError):
+        table += table
+    assert getattr(rules, name)[0] == value
+
+
+def test_snapshot_roundtrip(rules):
+    # снапшот и ключ кэша (cache.py) пиклят RuleSet целиком - после загрузки таблицы те же и тоже только для чтения
+    loaded = pickle.loads(pickle.dumps(rules, pickle.HIGHEST_PROTOCOL))
+    for name in DENSE_TABLES:
+        table = getattr(loaded, name)
+        assert isinstance(table, config.FrozenArray)
+        assert table == getattr(rules, name)
+        with pytest.raises(TypeError):
+            table[0] = table[0]
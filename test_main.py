@@ -0,0 +1,207 @@
+"""
+Тесты HTTP API (main.py) через fastapi.testclient: таблицы и пул процессов поднимаются в lifespan, как в uvicorn.
+
+    pip install -r requirements.txt
+    python -m pytest -q test_main.py
+"""
+import json
+import math
+import os
+import threading
+
+import pytest
+
+os.environ.setdefault('VRONSKY_WORKERS', '2')
+
+from fastapi.testclient import TestClient
+
+import batch
+import main
+import vronsky
+
+
+def _read(filename):
+    with open(filename, 'rt', encoding='utf8') as f:
+        return f.read()
+
+
+SV_TEXT = _read('data/SV.txt')
+EXAMPLE_TEXT = _read('data/_example.txt')
+TRANSIT_TEXT = _read('data/transit/SV-transit.txt')
+
+
+class CountingPool:
+    """Обертка пула: считает задачи по функциям и максимум одновременно выполняемых задач."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        with self.lock:
+            self.calls.append((fn.__name__, args))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        future = self.pool.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.running -= 1
+
+    def count(self, name):
+        return sum(1 for fn_name, args in self.calls if fn_name == name)
+
+
+@pytest.fixture(scope='module')
+def client():
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def pool(client):
+    real_pool = main.app.state.pool
+    main.app.state.pool = counting = CountingPool(real_pool)
+    try:
+        yield counting
+    finally:
+        main.app.state.pool = real_pool
+
+
+def _expected(text, top, import_raw=False):
+    """Запись, как у batch.py (через JSON - кортежи становятся списками), без 'file'."""
+    hor = vronsky.calcHoroscope(text.splitlines(), import_raw, sink=None, topCount=top)
+    record = json.loads(json.dumps(batch.chartRecord(None, hor, top), ensure_ascii=False))
+    del record['file']
+    return record
+
+
+def test_root(client):
+    response = client.get('/')
+    assert response.status_code == 200
+    assert response.json()['status'] == 'ok'
+
+
+def test_chart_text(client):
+    response = client.post('/chart', json={'text': EXAMPLE_TEXT, 'top': 5})
+    assert response.status_code == 200
+    assert response.json() == _expected(EXAMPLE_TEXT, 5)
+
+
+def test_chart_raw_body(client):
+    response = client.post('/chart/text?raw=true&top=10', content=EXAMPLE_TEXT.encode('utf8'))
+    assert response.status_code == 200
+    assert response.json() == _expected(EXAMPLE_TEXT, 10, import_raw=True)
+
+
+def _svPositions():
+    hor = vronsky.runHoroscope('data/SV.txt', sink=None, export=False)
+    planets = []
+    for pid, p in hor.planets.items():
+        position = {'planet': p.name(hor.rules), 'znak': hor.rules.ZNAK_2_NAME[p.znak], 'gradus': p.gradus}
+        if p.prev_gradus is not None:
+            position['prev_gradus'] = p.prev_gradus
+        planets.append(position)
+    return hor, {'date': '25.03.1915', 'time': '04:49', 'voshod': '06:10', 'zakat': '18:48', 'planets': planets}
+
+
+def test_chart_positions(client):
+    hor, request = _svPositions()
+    response = client.post('/chart', json=request)
+    assert response.status_code == 200
+    bonuses = {p['planet']: p['bonus'] for p in response.json()['planets']}
+    assert bonuses == {p.name(hor.rules): p.sum_bonuses() for p in hor.planets.values()}
+
+
+def test_chart_position_tiny_gradus(client):
+    # 1e-05 не должен превращаться в нераспознаваемое "1e-05°" и молча пропадать
+    hor, request = _svPositions()
+    request['planets'][0]['gradus'] = 1e-05
+    response = client.post('/chart', json=request)
+    assert response.status_code == 200
+    planets = {p['planet']: p for p in response.json()['planets']}
+    assert len(planets) == len(hor.planets)
+    assert planets[request['planets'][0]['planet']]['gradus'] == 0.0
+
+
+def test_chart_errors(client):
+    assert client.post('/chart', json={'top': 5}).status_code == 422
+    bad = {'planets': [{'planet': 'Нетакой', 'znak': 'Овен', 'gradus': 1.0}]}
+    assert client.post('/chart', json=bad).status_code == 422
+
+
+@pytest.mark.parametrize('position', [
+    {'gradus': 45},  # градус в знаке - только 0 <= gradus < 30, иначе IndexError в плотных таблицах
+    {'gradus': 30.0},
+    {'gradus': -1},
+    {'gradus': 10, 'prev_gradus': 45},
+    {'gradus': '45°'},
+    {'gradus': '3°39'},
+    {'gradus': 10, 'prev_gradus': '30°'},
+])
+def test_chart_bad_gradus(client, position):
+    hor, request = _svPositions()
+    request['planets'][0].update(position)
+    response = client.post('/chart', json=request)
+    assert response.status_code == 422
+    assert 'IndexError' not in response.text
+
+
+def test_charts_stream(client, pool, monkeypatch):
+    monkeypatch.setattr(main, 'BATCH_CHUNKSIZE', 2)
+    monkeypatch.setattr(main, 'BATCH_IN_FLIGHT', 2)
+    lines = [json.dumps({'text': EXAMPLE_TEXT, 'top': 3}, ensure_ascii=False)] * 7
+    lines[2] = 'not json'
+    lines[5] = json.dumps({'top': 3})
+    body = ('\n'.join(lines) + '\n').encode('utf8')
+
+    response = client.post('/charts', content=body, headers={'Content-Type': 'application/x-ndjson'})
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    records = {r['index']: r for r in map(json.loads, response.text.splitlines())}
+
+    assert sorted(records) == list(range(7))
+    assert records[2]['error'].startswith('JSONDecodeError')
+    assert records[5]['error'].startswith('ValueError')
+    expected = _expected(EXAMPLE_TEXT, 3)
+    for index in (0, 1, 3, 4, 6):
+        record = dict(records[index])
+        del record['index']
+        assert record == expected
+
+    # 5 карт пачками по 2 - 3 задачи пула, одновременно не больше BATCH_IN_FLIGHT
+    assert pool.count('scoreChartTexts') == math.ceil(5 / 2)
+    assert pool.max_running <= 2
+
+
+def test_transits_natal_cache(client, pool):
+    main.app.state.natal_cache.clear()
+    first = client.post('/transits', json={'natal': {'text': SV_TEXT}, 'transits': TRANSIT_TEXT, 'top': 10})
+    assert first.status_code == 200
+    record = first.json()
+    assert pool.count('natalState') == 1
+
+    hor = vronsky.runHoroscope('data/SV.txt', sink=None, export=False)
+    hor.runTransits('data/transit/SV-transit.txt')
+    expected = batch.aspectRecords(hor.trAspectRating, hor.maxAspectRating, 10, hor.rules)
+    assert record['aspects'] == json.loads(json.dumps(expected, ensure_ascii=False))
+    assert record['date'] == [25, 2, 2026]
+
+    # повтор по chart_id и по тому же тексту натала - натал из кэша, без пересчета
+    repeat = client.post('/transits', json={'chart_id': record['chart_id'], 'transits': TRANSIT_TEXT, 'top': 10})
+    assert repeat.status_code == 200
+    assert repeat.json() == record
+    again = client.post('/transits', json={'natal': {'text': SV_TEXT}, 'transits': TRANSIT_TEXT, 'top': 10})
+    assert again.json() == record
+    assert pool.count('natalState') == 1
+    assert pool.count('scoreTransitText') == 3
+
+
+def test_transits_unknown_chart_id(client):
+    response = client.post('/transits', json={'chart_id': 'nope', 'transits': TRANSIT_TEXT})
+    assert response.status_code == 404
@@ -0,0 +1,66 @@
+"""
+Тесты разбора положений (const.parseGradus, tokenizer.AliasTokenizer).
+
+    python -m pytest -q test_tokenizer.py
+"""
+import pytest
+
+import config
+import report
+import vronsky
+from const import *
+from tokenizer import FLAG
+
+
+@pytest.fixture(scope='module')
+def rules():
+    return config.loadRules()
+
+
+@pytest.mark.parametrize('gradus_, gradus', [
+    ("03°23'14\"", 3 + 23 / 60 + 14 / 3600),
+    ("3*39'", 3.65),
+    ("24°", 24.0),
+    ("27°42'41\"R", 27 + 42 / 60 + 41 / 3600),  # хвосты R, D и запятая допускаются
+    ("11°30'D", 11.5),
+    ("03°23'14\",", 3 + 23 / 60 + 14 / 3600),
+])
+def test_parse_gradus(gradus_, gradus):
+    assert parseGradus(gradus_) == pytest.approx(gradus)
+
+
+@pytest.mark.parametrize('gradus_', ["3°39", "3°abc", "3°39'x", "R", "", "24°60'"])
+def test_parse_gradus_bad(gradus_):
+    # неразмеченное число или мусор после позиции - не позиция (минуты не должны молча теряться)
+    assert parseGradus(gradus_) is None
+
+
+def test_parse_fields(rules):
+    rec = rules.TOKENIZER.parseFields("Солнце Рыбы 03°23'14\"R".split())
+    assert (rec.planet, rec.znak) == (PLANET.SOL, ZNAK.RYBY)
+    assert rec.gradus == pytest.approx(3 + 23 / 60 + 14 / 3600)
+
+
+@pytest.mark.parametrize('gradus_', ["45°", "30°", "29°60'", "3°39"])
+def test_parse_fields_bad(rules, gradus_):
+    assert rules.TOKENIZER.parseFields(['Солнце', 'Рыбы', gradus_]) is None
+
+
+def test_records_bad_chunk(rules):
+    # градус вне знака - плохой чанк, остальные точки строки разбираются
+    bad = []
+    tokens = "Солнце Рыбы 45°00' Луна Рак 16°30' Нептун R Рак 27°42'41\"".split()
+    records = list(rules.TOKENIZER.records(tokens, on_bad_chunk=bad.append))
+    assert bad == ['Солнце']
+    assert [(r.planet, r.znak) for r in records] == [(PLANET.LUNA, ZNAK.RAK), (PLANET.NEPTUN_RETRO, ZNAK.RAK)]
+    assert records[1].flags == FLAG.RETRO
+
+
+def test_horoscope_bad_gradus(rules):
+    # Солнце 45° раньше доходило до плотных таблиц (IndexError в atlas.py), теперь это BadPlanet, и PREV Солнца пропускается
+    with open('data/_example.txt', 'rt', encoding='utf8') as f:
+        text = f.read().replace("Солнце Овен 10°49'14\"", "Солнце Овен 45°")
+    sink = report.ListSink()
+    hor = vronsky.calcHoroscope(text.splitlines(), False, rules, sink=sink)
+    assert PLANET.SOL not in hor.planets
+    assert report.BadPlanet(['Солнце', 'Овен', '45°']) in sink.events
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Транзиты по серии дат: натальная карта считается один раз (бонусы, куспиды, maxAspectRating не меняются),
+дальше каждый снимок транзитов проходит только дома, аспекты (TRANSIT_ORBIS) и рейтинг - как в runTransits.
+
+    python timeline.py data/SV.txt "data/transit/SV-*.txt" --top 10
+    for day in iterTimeline(hor, ["t1.txt", ("26.02.2026", transits_dict), ...]): ...
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+from collections import namedtuple
+
+import config
+from const import *
+from aspects import matrixAspects
+from houses import HouseCusps
+from rating import rateAspectArrays
+import vronsky
+
+DEFAULT_TOP_COUNT = 100  # как в runTransits
+
+_DATE_RE = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})')
+
+# label: дата снимка (day, month, year) или имя; aspects: строки рейтинга как у rateAspects (top-K),
+# max_rating: максимум рейтинга снимка, scale: шкала (натальный maxAspectRating), score: сумма [0..10]-баллов top-K
+TransitDay = namedtuple('TransitDay', ['label', 'transits', 'aspects', 'max_rating', 'scale', 'score'])
+
+
+def headerLabel(header, default=None):
+    """Дата из заголовка транзитов ("[TRANSIT] транзит 25.02.2026") как (day, month, year), иначе default."""
+    match = _DATE_RE.search(header)
+    if match:
+        day, month, year = map(int, match.groups())
+        return (day, month, year)
+    return default
+
+
+def snapshotLabel(filename):
+    """Дата из заголовка файла транзитов, иначе имя файла."""
+    with open(filename, "rt", encoding='utf8') as transit_file:
+        return headerLabel(transit_file.readline(), os.path.basename(filename))
+
+
+def readTransits(hor, source):
+    """{pid: Planet} транзитов из файла (имя или открытый текстовый файл); натальная карта hor не меняется."""
+    natal_transits, sink = hor.transits, hor.sink
+    try:
+        hor.transits, hor.sink = {}, None
+        if isinstance(source, str):
+            hor.parseTransitFile(source)
+        else:
+            hor.parseTransits(source)
+        return hor.transits
+    finally:
+        hor.transits, hor.sink = natal_transits, sink
+
+
+def iterTimeline(hor, snapshots, top_count=DEFAULT_TOP_COUNT):
+    """
+    Генератор TransitDay по снимкам в исходном порядке. hor - карта после runHoroscope;
+    снимок - имя файла транзитов или пара (label, {pid: Planet}).
+    """
+    rules = hor.rules
+    cusps = HouseCusps.fromPlanets(hor.planets)  # куспиды натала - одни на все даты
+    natal = list(hor.planets.values())
+    scale = hor.maxAspectRating
+
+    for snapshot in snapshots:
+        if isinstance(snapshot, str):
+            label, transits = snapshotLabel(snapshot), readTransits(hor, snapshot)
+        else:
+            label, transits = snapshot
+
+        for pid, planet in transits.items():
+            if pid in PLANET._KUSPIDS:
+                continue
+            house, start_orb, end_orb = cusps.place(planet.abs_gradus)
+            if house is not None:
+                planet.house = house
+                planet.house_gradus = start_orb
+
+        aspects = matrixAspects(rules, transits.values(), natal, TRANSIT_ORBIS)
+        rated = rateAspectArrays(rules, hor.planets, aspects, noDuplicates=False, noKuspids=True)
+        max_rating = rated.maxRating(scale)
+        day_scale = scale if scale >= 0.001 else max_rating
+        rows = rated.rows(rules, top_count)
+        score = sum(row[0] for row in rows) / day_scale * 10 if day_scale else 0.0
+        if verbose: print("TIMELINE:", label, len(aspects), len(rows), score)
+        yield TransitDay(label, transits, rows, max_rating, day_scale, score)
+
+
+def runTimeline(input_filename, snapshots, top_count=DEFAULT_TOP_COUNT, import_raw=False, rules=None):
+    """Натальная карта (один раз) + список TransitDay по снимкам."""
+    hor = vronsky.runHoroscope(input_filename, import_raw=import_raw, export=False, rules=rules, sink=None)
+    return hor, list(iterTimeline(hor, snapshots, top_count))
+
+
+def formatLabel(label):
+    return "%02d.%02d.%04d" % label if isinstance(label, tuple) else str(label)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Транзиты по серии дат для одной натальной карты")
+    parser.add_argument('natal', help="файл натальной карты")
+    parser.add_argument('transits', nargs='+', help="файлы транзитов или glob-маски (по порядку дат)")
+    parser.add_argument('--raw', action='store_true', help="натальная карта в сыром формате импорта")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP_COUNT, help="сколько аспектов рейтинга на дату")
+    parser.add_argument('--show', type=int, default=5, help="сколько аспектов печатать на дату")
+    parser.add_argument('--tables', default=config.TABLES_FILENAME, help="вариант правил (vronsky_tables.yaml)")
+    args = parser.parse_args(argv)
+
+    files = []
+    for path in args.transits:
+        files.extend(sorted(glob.glob(path)) or [path])
+    config.load(tables_filename=args.tables)
+
+    hor, days = runTimeline(args.natal, files, args.top, args.raw)
+    for day in days:
+        print("%s  score %0.1f  aspects %d" % (formatLabel(day.label), day.score, len(day.aspects)))
+        for rating, p1name, p2name, (p1b, p2b), cw, aspect, (orb, max_orb) in day.aspects[:args.show]:
+            print("    [%0.1f] (T)%s(%s) %s %s(%s)  %s" % (
+                rating / day.scale * 10, p1name, signed(p1b), hor.rules.ASPECT_2_NAME[aspect],
+                p2name, signed(p2b), formatOrb(orb, minutes_only=True)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+
+from const import *
+
+
+class TOKEN:
+    NONE = 0
+    PLANET = 1
+    ZNAK = 2
+    ASPECT = 3
+    GRADUS = 4  # 03°23'14", 27*4'
+    RETRO = 5  # "R" после имени планеты
+    DIRECT = 6  # "D" после имени планеты
+    LINE_END = 7  # конец строки в потоке токенов (см. iterTokens)
+
+
+class FLAG:
+    RETRO = 1
+    DIRECT = 2
+
+
+# planet: PLANET id (с учетом суффикса -R/-D), znak: ZNAK id, gradus: градус в знаке (float), flags: FLAG.*
+PlanetRecord = namedtuple('PlanetRecord', ['planet', 'znak', 'gradus', 'flags'])
+
+VENERA_GLYPH = 'R'  # значок Венеры при копировании из geocult превращается в "R", который путается с Retro
+VENERA_PREFIX = 'Венера'
+
+_SUFFIX_FLAGS = {'R': FLAG.RETRO, 'D': FLAG.DIRECT}
+
+LINE_END = '\n'
+STREAM_BUFSIZE = 64 * 1024  # символов за одно чтение в iterTokens()
+
+
+def _addSuffix(planet_token, suffix, letter):
+    # как в старом parseRawChunks: "Нептун" + R -> "Нептун-R", повторный R не добавляется
+    if not (suffix.endswith(letter) if suffix else planet_token.endswith(letter)):
+        suffix += letter
+    return suffix
+
+
+class AliasTokenizer:
+    """
+    Однопроходный разбор строк карты по алиасам из aliases.yaml.
+    Собирается один раз (см. Config.readAliases), дальше каждый токен классифицируется одним dict-lookup'ом.
+    """
+
+    def __init__(self, name_2_planet, name_2_znak, name_2_aspect, parse_gradus):
+        self.parse_gradus = parse_gradus
+        self.kinds = {}  # {"Солнце": (TOKEN.PLANET, SOL)}
+        for name, aspect in name_2_aspect.items():
+            self.kinds[name] = (TOKEN.ASPECT, aspect)
+        for name, znak in name_2_znak.items():
+            self.kinds[name] = (TOKEN.ZNAK, znak)
+        for name, planet in name_2_planet.items():
+            if planet:
+                self.kinds[name] = (TOKEN.PLANET, planet)
+        self.kinds['R'] = (TOKEN.RETRO, 'R')
+        self.kinds['D'] = (TOKEN.DIRECT, 'D')
+        self.kinds[LINE_END] = (TOKEN.LINE_END, None)
+
+        # имя планеты + отдельный токен R/D в сыром формате: ("Нептун", "R") -> "Нептун-R" -> NEPTUN_RETRO
+        self.suffixed = {}
+        for name in name_2_planet:
+            for suffix in _SUFFIX_FLAGS:
+                planet = name_2_planet.get(name + '-' + suffix)
+                if planet is not None:
+                    self.suffixed[(name, suffix)] = planet
+
+    def classify(self, token, strip_parens=False):
+        kind = self.kinds.get(token)
+        if kind is not None:
+            return kind
+        if strip_parens and (token.startswith('(') or token.endswith(')')):
+            token = token.strip('()')
+            return self.classify(token) if token else (TOKEN.NONE, None)
+        if hasGradus(token):
+            return TOKEN.GRADUS, token
+        return TOKEN.NONE, None
+
+    def parseFields(self, tokens):
+        """Форматированная строка: первое имя планеты, первый знак и первый градус среди токенов."""
+        planet = znak = gradus_ = None
+        for token in tokens:
+            kind, value = self.classify(token)
+            if kind == TOKEN.PLANET:
+                if planet is None: planet = value
+            elif kind == TOKEN.ZNAK:
+                if znak is None: znak = value
+            elif kind == TOKEN.GRADUS:
+                if gradus_ is None: gradus_ = value
+        if (planet is None) or (znak is None) or (gradus_ is None):
+            return None
+        gradus = self._signGradus(gradus_)
+        return PlanetRecord(planet, znak, gradus, 0) if gradus is not None else None
+
+    def records(self, tokens, strip_parens=False, on_bad_chunk=None):
+        """
+        Сырой формат (geocult): чанк начинается с имени планеты и длится до следующего имени планеты,
+        токены до первой планеты пропускаются. R/D внутри чанка относятся к имени планеты (Нептун R -> Нептун-R).
+        """
+        planet_token = planet = znak = gradus_ = None
+        suffix = ''
+        flags = 0
+        glyph = False  # отложенный "R": значок Венеры или признак ретроградности - решаем по следующему токену
+        for token in tokens:
+            if glyph:
+                glyph = False
+                if not token.startswith(VENERA_PREFIX) and planet_token is not None:
+                    flags |= FLAG.RETRO
+                    suffix = _addSuffix(planet_token, suffix, 'R')
+            kind, value = self.classify(token, strip_parens)
+            if kind == TOKEN.PLANET or kind == TOKEN.LINE_END:
+                # чанк заканчивается на следующей планете или в конце строки
+                if planet_token is not None:
+                    record = self._makeRecord(planet_token, planet, znak, gradus_, suffix, flags)
+                    if record is not None:
+                        yield record
+                    elif on_bad_chunk is not None:
+                        on_bad_chunk(planet_token + suffix)
+                if kind == TOKEN.PLANET:
+                    planet_token, planet, znak, gradus_, suffix, flags = token, value, None, None, '', 0
+                else:
+                    planet_token = None
+            elif planet_token is None:
+                continue  # пропускаем токены, пока не найдем планету
+            elif kind == TOKEN.ZNAK:
+                if znak is None: znak = value
+            elif kind == TOKEN.RETRO:
+                glyph = True
+            elif kind == TOKEN.DIRECT:
+                flags |= FLAG.DIRECT
+                suffix = _addSuffix(planet_token, suffix, value)
+            elif kind == TOKEN.GRADUS:
+                if gradus_ is None: gradus_ = value
+
+        if glyph and planet_token is not None:
+            flags |= FLAG.RETRO
+            suffix = _addSuffix(planet_token, suffix, 'R')
+        if planet_token is not None:
+            record = self._makeRecord(planet_token, planet, znak, gradus_, suffix, flags)
+            if record is not None:
+                yield record
+            elif on_bad_chunk is not None:
+                on_bad_chunk(planet_token + suffix)
+
+    def _makeRecord(self, planet_token, planet, znak, gradus_, suffix, flags):
+        if suffix:
+            planet = self.suffixed.get((planet_token, suffix))
+        if (planet is None) or (znak is None) or (gradus_ is None):
+            return None
+        gradus = self._signGradus(gradus_)
+        return PlanetRecord(planet, znak, gradus, flags) if gradus is not None else None
+
+    def _signGradus(self, gradus_):
+        # градус в знаке: 45° дальше читался бы как ячейка следующего знака в плотных таблицах (atlas, dense)
+        gradus = self.parse_gradus(gradus_)
+        return gradus if gradus is not None and gradus < ZNAK_ARC else None
+
+
+def iterTokens(text_file, bufsize=STREAM_BUFSIZE):
+    """
+    Токены текстового файла, читаемого порциями по bufsize символов (строка целиком в память не попадает).
+    Конец каждой строки отдается как LINE_END, строки-комментарии ("//", "#") пропускаются.
+    """
+    carry = ''  # недочитанный хвост предыдущей порции: последний токен или начало строки (< 2 символов)
+    line_start = True
+    comment = False
+    while True:
+        buf = text_file.read(bufsize)
+        eof = not buf
+        text = carry + buf
+        carry = ''
+        pos, size = 0, len(text)
+        while pos < size:
+            if line_start:
+                if (not eof) and (size - pos < 2) and (text.find('\n', pos) < 0):
+                    carry = text[pos:]  # мало символов, чтобы распознать комментарий - ждем следующую порцию
+                    break
+                comment = text.startswith('//', pos) or text.startswith('#', pos)
+                line_start = False
+            nl = text.find('\n', pos)
+            if nl >= 0:
+                if not comment:
+                    yield from text[pos:nl].split()
+                yield LINE_END
+                pos = nl + 1
+                line_start = True
+                continue
+            if not comment:
+                tokens = text[pos:].split()
+                if tokens and not (eof or text[-1].isspace()):
+                    carry = tokens.pop()  # токен может продолжиться в следующей порции
+                yield from tokens
+            break
+        if eof:
+            break
@@ -2,20 +2,35 @@
 # -*- coding: utf-8 -*-
 from pprint import pprint as pretty
 #from itertools import combinations
+import datetime
 import math
 
 from const import *
 import config
 from config import Config
 from planet import Planet
+from tokenizer import iterTokens
+import dense
+from atlas import atlasBonuses
+from aspects import matrixAspects, sweepAspects
+from houses import HouseCusps
+from rating import rateAspectArrays
+import report
+
+RATING_TOP_COUNT = 30  # строк рейтинга натальных аспектов (отчет, batch.py, API)
+TRANSIT_TOP_COUNT = 100  # строк рейтинга транзитных аспектов
 
 
 class Horoscope:
-    def __init__(self):
+    def __init__(self, rules=None, sink=report.CONSOLE):
+        self.rules = rules if rules is not None else Config.RULES  # config.RuleSet (по умолчанию - Config.use())
+        self.sink = sink  # куда отдавать события расчета (см. report.py), None - тихий режим
+        self.aspectMethod = ASPECT_METHOD.MATRIX  # см. findAspects()
         self.planets = {}  # PLANET.SOL(int): Planet
         self.houses = {}  # PLANET.ASC(int): Planet with extra "house" fields (notably .size)
         self.aspects = []
         self.aspectRating = []
+        self.ratingTop = RATING_TOP_COUNT  # сколько строк в aspectRating (None - все, для export.py)
         self.maxAspectRating = 0.0
         self.transits = {}
         self.transitAspects = []
@@ -25,6 +40,9 @@ class Horoscope:
         self.natDate = None
         self.natTime = None
         self.natHour = None
+        self.natVoshod = None
+        self.natZakat = None
+        self.natName = None
         self.isDayBirth = False
         self.closestToMC = (0, FULL_ARC)  # орбис для ближайшей к MC планеты (только в пределах X/IX домов)
 
@@ -41,7 +59,7 @@ class Horoscope:
     def parseRaw(self, line):
         if line.startswith("//") or line.startswith("#"):
             return
-        line = line.replace('R Венера', 'Венера')  # значок Венеры преобразуется в R, который путается со знаком Retro
+        # значок Венеры ("R Венера") и суффиксы R/D разбирает rules.TOKENIZER
         if line.startswith(PREV_TAG):
             self.parsePlanetSpeedRaw(line)
         elif hasGradus(line):
@@ -52,8 +70,6 @@ class Horoscope:
     def parseTransitRaw(self, line):
         if line.startswith("//") or line.startswith("#"):
             return
-        line = line.replace('R Венера', 'Венера')  # значок Венеры преобразуется в R, который путается со знаком Retro
-        line = line.replace('(', '').replace(')', '')  # в строке транзитов масса лишних скобок
         if hasGradus(line):
             self.parsePlanetTransitRaw(line)
 
@@ -66,11 +82,11 @@ class Horoscope:
             if token.find('.') > 0:
                 # parse date: "01.01.2000"
                 day, month, year = map(int, token.split('.'))
-                print("DMY", day, month, year)
+                if self.sink: self.sink.emit(report.DateToken(day, month, year))
             elif token.find(':') > 0:
                 # parse time: "12:20"
                 hours, minutes = map(int, token.split(':')[:2])
-                print("HM", hours, minutes)
+                if self.sink: self.sink.emit(report.TimeToken(hours, minutes))
             elif token in NATAL_TAGS:
                 natal_tag = NATAL_TAGS[token]
                 if verbose: print('natal_tag:', natal_tag)
@@ -78,35 +94,33 @@ class Horoscope:
         if natal_tag == 'DATE_TIME':
             self.natDate = (day, month, year)
             self.natHour = (hours, minutes)
-            print("NATAL DATE:", self.natDate, self.natHour)
+            if self.sink: self.sink.emit(report.NatalDate(self.natDate, self.natHour))
         elif natal_tag == 'VOSHOD':
             self.natVoshod = (hours, minutes)
-            print("NATAL VOSHOD:", self.natVoshod)
+            if self.sink: self.sink.emit(report.NatalVoshod(self.natVoshod))
         elif natal_tag == 'ZAKAT':
             self.natZakat = (hours, minutes)
-            print("NATAL ZAKAT:", self.natZakat)
+            if self.sink: self.sink.emit(report.NatalZakat(self.natZakat))
         elif natal_tag == 'NAME':
             self.natName = line
 
-    def calcNatals(self):
-        if not (self.natHour and self.natVoshod and self.natZakat):
-            return
-        newline()
-        print("NATAL DATE:", self.natDate, self.natHour)
-        hours, minutes = self.natHour
+    def hourOwner(self, natHour):
+        """
+        Управитель часа рождения для времени natHour (часы, минуты) при восходе/закате карты:
+        (планета, дневное ли рождение, час 1..12, дробный час, минут от начала дня/ночи, минут в дне/ночи).
+        """
+        hours, minutes = natHour
         minsNat = hours*60 + minutes
         hours, minutes = self.natVoshod
         minsVoshod = hours*60 + minutes
         hours, minutes = self.natZakat
         minsZakat = hours*60 + minutes
 
-        import datetime
         day, month, year = self.natDate
         weekday = datetime.date(year=year, month=month, day=day).weekday()
 
         if minsNat < minsVoshod or minsNat >= minsZakat:
             # ночное рождение
-            self.isDayBirth = False
             minsTillMidnight = 24*60 - minsZakat
             minsTotal = minsTillMidnight + minsVoshod # ночь до полуночи + ночь до рассвета (всего ночных минут)
             if minsNat < minsVoshod:
@@ -114,148 +128,114 @@ class Horoscope:
             else:
                 minsNat = minsNat - minsZakat
             fHour = float(minsNat) / minsTotal * 12
-            self.natHour12 = int(fHour) + 1
-            print("NIGHT BIRTH: natal hour %d (%0.2f), %d/%d" % (self.natHour12, fHour, minsNat, minsTotal))
-            birthHourOwnerID = Config.NIGHT_HOUR_OWNER[weekday][self.natHour12 - 1]
+            hour12 = int(fHour) + 1
+            return self.rules.NIGHT_HOUR_OWNER[weekday][hour12 - 1], False, hour12, fHour, minsNat, minsTotal
         else:
             # дневное рождение
-            self.isDayBirth = True
             minsTotal = minsZakat - minsVoshod
             fHour = float(minsNat - minsVoshod) / (minsZakat - minsVoshod) * 12
-            self.natHour12 = int(fHour) + 1
-            print("DAY BIRTH: natal hour %d (%0.2f), %d/%d" % (self.natHour12, fHour, minsNat - minsVoshod, minsTotal))
-            birthHourOwnerID = Config.DAY_HOUR_OWNER[weekday][self.natHour12 - 1]
+            hour12 = int(fHour) + 1
+            return self.rules.DAY_HOUR_OWNER[weekday][hour12 - 1], True, hour12, fHour, minsNat - minsVoshod, minsTotal
+
+    def calcNatals(self):
+        if not (self.natHour and self.natVoshod and self.natZakat):
+            return
+        if self.sink:
+            self.sink.emit(report.Section())
+            self.sink.emit(report.NatalDate(self.natDate, self.natHour))
+        day, month, year = self.natDate
+        birthHourOwnerID, self.isDayBirth, self.natHour12, fHour, minsNat, minsTotal = self.hourOwner(self.natHour)
+        if self.sink: self.sink.emit(report.BirthHour(self.isDayBirth, self.natHour12, fHour, minsNat, minsTotal))
+        weekday = datetime.date(year=year, month=month, day=day).weekday()
 
         planet = self.planets.get(birthHourOwnerID) or self.planets.get(birthHourOwnerID + PLANET._RETRO)
-        planet.set_bonus(BONUS.HOUR_DOMINANT, Config.BONUS_POINTS['HOUR_DOMINANT'])
+        planet.set_bonus(BONUS.HOUR_DOMINANT, self.rules.BONUS_POINTS['HOUR_DOMINANT'])
 
         # доминант года рождения
-        planet_id = Config.get_year_dominant(year)
+        planet_id = self.rules.get_year_dominant(year)
         planet = self.planets.get(planet_id) or self.planets.get(planet_id + PLANET._RETRO)
-        planet.set_bonus(BONUS.YEAR_DOMINANT, Config.BONUS_POINTS['YEAR_DOMINANT'])
+        planet.set_bonus(BONUS.YEAR_DOMINANT, self.rules.BONUS_POINTS['YEAR_DOMINANT'])
 
         # доминант дня рождения (этого дня недели)
-        planet_id = Config.get_weekday_dominant(weekday)
+        planet_id = self.rules.get_weekday_dominant(weekday)
         planet = self.planets.get(planet_id) or self.planets.get(planet_id + PLANET._RETRO)
-        planet.set_bonus(BONUS.WEEKDAY_DOMINANT, Config.BONUS_POINTS['WEEKDAY_DOMINANT'])
+        planet.set_bonus(BONUS.WEEKDAY_DOMINANT, self.rules.BONUS_POINTS['WEEKDAY_DOMINANT'])
 
         # доминант рождения (ASC)
         self.hasASCDominant = False
         asc_pids = set()
         asc = self.planets.get(PLANET.ASC)
-        planet_roles = Config.ZNAK_ROLES[asc.znak]
+        planet_roles = self.rules.ZNAK_ROLES[asc.znak]
         for pid, role in planet_roles.items():
             if role == ROLE.DOMICILE:
                 planet = self.planets.get(pid)
                 asc_pids.add(pid)
                 if planet is not None:
-                    planet.set_bonus(BONUS.ASC_DOMINANT, Config.BONUS_POINTS['ASC_DOMINANT'])
+                    planet.set_bonus(BONUS.ASC_DOMINANT, self.rules.BONUS_POINTS['ASC_DOMINANT'])
                     self.hasASCDominant = True
-        if not self.hasASCDominant: print("(!) NOTE: Нет доминанта ASC (%s)" % str(
-            [Config.PLANET_2_NAME[pid] for pid in list(asc_pids)]))
+        if not self.hasASCDominant and self.sink: self.sink.emit(report.NoDominant(
+            PLANET.ASC, [self.rules.PLANET_2_NAME[pid] for pid in list(asc_pids)]))
 
         # доминант MC
         self.hasMCDominant = False
         mc = self.planets.get(PLANET.MC)
         mc_pids = set()
-        planet_roles = Config.ZNAK_ROLES[mc.znak]
+        planet_roles = self.rules.ZNAK_ROLES[mc.znak]
         for pid, role in planet_roles.items():
             if role == ROLE.DOMICILE:
                 mc_pids.add(pid)
                 planet = self.planets.get(pid)
                 if planet is not None:
-                    planet.set_bonus(BONUS.MC_DOMINANT, Config.BONUS_POINTS['MC_DOMINANT'])
+                    planet.set_bonus(BONUS.MC_DOMINANT, self.rules.BONUS_POINTS['MC_DOMINANT'])
                     self.hasMCDominant = True
-        if not self.hasMCDominant: print("NOTE: Нет доминанта MC (%s)" % str(
-            [Config.PLANET_2_NAME[pid] for pid in list(mc_pids)]))
+        if not self.hasMCDominant and self.sink: self.sink.emit(report.NoDominant(
+            PLANET.MC, [self.rules.PLANET_2_NAME[pid] for pid in list(mc_pids)]))
 
     def _parsePlanet(self, elems):
-        planet_ = znak_ = gradus_ = None
-        for token in elems:
-            if (planet_ is None) and Config.NAME_2_PLANET.get(token) is not None: planet_ = token
-            if (znak_ is None) and Config.NAME_2_ZNAK.get(token) is not None: znak_ = token
-            if (gradus_ is None) and hasGradus(token):
-                gradus_ = token
-        try:
-            planet, znak, gradus = Config.make_planet_args(planet_, znak_, gradus_)
-            p = Planet(planet, znak, gradus)
-            return p
-        except:
-            print(elems)
+        rec = self.rules.TOKENIZER.parseFields(elems)
+        if rec is None:
+            if self.sink: self.sink.emit(report.BadPlanet(elems))
+            return None
+        return Planet(rec.planet, rec.znak, rec.gradus)
 
     def parsePlanetRaw(self, line):
         elems = line.split()
         if (not elems) or len(elems) < 3:
             return
         if verbose2: print(elems)
-        self.parseRawChunks(elems, self._parsePlanet, self._addPlanet)
+        self.parseRawChunks(elems, self._addPlanet)
 
     def parsePlanetSpeedRaw(self, line):
         elems = line.split()
         if (not elems) or len(elems) < 3:
             return
         if verbose2: print(elems)
-        self.parseRawChunks(elems, self._doParsePlanetSpeed, None)
+        self.parseRawChunks(elems, self._addPlanetSpeed)
 
     def parsePlanetTransitRaw(self, line):
         elems = line.split()
         if (not elems) or len(elems) < 3:
             return
         if verbose2: print(elems)
-        self.parseRawChunks(elems, self._parsePlanet, self._addPlanetTransit)
-
-    def parseRawChunks(self, elems, parseChunksCallback, addPlanetCallback):
-        chunk = []
-        isPlanetChunk = False
-        PLANET_NAME_IDX = 0  # we always start chunk with a planet name
-        for i, token in enumerate(elems):
-            if Config.NAME_2_PLANET.get(token):
-                # нашли планету!
-                if isPlanetChunk:
-                    # в нашем чанке уже есть имя планеты (и мы нашли следующее) -> обрабатываем чанк
-                    if verbose2: print("parse complete chunk:", chunk)
-                    p = parseChunksCallback(chunk)
-                    if (p is not None) and addPlanetCallback is not None:
-                        addPlanetCallback(p)
-                    # reset chunk (to include just the current "planet-name" token)
-                    chunk = [token]
-                    isPlanetChunk = True
-                else:
-                    # начинаем накапливать чанки, начиная с планеты
-                    chunk.append(token)
-                    isPlanetChunk = True
-                    if verbose2: print("start new chunk:", token)
-            else:
-                if isPlanetChunk:
-                    # продолжаем накапливать чанки
-                    if verbose: print("add chunk", token)
-                    chunk.append(token)
-                    if token in ("R", "D"):
-                        # и кстати, если нашли признак директности или ретроградности - это относится к имени планеты
-                        if not chunk[PLANET_NAME_IDX].endswith(token):
-                            chunk[PLANET_NAME_IDX] += "-" + token
-                            if verbose2: print("add planet suffix:", chunk[PLANET_NAME_IDX])
-                else:
-                    # просто скипаем чанки, пока не найдем планету
-                    if verbose2: print("skip chunk", token)
+        self.parseRawChunks(elems, self._addPlanetTransit, strip_parens=True)  # в строке транзитов масса скобок
+
+    def parseRawChunks(self, elems, addPlanetCallback, strip_parens=False):
+        # чанк = имя планеты + все токены до следующего имени планеты (см. AliasTokenizer.records)
+        for rec in self.rules.TOKENIZER.records(elems, strip_parens, self._badChunk):
+            addPlanetCallback(Planet(rec.planet, rec.znak, rec.gradus))
 
-        if chunk and isPlanetChunk:
-            # дошли до конца, и в нашем чанке есть имя планеты -> обрабатываем чанк
-            if verbose2: print("parse final chunk:", chunk)
-            p = parseChunksCallback(chunk)
-            if (p is not None) and addPlanetCallback is not None:
-                addPlanetCallback(p)
+    def _badChunk(self, planet_token):
+        if self.sink: self.sink.emit(report.BadChunk(planet_token))
 
     def _addPlanet(self, p):
-        print("PARSED:", p)
+        if self.sink: self.sink.emit(report.Parsed(p))
         self.planets[p.planet] = p
 
     def _addPlanetTransit(self, p):
         natal_planet = self.planets.get(p.planet) or self.planets.get(p.planet ^ PLANET._RETRO)
-        header = "PARSED TRANSIT:"
-        if natal_planet and abs(natal_planet.abs_gradus - p.abs_gradus) < 0.0001:
-            header = "// PARSED TRANSIT (natal):"
-        print(header, p, natal_planet)
+        if self.sink:
+            is_natal = bool(natal_planet and abs(natal_planet.abs_gradus - p.abs_gradus) < 0.0001)
+            self.sink.emit(report.ParsedTransit(p, natal_planet, is_natal))
         # в строке транзитов планеты дублируются (натал - транзит) => skip 1st parsed transit, store 2nd
         if not self._transit_planet_found.get(natal_planet.planet):
             self._transit_planet_found[natal_planet.planet] = True
@@ -270,7 +250,7 @@ class Horoscope:
         p = self._parsePlanet(elems)
         if p is None:
             return
-        print("PARSED:", p)
+        if self.sink: self.sink.emit(report.Parsed(p))
         self.planets[p.planet] = p
 
     def parsePlanetSpeed(self, line):
@@ -278,166 +258,106 @@ class Horoscope:
         if (not elems) or len(elems) < 3:
             return
         if verbose: print(elems)
-        self._doParsePlanetSpeed(elems)
-
-    def _doParsePlanetSpeed(self, elems):
         prev = self._parsePlanet(elems)
-        if prev is None:
-            return
+        if prev is not None:
+            self._addPlanetSpeed(prev)
+
+    def _addPlanetSpeed(self, prev):
         if verbose: print("PREV:", prev)
         p = self.planets.get(prev.planet) or self.planets.get(prev.planet ^ PLANET._RETRO)
+        if p is None:
+            return  # натальное положение не разобрано (BadPlanet уже выдан) - скорость не с чем сравнить
 
         # скорость за день (сравниваем со средней угловой скоростью, табличной)
         pnr = p.get_non_retro()
         p.prev_gradus = prev.gradus
         p.day_speed = abs(p.abs_gradus - prev.abs_gradus)
-        avg_spd = Config.AVG_SPD.get(pnr)
+        avg_spd = self.rules.AVG_SPD.get(pnr)
         speedStr = '-'
         if avg_spd is not None:
             if p.day_speed < avg_spd:
-                p.set_bonus(BONUS.SPEED, Config.BONUS_POINTS['SLOW_SPEED'])
+                p.set_bonus(BONUS.SPEED, self.rules.BONUS_POINTS['SLOW_SPEED'])
             else:
-                p.set_bonus(BONUS.SPEED, Config.BONUS_POINTS['FAST_SPEED'])
+                p.set_bonus(BONUS.SPEED, self.rules.BONUS_POINTS['FAST_SPEED'])
 
-        print("day SPEED: %s (%s) avg:%s %s %s" % (formatOrb(p.day_speed), speedStr,
-                                                   formatOrb(avg_spd or 0), p, prev))
+        if self.sink: self.sink.emit(report.DaySpeed(p, prev, avg_spd, speedStr))
 
     def calcTransitHouses(self):
-        planets = [planet for pid, planet in self.transits.items() if pid not in PLANET._KUSPIDS]
-        for house_id in PLANET._KUSPIDS:
-            next_id = house_id + 1 if house_id + 1 <= PLANET._HOUSE_LAST else PLANET._HOUSE_FIRST
-            house, next = self.planets[house_id], self.planets[next_id]
-            house.size = size = orb(house.abs_gradus, next.abs_gradus)
-
-            # для всех еще не посчитанных планет:
-            for planet in planets[:]:
-                # учитываем, что градусы зациклены, так что проще посмотреть орбы от начала и конца дома
-                start_orb = orb(planet.abs_gradus, house.abs_gradus)
-                end_orb = orb(planet.abs_gradus, next.abs_gradus)
-                if start_orb < size and end_orb < size:
-                    # номер дома
-                    planet.house = house_id - PLANET._HOUSE_BASE  # 1..12
-                    planet.house_gradus = start_orb
-
-                    # ок, посчитали дом => удаляем из непосчитанных
-                    planets.remove(planet)
+        cusps = HouseCusps.fromPlanets(self.planets)
+        for n, house_id in enumerate(PLANET._KUSPIDS):
+            self.planets[house_id].size = cusps.sizes[n]
+        for pid, planet in self.transits.items():
+            if pid in PLANET._KUSPIDS:
+                continue
+            house, start_orb, end_orb = cusps.place(planet.abs_gradus)
+            if house is not None:
+                planet.house = house  # 1..12
+                planet.house_gradus = start_orb
 
     def calcHouses(self):
-        newline()
+        if self.sink: self.sink.emit(report.Section())
         mc = self.planets.get(PLANET.MC)
         self.closestToMC = (PLANET._NONE, FULL_ARC)
         planets = [planet for pid, planet in self.planets.items() if pid not in PLANET._KUSPIDS]
         if verbose: print('planets at start:', [str(planet) for planet in planets])
-        for house_id in PLANET._KUSPIDS:
+
+        # дом каждой планеты - бинарным поиском по куспидам (см. houses.py), печать и бонусы - по порядку домов
+        cusps = HouseCusps.fromPlanets(self.planets)
+        house_planets = [[] for house_id in PLANET._KUSPIDS]
+        for planet in planets:
+            house, start_orb, end_orb = cusps.place(planet.abs_gradus)
+            if house is not None:
+                house_planets[house - 1].append((planet, start_orb, end_orb))
+
+        for n, house_id in enumerate(PLANET._KUSPIDS):
             next_id = house_id + 1 if house_id + 1 <= PLANET._HOUSE_LAST else PLANET._HOUSE_FIRST
             house, next = self.planets[house_id], self.planets[next_id]
-            house.size = size = orb(house.abs_gradus, next.abs_gradus)
+            house.size = size = cusps.sizes[n]
             if verbose: print("house SIZE:", house.size, house, next)
 
-            # для всех еще не посчитанных планет:
-            for planet in planets[:]:
-                # учитываем, что градусы зациклены, так что проще посмотреть орбы от начала и конца дома
-                start_orb = orb(planet.abs_gradus, house.abs_gradus)
-                end_orb = orb(planet.abs_gradus, next.abs_gradus)
-                if start_orb < size and end_orb < size:
-                    # номер дома
-                    planet.house = house_id - PLANET._HOUSE_BASE  # 1..12
-
-                    # в какой трети дома
-                    if start_orb < size/3:
-                        planet.third = 1  # ближе к началу дома
-                    elif end_orb < size/3:
-                        planet.third = 3  # ближе к концу дома
-                    else:
-                        planet.third = 2  # посерединке
-
-                    # баллы за дом/треть
-                    planet_house3_points = Config.HOUSE_THIRD_POINTS.get(planet.planet)
-                    if planet_house3_points is not None:
-                        points = planet_house3_points[planet.house][planet.third-1]
-                        planet.set_bonus(BONUS.HOUSE_THIRD, points)
-
-                    # баллы за знак/градус
-                    planet_gradus_points = Config.PLANET_GRADUS_BONUSES.get(planet.planet, {}).get(planet.znak)
-                    if planet_gradus_points is not None:
-                        points = planet_gradus_points[int(planet.gradus)]
-                        planet.set_bonus(BONUS.PLANET_GRADUS, points)
-
-                    # доп.баллы за термы
-                    pnr = planet.get_non_retro()
-                    planet_termy_points = Config.BONUS_TERMY.get(pnr)
-                    if planet_termy_points is not None:
-                        gradus1, gradus2, bonus_points = planet_termy_points[planet.znak]
-                        if gradus1 <= planet.abs_gradus < gradus2:
-                            planet.set_bonus(BONUS.TERMY, bonus_points)
-
-                    # в "своем" поле/доме (например, Марс в I доме, а считая от равноденствия I дом = Овен, "свой" дом)
-                    house_znak = planet.house - 1
-                    role = Config.ZNAK_ROLES[house_znak].get(planet.planet, -1)
-                    if role == ROLE.DOMICILE:
-                        planet.set_bonus(BONUS.OWN_HOUSE, Config.BONUS_POINTS['OWN_HOUSE'])
-
-                    # в своем градусе (из таблицы управителей градусов по Вронскому)
-                    if planet.is_own_gradus_dominant():
-                        planet.set_bonus(BONUS.OWN_GRADUS, Config.BONUS_POINTS['OWN_GRADUS'])
-
-                    # ищем ближайшую планету к MC
-                    if mc and (planet.house in (9,10)) and (pnr in PLANET._REAL_PLANETS):
-                        range = orb(planet.abs_gradus, mc.abs_gradus)
-                        if range < self.closestToMC[1]:
-                            self.closestToMC = (planet.planet, range)
-
-                    # в ретрограде
-                    if planet.planet & PLANET._RETRO:
-                        planet.set_bonus(BONUS.RETRO, Config.BONUS_POINTS['RETRO'])
-
-                    # в каком типе знака (кардинальный, фиксированный, мутабельный) - там свои бонусы по отдельным дугам
-                    znak_bonus_type = Planet.get_znak_bonus_type(planet.znak)
-                    if planet.has_znak_bonus():
-                        planet.set_bonus(znak_bonus_type, Config.BONUS_POINTS['CARD_ZNAK_BONUS'])
-
-                    # особые диапазоны градусов (в Тельце, Льве, Деве, комбуста..)
-                    for bonus_key, (gradus1, gradus2) in Config.BONUS_GRADUS.items():
-                        if gradus1 <= planet.abs_gradus <= gradus2:
-                            bonus_type = getattr(BONUS, bonus_key)
-                            planet.set_bonus(bonus_type, Config.BONUS_POINTS[bonus_key])
-
-                    planet_attrs = Config.PLANET_ATTRS.get(pnr)
-                    if planet_attrs:
-                        if (planet_attrs.stihia >= 0) and (planet_attrs.stihia == ZNAK._stihia(planet.znak)):
-                            # в знаке своей стихии (огонь, вода и т.п.)
-                            planet.set_bonus(BONUS.STIHIA, Config.BONUS_POINTS['OWN_STIHIA'])
-
-                        if (planet_attrs.gender >= 0):
-                            if (planet_attrs.gender == ZNAK._gender(planet.znak)):
-                                # в знаке своего пола
-                                planet.set_bonus(BONUS.GENDER, Config.BONUS_POINTS['OWN_GENDER'])
-                            else:
-                                # в знаке противоположного пола
-                                planet.set_bonus(BONUS.GENDER, Config.BONUS_POINTS['WRONG_GENDER'])
-
-                        # в своем градусе экзальтации ("королевском градусе")
-                        if planet_attrs.exalt_gradus != BAD_GRADUS:
-                            eg = planet_attrs.exalt_gradus
-                            if eg <= planet.abs_gradus < eg+1:
-                                planet.set_bonus(BONUS.EXALT_GRADUS, Config.BONUS_POINTS['EXALT_GRADUS'])
+            for planet, start_orb, end_orb in house_planets[n]:
+                # номер дома
+                planet.house = n + 1  # 1..12
 
-                    # в своем домициле/экзальте/эксиле/фалле
-                    roleStr = ''
-                    role = Config.ZNAK_ROLES[planet.znak].get(planet.planet)
-                    if role is not None:
-                        role_key = ROLE_KEYS[role]  # 'DOMICILE'
-                        bonus_points = Config.BONUS_POINTS.get(role_key)
-                        if bonus_points:
-                            bonus_type = getattr(BONUS, role_key)
-                            planet.set_bonus(bonus_type, bonus_points)
-                            roleStr = "{%s}" % planet.get_bonus_str(BONUS._HOUSE_ROLES)[:-1]
+                # в какой трети дома
+                planet.third = cusps.third(planet.house, start_orb, end_orb)
+
+                pi = dense.planetIndex(planet.planet)  # индекс в плотных таблицах rules (см. dense.py)
 
-                    print("THIRD: %s %d/3 size=%0.2f/3=%0.2f orb=%0.2f %s %s" % (
-                        planet, planet.third, size, size/3, start_orb, house, roleStr))
+                # баллы за дом/треть
+                if pi >= 0 and self.rules.HAS_HOUSE_THIRD[pi]:
+                    points = self.rules.HOUSE_THIRD_MATRIX[
+                        (pi * dense.HOUSE_COUNT + planet.house - 1) * dense.THIRD_COUNT + planet.third - 1]
+                    planet.set_bonus(BONUS.HOUSE_THIRD, points)
 
-                    planets.remove(planet)  # ок, посчитали => удаляем из непосчитанных
-                    if verbose: print('planets left:', [str(planet) for planet in planets])
+                # позиционные бонусы (зависят только от планеты и долготы) - готовым набором из атласа
+                pre, post = atlasBonuses(self.rules, planet)
+                for bonus_type, points in pre:
+                    planet.set_bonus(bonus_type, points)
+
+                # в "своем" поле/доме (например, Марс в I доме, а считая от равноденствия I дом = Овен, "свой" дом)
+                house_znak = planet.house - 1
+                role = self.rules.ROLE_MATRIX[house_znak * dense.PLANET_COUNT + pi] if pi >= 0 else ROLE._NONE
+                if role == ROLE.DOMICILE:
+                    planet.set_bonus(BONUS.OWN_HOUSE, self.rules.BONUS_POINTS['OWN_HOUSE'])
+
+                # свой градус, ретро, дуги знака, BONUS_GRADUS, стихия/пол, экзальтация, роли в знаке
+                for bonus_type, points in post:
+                    planet.set_bonus(bonus_type, points)
+
+                # ищем ближайшую планету к MC
+                pnr = planet.get_non_retro()
+                if mc and (planet.house in (9,10)) and (pnr in PLANET._REAL_PLANETS):
+                    range = orb(planet.abs_gradus, mc.abs_gradus)
+                    if range < self.closestToMC[1]:
+                        self.closestToMC = (planet.planet, range)
+
+                if self.sink:
+                    # в своем домициле/экзальте/эксиле/фалле
+                    roleStr = ''
+                    if any(bonus_type in BONUS._HOUSE_ROLES for bonus_type, points in post):
+                        roleStr = "{%s}" % planet.get_bonus_str(BONUS._HOUSE_ROLES)[:-1]
+                    self.sink.emit(report.HouseThird(planet, size, start_orb, house, roleStr))
 
         # есть ли у нас победитель в конкурсе "кто ближе всех к MC"?
         winner, actual_orbis = self.closestToMC
@@ -445,96 +365,82 @@ class Horoscope:
             winner_planet = self.planets.get(winner)
             self.checkAspectBonus(winner_planet, mc, ASPECT._CLOSEST_MC, actual_orbis)
 
-    def findAspects(self, planets1, planets2, addAspectBonuses=True, header='ASPECT: ', orbis_override=None):
-        aspects = []
+    def findAspects(self, planets1, planets2, addAspectBonuses=True, header='ASPECT: ', orbis_override=None,
+                    method=None):
+        method = self.aspectMethod if method is None else method
+        if method == ASPECT_METHOD.MATRIX:
+            aspects = matrixAspects(self.rules, planets1, planets2, orbis_override)
+        elif method == ASPECT_METHOD.SWEEP:
+            aspects = sweepAspects(self.rules, planets1, planets2, orbis_override)
+        else:
+            aspects = self.loopAspects(planets1, planets2, orbis_override)
+
+        sink = self.sink
         last_planet = None
+        for p1, p2, aspect, arc, actual_orbis, orbis in aspects:
+            if sink:
+                if p1 != last_planet: sink.emit(report.Section())
+                sink.emit(report.Aspect(header, p1, p2, aspect, arc, actual_orbis, orbis, self.rules))
+                last_planet = p1
+            self.checkAspectBonus(p1, p2, aspect, actual_orbis)
+        return aspects
+
+    def loopAspects(self, planets1, planets2, orbis_override=None):
+        aspects = []
         for p1 in planets1:
             for p2 in planets2:
                 arc = p1.orb(p2)
-                p1nr, p2nr = p1.get_non_retro(), p2.get_non_retro()
                 if orbis_override:
                     table_orbis = orbis_override
                 else:
-                    ORBS = Config.MAJOR_ORBS
-                    table_orbis = ORBS.get(p1nr, {}).get(p2nr, None) or ORBS.get(p2nr, {}).get(p1nr, None)
-                isKuspid1 = p1nr in PLANET._KUSPIDS
-                isKuspid2 = p2nr in PLANET._KUSPIDS
-                if (table_orbis is None) and (isKuspid1 or isKuspid2) and not(isKuspid1 and isKuspid2):
-                    # Only one of the actors is house kuspid (but not both):
-                    table_orbis = LESSER_KUSPID_ORBIS
+                    # орбис пары из плотной матрицы (куспиды там уже учтены, см. dense.tableOrbis)
+                    i, j = dense.planetIndex(p1.planet), dense.planetIndex(p2.planet)
+                    if i >= 0 and j >= 0:
+                        table_orbis = self.rules.ORBIS_MATRIX[i * dense.PLANET_COUNT + j]
+                        if table_orbis == dense.NO_ORBIS:
+                            table_orbis = None
+                    else:
+                        table_orbis = dense.tableOrbis(self.rules.MAJOR_ORBS, p1.get_non_retro(), p2.get_non_retro())
                 if table_orbis is None:
                     if verbose: print("--- BAD orbis:", p1, p2, table_orbis)
                     continue
                 for aspect in ASPECT_VALUES:
-                    aname = Config.ASPECT_2_NAME[aspect]
                     # minor aspects are 3.0 for planets (but could be less for kuspids etc.)
                     orbis = table_orbis if aspect not in ASPECT._MINORS else min(table_orbis, MINOR_ASPECT_ORBIS)
                     actual_orbis = abs(arc - aspect)
                     if actual_orbis < orbis:
                         aspects.append((p1, p2, aspect, arc, actual_orbis, orbis))
-                        if p1 != last_planet: newline()
-                        print("%s%s %s %s (%d %0.3f %0.1f)  %s" % (
-                            header, p1.name(), aname, p2.name(),
-                            aspect, arc, orbis, formatOrb(actual_orbis, minutes_only=True))
-                        )
-                        last_planet = p1
-                        self.checkAspectBonus(p1, p2, aspect, actual_orbis)
         return aspects
 
     def checkAspectBonus(self, p1, p2, aspect, actual_orbis):
-        for bonus in Config.BONUS_ASPECTS:
-            if ((aspect == bonus.aspect) and (p2.planet in bonus.to_planets) and (p1.planet in bonus.planet_mask)):
+        # только правила для этого аспекта и этой цели (см. dense.aspectBonusIndex)
+        entries = self.rules.ASPECT_BONUS_INDEX.get((aspect, p2.planet))
+        if not entries:
+            return
+        i = dense.planetIndex(p1.planet)
+        bit = (1 << i) if i >= 0 else 0
+        for bits, bonus in entries:
+            if bits & bit:
                 if ((bonus.from_orbis < 0) or (bonus.from_orbis <= actual_orbis <= bonus.to_orbis)):
                     if verbose:print("ASPECT BONUS:", bonus.bonus_type, bonus.bonus_points, p1, p2,
                                      bonus.from_orbis, actual_orbis, bonus.to_orbis)
                     p1.set_bonus(bonus.bonus_type, bonus.bonus_points)
 
-    def rateAspects(self, aspects, scaleAspectRating=0.0, header="", topCount=30, noDuplicates=True, noKuspids=False):
-        maxAspectRating = scaleAspectRating
-        aspectRating = []
-        for p1, p2, aspect, arc, actual_orbis, max_orbis in aspects:
-            # p1 could be transit => bonuses must be taken from main self.planets[]
-            natal_p1 = self.planets.get(p1.planet) or self.planets.get(p1.planet ^ PLANET._RETRO)
-            p1b = natal_p1.sum_bonuses()
-            p2b = p2.sum_bonuses()
-            if noDuplicates and ((p2b > p1b) or (p1b == p2b and p1.get_non_retro() > p2.get_non_retro())):
-                if verbose: print("(!) REMOVE DUPLICATE:", p1, p1b, aspect, p2, p2b)
-                continue  # все аспекты в списке по 2 раза, исключаем дубликаты; оставляем вариант сила1 >= сила2
-            # для вторичных куспидов (кроме ASC и MC) оставляем только соединения (~вход в новый дом)
-            if noKuspids and (p2.planet in PLANET._SECONDARY_KUSPIDS) and (aspect != ASPECT.CON):
-                if verbose: print("(!) REMOVE KUSPID:", p1, aspect, p2)
-                continue
-            w_aspect = Config.ASPECT_WEIGHT.get(aspect, 0)
-            p1w = Config.PLANET_WEIGHT.get(p1.get_non_retro())
-            p2w = Config.PLANET_WEIGHT.get(p2.get_non_retro())
-            AC = Config.ASPECT_COEFFS
-            p_add, ps_deg = AC.get('ADD_PLANET_BALL'), AC.get('PLANET_SUM_DEGREE')
-            mult = AC.get('ASPECT_EXACTNESS_EXP_DEGREE_MULT')
-            if not p1w or not p2w or not w_aspect:
-                if verbose: print("(!) REMOVE:", p1, p1w, aspect, p2, p2w, w_aspect)
-                continue
-            ps = pow((abs(p1b) + p_add) * (abs(p2b) + p_add), ps_deg)
-            r = abs(actual_orbis) / max_orbis
-            ow = math.exp(mult * r)
-            cw = math.sqrt(p1w * p2w)
-            rating = w_aspect * ps * ow * cw
-            maxAspectRating = max(maxAspectRating, rating)
-            aspectRating.append((rating, p1.name(), p2.name(), (p1b, p2b), cw, aspect, (actual_orbis, max_orbis)))
-
-        aspectRating = sorted(aspectRating, reverse=True)
+    def rateAspects(self, aspects, scaleAspectRating=0.0, header="", topCount=RATING_TOP_COUNT, noDuplicates=True,
+                    noKuspids=False, keepAll=False):
+        # рейтинги массивами (см. rating.py): только top-K строк (частичный выбор), keepAll=True - все строки
+        rated = rateAspectArrays(self.rules, self.planets, aspects, noDuplicates, noKuspids)
+        maxAspectRating = rated.maxRating(scaleAspectRating)
+        aspectRating = rated.rows(self.rules, None if keepAll else topCount)
+
         if scaleAspectRating < 0.001:
             scaleAspectRating = maxAspectRating
-        print("-------------\nTOP-%d %s ASPECTS (max %0.3f, defMax %0.3f):" % (
-            topCount, header, maxAspectRating, scaleAspectRating))
-        for i, (rating, p1name, p2name, (p1b, p2b), cw, aspect, (orb, max_orb)) in enumerate(aspectRating[:topCount]):
-            print("[%0.1f] %s%s(%s) %s %s(%s)  %s" % (
-                rating/scaleAspectRating*10, header, p1name, signed(p1b), Config.ASPECT_2_NAME[aspect],
-                p2name, signed(p2b), formatOrb(orb, minutes_only=True)
-            ))
+        if self.sink: self.sink.emit(report.AspectRating(
+            header, topCount, maxAspectRating, scaleAspectRating, aspectRating, self.rules))
         return aspectRating, maxAspectRating
 
     def exportFile(self, output_file):
-        output_file.write("%s\n" % self.natName or "???")
+        output_file.write("%s\n" % (self.natName or "???"))
         day, month, year = self.natDate
         hours, minutes = self.natHour
         output_file.write("%s %02d.%02d.%d %02d:%02d\n" % (NATAL.DATE_TIME, day, month, year, hours, minutes))
@@ -545,8 +451,8 @@ class Horoscope:
 
         # current positions (planets & houses)
         for pid, p in self.planets.items():
-            znak = Config.ZNAK_2_NAME[p.znak]
-            outputStr = "%s  %s  %s\n" % (p.name(), znak, formatOrb(p.gradus))
+            znak = self.rules.ZNAK_2_NAME[p.znak]
+            outputStr = "%s  %s  %s\n" % (p.name(self.rules), znak, formatOrb(p.gradus))
             if pid == PLANET.ASC: output_file.write("\n")
             output_file.write(outputStr)
         output_file.write("\n")
@@ -555,64 +461,43 @@ class Horoscope:
         for pid, p in self.planets.items():
             if PLANET._HOUSE_FIRST <= pid <= PLANET._HOUSE_LAST:
                 continue
-            znak = Config.ZNAK_2_NAME[p.znak]
-            outputStr = "PREV  %s  %s  %s\n" % (p.name(), znak, formatOrb(p.prev_gradus))
+            znak = self.rules.ZNAK_2_NAME[p.znak]
+            outputStr = "PREV  %s  %s  %s\n" % (p.name(self.rules), znak, formatOrb(p.prev_gradus))
             output_file.write(outputStr)
 
     def parseTransitFile(self, input_filename):
+        with open(input_filename, "rt", encoding='utf8') as transit_file:
+            self.parseTransits(transit_file)
+
+    def parseTransits(self, transit_file):
+        # транзиты часто записаны одной гигантской строкой => читаем потоком, порциями фиксированного размера
         self._transit_planet_found = {}
-        with open(input_filename, "rt", encoding='utf8') as horoscope_file:
-            for line in horoscope_file:
-                hor.parseTransitRaw(line)
+        tokens = iterTokens(transit_file)
+        for rec in self.rules.TOKENIZER.records(tokens, strip_parens=True, on_bad_chunk=self._badChunk):
+            self._addPlanetTransit(Planet(rec.planet, rec.znak, rec.gradus))
 
     def printoutPlanets(self, include_bonuses=INCLUDE_BONUSES.ALL):
-        "Уран; Рыбы 4*39';	II;	3/3; FAST; 2"
-        print("--- PLANETS: ---")
-        for pid, p in self.planets.items():
-            roleBonus = p.get_bonus_str(BONUS._HOUSE_ROLES)
-            roleStr = "{%s}" % roleBonus[:-1] if roleBonus else ''
-
-            znak = Config.ZNAK_2_NAME[p.znak]
-            znakStr = "%s %s %s" % (znak, formatOrb(p.gradus), roleStr)
-
-            house = toRoman(p.house) if p.house else '-'
-            houseStr = "%3s/%s" % (house, p.third or '-')
-
-            speedBonus = p.get_bonus(BONUS.SPEED) or 0
-            speedStr = "-" if not speedBonus else "FAST" if speedBonus > 0 else "SLOW"
-
-            if include_bonuses == INCLUDE_BONUSES.ASC_INDEPENDENT_ONLY:
-                bonus_types = INCLUDE_BONUSES.ASC_INDEPENDENT_ONLY
-                houseStr = '-'
-            else:
-                bonus_types = None
-            allBonuses = p.get_bonus_str(bonus_types)
-            bonusSumStr = signed(p.sum_bonuses(bonus_types))
-
-            outputStr = "%3s %-10s %-30s %6s" % (bonusSumStr, p.name(), znakStr, houseStr)
-
-            if include_bonuses != INCLUDE_BONUSES.NONE:
-                outputStr += '   # %s ' % allBonuses
-            #if include_bonuses == INCLUDE_BONUSES.ASC_INDEPENDENT_ONLY:
-            #    outputStr = '[!ASC] ' + outputStr
-            print(outputStr)
+        if self.sink: self.sink.emit(report.PlanetsTable(self.planets, include_bonuses, self.rules))
 
     def printoutTransitPlanets(self):
-        print("--- TRANSIT PLANETS: ---")
-        for pid, p in self.transits.items():
-            natal_p = self.planets.get(pid) or self.planets.get(pid ^ PLANET._RETRO)
-
-            znak = Config.ZNAK_2_NAME[p.znak]
-            znakStr = "%s %s" % (znak, formatOrb(p.gradus))
-
-            house = toRoman(p.house) if p.house else '-'
-            bonusSumStr = signed(natal_p.sum_bonuses())
-
-            outputStr = "(T)%s(%s) -- %s, %s дом (%d°)" % (p.name(), bonusSumStr, znakStr, house, int(p.house_gradus))
-            print(outputStr)
-
-    def runTransits(hor, input_filename):
-        hor.parseTransitFile(TRANSIT_FILENAME)
+        if self.sink: self.sink.emit(report.TransitPlanetsTable(self.transits, self.planets, self.rules))
+
+    def parseLines(self, lines, import_raw=False):
+        # import_raw - сырой формат (geocult), иначе - форматированный файл
+        parse = self.parseRaw if import_raw else self.parseLine
+        for line in lines:
+            parse(line)
+
+    def calculate(self, topCount=RATING_TOP_COUNT, keepAll=False):
+        self.calcHouses()
+        self.aspects = self.findAspects(self.planets.values(), self.planets.values())
+        self.calcNatals()
+        self.aspectRating, self.maxAspectRating = self.rateAspects(self.aspects, topCount=topCount, keepAll=keepAll)
+        self.ratingTop = None if keepAll else topCount
+        self.calcNatals()
+
+    def runTransits(hor, input_filename, topCount=TRANSIT_TOP_COUNT, keepAll=False):
+        hor.parseTransitFile(input_filename)
         hor.calcTransitHouses()
         hor.transitAspects = hor.findAspects(
             hor.transits.values(), hor.planets.values(),
@@ -620,31 +505,58 @@ class Horoscope:
         )
         hor.printoutTransitPlanets()
         hor.trAspectRating, hor.maxTrAspectRating = hor.rateAspects(
-            hor.transitAspects, hor.maxAspectRating, header="(T)", topCount=100, noDuplicates=False, noKuspids=True)
+            hor.transitAspects, hor.maxAspectRating, header="(T)", topCount=topCount, noDuplicates=False,
+            noKuspids=True, keepAll=keepAll)
+
+
+def initConfig():
+    config.load()
+
+
+def calcHoroscope(lines, import_raw=False, rules=None, sink=report.CONSOLE, topCount=RATING_TOP_COUNT,
+                  keepAll=False):
+    """Карта из строк (текст запроса и т.п.): разбор и все этапы расчета, без итоговой таблицы и экспорта."""
+    hor = Horoscope(rules, sink)
+    hor.parseLines(lines, import_raw)
+    hor.calculate(topCount, keepAll)
+    return hor
+
+
+def _ratingCovers(ratingTop, topCount, keepAll):
+    """Хватает ли строк рейтинга, сохраненных с ratingTop (None - все), для topCount/keepAll."""
+    return ratingTop is None or (not keepAll and topCount <= ratingTop)
 
 
-def runHoroscope(input_filename, incl_bonuses=0, import_raw=False):
-    hor = Horoscope()
+def runHoroscope(input_filename, incl_bonuses=0, import_raw=False, export=True, rules=None, sink=report.CONSOLE,
+                 cache=None, topCount=RATING_TOP_COUNT, keepAll=False):
+    """
+    Расчет карты из файла; события расчета и отчет - в sink (report.CONSOLE - консоль, None - тихо).
+    cache - cache.ChartCache: карта с тем же содержимым и теми же таблицами берется готовой (в sink - только итог).
+    aspectRating - top topCount строк рейтинга, keepAll=True - все строки (нужны export.py).
+    """
+    hor = Horoscope(rules, sink)
+    key = None
+    if cache is not None:
+        with open(input_filename, "rb") as horoscope_file:
+            key = cache.key(horoscope_file.read(), hor.rules, import_raw)
+        state = cache.get(key)
+        if state is not None and _ratingCovers(state.get('ratingTop', RATING_TOP_COUNT), topCount, keepAll):
+            vars(hor).update(state)
+            return _finishHoroscope(hor, input_filename, incl_bonuses, import_raw, export)
 
-    if import_raw:
-        with open(input_filename, "rt", encoding='utf8') as horoscope_file:
-            for line in horoscope_file:
-                hor.parseRaw(line)
+    with open(input_filename, "rt", encoding='utf8') as horoscope_file:
+        hor.parseLines(horoscope_file, import_raw)
+    hor.calculate(topCount, keepAll)
 
-    else: # parse preformatted file
-        with open(input_filename, "rt", encoding='utf8') as horoscope_file:
-            for line in horoscope_file:
-                hor.parseLine(line)
+    if cache is not None:
+        cache.put(key, hor)
+    return _finishHoroscope(hor, input_filename, incl_bonuses, import_raw, export)
 
-    hor.calcHouses()
-    hor.aspects = hor.findAspects(hor.planets.values(), hor.planets.values())
-    hor.calcNatals()
-    hor.aspectRating, hor.maxAspectRating = hor.rateAspects(hor.aspects)
-    hor.calcNatals()
 
+def _finishHoroscope(hor, input_filename, incl_bonuses, import_raw, export):
     hor.printoutPlanets(incl_bonuses)
 
-    if import_raw:
+    if import_raw and export:
         output_filename = input_filename.split('.')[0] + '.EXP.txt'
         with open(output_filename, "wt", encoding='utf8') as output_file:
             hor.exportFile(output_file)
@@ -653,10 +565,9 @@ def runHoroscope(input_filename, incl_bonuses=0, import_raw=False):
 
 
 if __name__ == '__main__':
-    config.init()
+    initConfig()
 
     cfg = Config()
-    cfg.readAliases(config.ALIAS_CFG)
     if verbose:
         print(f"NAME_2_PLANET: '{Config.NAME_2_PLANET}'")
         print(f"NAME_2_ZNAK: '{Config.NAME_2_ZNAK}'")
@@ -664,7 +575,6 @@ if __name__ == '__main__':
         print('NATAL_TAGS:', NATAL_TAGS)
         pretty(Config.PLANET_ATTRS)
 
-    cfg.readAspectOrbises(config.VRONSKY_CFG)
     #print("MAJOR ORBISES:")
     #pretty(cfg.MAJOR_ORBS)
     if verbose: